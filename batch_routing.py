@@ -0,0 +1,163 @@
+"""
+Batch routing across a process pool.
+
+Origin/destination pairs are split into chunks and routed by worker
+processes, each of which loads the network snapshot once when it starts.
+Results come back one JSON line per pair in completion order; a pair that
+fails gets an error line instead of failing the batch.
+"""
+
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Optional
+
+import route_finder
+from scoring import score_route
+
+# Pairs sent to a worker per task; larger chunks cut IPC overhead, smaller
+# ones stream the first results sooner.
+BATCH_CHUNK_SIZE = 16
+
+# Upper bound on pairs per request
+MAX_BATCH_PAIRS = 10000
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker():
+    """Preload the network snapshot in a fresh worker process."""
+    route_finder._snapshot()
+
+
+def _get_executor() -> Executor:
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = int(os.getenv("BATCH_WORKERS", "0")) or os.cpu_count() or 1
+                # Forking a threaded server can copy a lock another thread
+                # holds (e.g. the network watcher's build lock) into the
+                # worker, which then deadlocks on it; spawn starts clean
+                _executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown():
+    """Stop the worker pool (it is recreated on the next batch)."""
+    global _executor
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def _discard(executor: Executor):
+    """
+    Drop a broken pool so the next batch starts a fresh one. Another batch
+    may already have replaced it; that newer pool is left alone.
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def route_pair(pair: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Route one pair; errors are reported in the result instead of raised."""
+    result = {"index": pair["index"], "id": pair.get("id"), "origin": pair.get("origin"),
+              "destination": pair.get("destination")}
+    try:
+        for field in ("origin", "destination"):
+            if not route_finder._find_station(pair.get(field) or ""):
+                raise ValueError(f"station not found: {pair.get(field)!r}")
+        for station in pair.get("via") or []:
+            if not route_finder._find_station(station):
+                raise ValueError(f"station not found: {station!r}")
+
+        routes = route_finder.find_routes(
+            pair["origin"], pair["destination"],
+            date=options.get("date"), time=options.get("time"),
+            time_type=options.get("time_type", "departure"),
+            max_routes=options.get("max_routes", 5),
+            via=pair.get("via") or None,
+            search=options.get("search", route_finder.DEFAULT_SEARCH),
+        )
+        if options.get("score", True):
+            transfers = route_finder.transfer_index()
+            for route in routes:
+                route["score"] = score_route(route, transfer_index=transfers)
+        result["routes"] = routes
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _route_chunk(pairs: List[Dict[str, Any]], options: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Worker task: route a chunk of pairs on the worker's current snapshot."""
+    # Cheap mtime check, so long-lived workers follow network reloads
+    route_finder.reload_network()
+    # Realtime statuses are only published in the server process; apply the
+    # ones the batch was submitted with
+    statuses = options.get("line_statuses")
+    if statuses is not None and statuses[0] != route_finder._line_statuses[0]:
+        route_finder.set_line_statuses(*statuses)
+    return [route_pair(pair, options) for pair in pairs]
+
+
+def run_batch(pairs: List[Dict[str, Any]], options: Dict[str, Any],
+              executor: Optional[Executor] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Route every pair and yield results in completion order. Each pair gets
+    an "index" (its position in pairs) so callers can match results up.
+    Workers route with the realtime line statuses current at submission.
+    """
+    indexed = [{**pair, "index": i} for i, pair in enumerate(pairs)]
+    chunks = [indexed[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(indexed), BATCH_CHUNK_SIZE)]
+
+    options = {**options, "line_statuses": route_finder._line_statuses}
+    own_pool = executor is None
+    executor = executor or _get_executor()
+
+    def failed(chunk, e):
+        for pair in chunk:
+            yield {"index": pair["index"], "id": pair.get("id"), "origin": pair.get("origin"),
+                   "destination": pair.get("destination"), "error": f"{type(e).__name__}: {e}"}
+
+    futures = {}
+    broken = None
+    for chunk in chunks:
+        if broken is None:
+            try:
+                futures[executor.submit(_route_chunk, chunk, options)] = chunk
+                continue
+            except BrokenProcessPool as e:
+                broken = e
+        yield from failed(chunk, broken)
+    for future in as_completed(futures):
+        try:
+            yield from future.result()
+        except Exception as e:
+            # The worker itself failed (e.g. it died); report every pair in the chunk
+            if isinstance(e, BrokenProcessPool):
+                broken = e
+            yield from failed(futures[future], e)
+    # A dead worker breaks the whole pool for good
+    if broken is not None and own_pool:
+        _discard(executor)
+
+
+def run_batch_ndjson(pairs: List[Dict[str, Any]], options: Dict[str, Any],
+                     executor: Optional[Executor] = None) -> Iterator[str]:
+    """run_batch as newline-delimited JSON."""
+    for result in run_batch(pairs, options, executor):
+        yield json.dumps(result, ensure_ascii=False) + "\n"
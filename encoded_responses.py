@@ -0,0 +1,155 @@
+"""
+Pre-encoded JSON responses for large, rarely changing data.
+
+The station and line lists only change when the data files do, so they are
+serialized once per data version and kept as bytes, together with gzip (and
+brotli, when the brotli package is installed) encodings and a strong ETag
+derived from the content. Requests pick the best encoding from
+Accept-Encoding and get a 304 without a body when their If-None-Match
+already names the current content.
+
+Field projections (?fields=...) are cached the same way, as separate
+entries; the cache is a small LRU so arbitrary field lists cannot grow it.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encoded responses kept (each projection of each endpoint is one entry)
+MAX_ENTRIES = 16
+# Clients may reuse a response this long before revalidating it
+CACHE_CONTROL = "public, max-age=300"
+GZIP_LEVEL = 6
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+
+class EncodedResponse(NamedTuple):
+    # Content hash, shared by all encodings of the same content
+    digest: str
+    body: bytes
+    # Content-Encoding -> compressed body
+    encoded: Dict[str, bytes]
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        """Strong ETag of one representation; encodings get their own tag."""
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+
+def encode_json(data: Any) -> EncodedResponse:
+    """Serialize data once and compress it with every available encoding."""
+    body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    encoded = {}
+    if len(body) >= MIN_COMPRESS_BYTES:
+        encoded["gzip"] = gzip.compress(body, GZIP_LEVEL, mtime=0)
+        if brotli is not None:
+            encoded["br"] = brotli.compress(body)
+    return EncodedResponse(hashlib.sha256(body).hexdigest()[:32], body, encoded)
+
+
+def project(records: Iterable[Dict[str, Any]], fields: Optional[Tuple[str, ...]]) -> List[Dict[str, Any]]:
+    """Keep only the given fields of each record (all of them if fields is None)."""
+    if fields is None:
+        return list(records)
+    return [{field: record[field] for field in fields if field in record} for record in records]
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Comma-separated field names from a query parameter, in a canonical order."""
+    if not fields:
+        return None
+    names = sorted({name.strip() for name in fields.split(",") if name.strip()})
+    return tuple(names) or None
+
+
+class ResponseCache:
+    """Encoded responses by key, rebuilt when their data version changes."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Hashable, EncodedResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Hashable, build: Callable[[], Any]) -> EncodedResponse:
+        """The encoded response for key at version, calling build() only on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+        # Build outside the lock; concurrent misses at worst build twice
+        response = encode_json(build())
+        with self._lock:
+            self._entries[key] = (version, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return response
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def _choose_encoding(encoded: EncodedResponse, accept_encoding: Optional[str]) -> Optional[str]:
+    """The best available encoding the client accepts, or None for identity."""
+    accepted = _accepted_encodings(accept_encoding or "")
+    for encoding in ("br", "gzip"):
+        if encoding in encoded.encoded and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def _etag_matches(if_none_match: str, encoded: EncodedResponse) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Any representation of the same content is still valid for the client
+    current = {encoded.etag()} | {encoded.etag(encoding) for encoding in encoded.encoded}
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in current:
+            return True
+    return False
+
+
+def encoded_json_response(request: Request, encoded: EncodedResponse,
+                          cache_control: str = CACHE_CONTROL) -> Response:
+    """A 200 with the best encoding for the request, or a 304 if the client is current."""
+    encoding = _choose_encoding(encoded, request.headers.get("accept-encoding"))
+    headers = {"ETag": encoded.etag(encoding), "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, encoded):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(encoded.encoded[encoding], media_type="application/json", headers=headers)
+    return Response(encoded.body, media_type="application/json", headers=headers)
@@ -0,0 +1,115 @@
+"""
+Walking footpaths between differently named stations.
+
+The compiled network only joins lines at stations that share a key, so a
+change between, say, Otemachi and Tokyo is invisible to it. Footpaths add
+those walks: every pair stations.json lists as odpt:connectingStation, plus
+every two surveyed stations within FOOTPATH_RADIUS_KM of each other. They
+are built once per snapshot and stored in the same CSR form as the ride
+edges, so the search follows them without any geometry at query time.
+
+A footpath's seconds come from scoring.calculate_transfer_time on its
+walking distance, so walking between stations costs what an equally long
+transfer recorded in transfers.json would.
+"""
+
+from array import array
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from geo import WALK_DETOUR_FACTOR, GridIndex, LatLon, haversine_km
+from scoring import calculate_transfer_time
+
+# Surveyed stations at most this far apart (straight line) get a footpath
+FOOTPATH_RADIUS_KM = 0.4
+
+# Walking distance for listed connections without positions at both ends
+DEFAULT_CONNECTION_METERS = 250
+
+
+class Footpaths:
+    """
+    CSR walking links: the footpaths leaving station s are
+    neighbors[offsets[s]:offsets[s + 1]], with the walking distance and
+    seconds of each in the parallel distance_m/seconds arrays. Every
+    footpath is stored in both directions.
+    """
+
+    def __init__(self, num_stations: int, walks: Dict[Tuple[int, int], int]):
+        adjacency = [[] for _ in range(num_stations)]
+        for (a, b), distance_m in walks.items():
+            adjacency[a].append((b, distance_m))
+            adjacency[b].append((a, distance_m))
+
+        self.offsets = array("I", [0])
+        self.neighbors = array("I")
+        self.distance_m = array("I")
+        self.seconds = array("I")
+        for links in adjacency:
+            for neighbor, distance_m in sorted(links):
+                self.neighbors.append(neighbor)
+                self.distance_m.append(distance_m)
+                self.seconds.append(round(calculate_transfer_time({"distance_m": distance_m})))
+            self.offsets.append(len(self.neighbors))
+
+    @classmethod
+    def from_arrays(cls, offsets: Sequence[int], neighbors: Sequence[int], distance_m: Sequence[int],
+                    seconds: Sequence[int]) -> "Footpaths":
+        """Footpaths from previously built CSR arrays (e.g. views of a memory-mapped bundle)."""
+        footpaths = cls.__new__(cls)
+        footpaths.offsets = offsets
+        footpaths.neighbors = neighbors
+        footpaths.distance_m = distance_m
+        footpaths.seconds = seconds
+        return footpaths
+
+    def __len__(self) -> int:
+        """Number of footpaths (each direction counted once)."""
+        return len(self.neighbors) // 2
+
+    def walks(self, station: int) -> range:
+        """Range of footpath indexes leaving a station."""
+        return range(self.offsets[station], self.offsets[station + 1])
+
+    def min_seconds_per_km(self, coords: Sequence[Optional[LatLon]]) -> float:
+        """Smallest walking seconds per straight-line km, as geo.min_seconds_per_km for ride edges."""
+        best = float("inf")
+        for station in range(len(self.offsets) - 1):
+            for f in self.walks(station):
+                other = self.neighbors[f]
+                if coords[station] is not None and coords[other] is not None:
+                    km = haversine_km(coords[station], coords[other])
+                    if km > 0:
+                        best = min(best, self.seconds[f] / km)
+        return best
+
+    def find(self, from_station: int, to_station: int) -> Optional[int]:
+        """Index of the footpath between two stations, or None."""
+        return next((f for f in self.walks(from_station) if self.neighbors[f] == to_station), None)
+
+
+def build_footpaths(num_stations: int, coords: Sequence[Optional[LatLon]], surveyed: Iterable[int],
+                    connections: Iterable[Tuple[int, int]], index: GridIndex) -> Footpaths:
+    """
+    Footpaths for the listed (station, station) connections and for every
+    pair of surveyed stations within FOOTPATH_RADIUS_KM. Walking distances
+    are WALK_DETOUR_FACTOR times the straight line between the stations'
+    positions where both are surveyed (interpolated positions can be far
+    off), DEFAULT_CONNECTION_METERS otherwise.
+    """
+    surveyed = set(surveyed)
+
+    def distance_m(a: int, b: int) -> int:
+        if a not in surveyed or b not in surveyed:
+            return DEFAULT_CONNECTION_METERS
+        return round(haversine_km(coords[a], coords[b]) * 1000 * WALK_DETOUR_FACTOR)
+
+    walks: Dict[Tuple[int, int], int] = {}
+    for a, b in connections:
+        if a != b:
+            walks[min(a, b), max(a, b)] = distance_m(a, b)
+
+    for a in surveyed:
+        for _km, b in index.within(coords[a], FOOTPATH_RADIUS_KM):
+            if a < b and b in surveyed:
+                walks.setdefault((a, b), distance_m(a, b))
+    return Footpaths(num_stations, walks)
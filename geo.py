@@ -0,0 +1,224 @@
+"""
+Station coordinates and straight-line distance bounds.
+
+stations.json gives geo:lat/geo:long for the stations ODPT covers. Stations
+without coordinates are interpolated along their lines (or from their
+graph neighbors) until every connected station has a position. A
+distance-based lower bound on travel time then only needs the fastest
+seconds-per-km of any edge under those positions: no route can beat
+distance times that rate, whatever the positions are, so the bound is
+admissible and consistent for A*.
+
+GridIndex buckets the positions into a uniform grid of roughly square cells
+for nearest-station queries from arbitrary coordinates.
+"""
+
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from network_graph import CompiledNetwork, normalize_station
+
+EARTH_RADIUS_KM = 6371.0
+
+# Smoothing passes over stations placed from their neighbors
+RELAXATION_SWEEPS = 200
+
+# Edge length of a GridIndex cell
+GRID_CELL_KM = 1.0
+
+# km per degree of latitude
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Street walking distance relative to the straight line
+WALK_DETOUR_FACTOR = 1.3
+
+LatLon = Tuple[float, float]
+
+
+def haversine_km(a: LatLon, b: LatLon) -> float:
+    """Great-circle distance in km between two (lat, lon) points."""
+    lat1, lon1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lon2 = math.radians(b[0]), math.radians(b[1])
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def station_coordinates(net: CompiledNetwork, known: Dict[str, LatLon]) -> List[Optional[LatLon]]:
+    """
+    Position per station ID: known coordinates by station key, others
+    interpolated. Runs of unknown stations between two known ones on a line
+    are spaced evenly between them; whatever is left takes the mean position
+    of its located graph neighbors. Stations in components without any known
+    coordinates stay None.
+    """
+    coords: List[Optional[LatLon]] = [known.get(key) for key in net.station_keys]
+
+    for line_id in net.line_keys:
+        ids = [net.station_index[normalize_station(name)] for name in net.lines[line_id].get("stations", [])]
+        located = [i for i, sid in enumerate(ids) if known.get(net.station_keys[sid]) is not None]
+        for start, end in zip(located, located[1:]):
+            a, b = coords[ids[start]], coords[ids[end]]
+            for i in range(start + 1, end):
+                if coords[ids[i]] is None:
+                    t = (i - start) / (end - start)
+                    coords[ids[i]] = (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+
+    missing = {sid for sid, c in enumerate(coords) if c is None}
+    free = sorted(missing)
+    while missing:
+        placed = {}
+        for sid in missing:
+            mean = _neighbor_mean(net, coords, sid)
+            if mean is not None:
+                placed[sid] = mean
+        if not placed:
+            break
+        for sid, c in placed.items():
+            coords[sid] = c
+        missing -= placed.keys()
+
+    # Relax the neighbor-placed stations towards the mean of their
+    # neighbors, which spreads chains of them out between located stations
+    # instead of bunching them next to the first one reached.
+    for _sweep in range(RELAXATION_SWEEPS):
+        for sid in free:
+            if coords[sid] is not None:
+                coords[sid] = _neighbor_mean(net, coords, sid) or coords[sid]
+    return coords
+
+
+def _neighbor_mean(net: CompiledNetwork, coords: Sequence[Optional[LatLon]], station: int) -> Optional[LatLon]:
+    located = [coords[net.neighbors[e]] for e in net.edges(station) if coords[net.neighbors[e]] is not None]
+    if not located:
+        return None
+    return (sum(c[0] for c in located) / len(located), sum(c[1] for c in located) / len(located))
+
+
+def min_seconds_per_km(net: CompiledNetwork, coords: Sequence[Optional[LatLon]]) -> float:
+    """
+    The smallest ride seconds per straight-line km over every edge, i.e. the
+    top effective speed of the network; 0 if no edge has two positions.
+    """
+    best = math.inf
+    for station in range(net.num_stations):
+        if coords[station] is None:
+            continue
+        for e in net.edges(station):
+            other = coords[net.neighbors[e]]
+            if other is None:
+                continue
+            km = haversine_km(coords[station], other)
+            if km > 0:
+                best = min(best, net.weights[e] / km)
+    return 0.0 if best == math.inf else best
+
+
+def distance_bounds(coords: Sequence[Optional[LatLon]], target: int, seconds_per_km: float) -> List[float]:
+    """
+    Lower bound on the seconds from every station to target. Stations
+    without a position get 0, as do all stations if target has none.
+    """
+    target_coords = coords[target]
+    if target_coords is None or not seconds_per_km:
+        return [0.0] * len(coords)
+    return [haversine_km(c, target_coords) * seconds_per_km if c is not None else 0.0 for c in coords]
+
+
+class DistanceBounds(dict):
+    """
+    distance_bounds plus a constant offset, computed per station on first
+    lookup. A* only looks up the stations it reaches, a small part of a
+    large network, so most bounds are never computed.
+    """
+
+    def __init__(self, coords: Sequence[Optional[LatLon]], target: int, seconds_per_km: float, offset: float = 0.0):
+        super().__init__()
+        self.coords = coords
+        self.target_coords = coords[target] if seconds_per_km else None
+        self.seconds_per_km = seconds_per_km
+        self.offset = offset
+
+    def __missing__(self, station: int) -> float:
+        c = self.coords[station]
+        bound = self.offset
+        if c is not None and self.target_coords is not None:
+            bound += haversine_km(c, self.target_coords) * self.seconds_per_km
+        self[station] = bound
+        return bound
+
+
+class GridIndex:
+    """
+    Uniform latitude/longitude grid over station positions. Cells are at
+    least cell_km wide everywhere the stations are, so after searching every
+    cell within r rings of the query's cell, any station not seen yet is at
+    least r * cell_km away.
+    """
+
+    def __init__(self, coords: Sequence[Optional[LatLon]], cell_km: float = GRID_CELL_KM):
+        self.coords = coords
+        self.cell_km = cell_km
+        located = [c for c in coords if c is not None]
+        # Longitude cells are narrowest at the latitude furthest from the equator
+        max_lat = max((abs(c[0]) for c in located), default=0.0)
+        self.lat_step = cell_km / KM_PER_DEGREE
+        self.lon_step = cell_km / (KM_PER_DEGREE * max(math.cos(math.radians(max_lat)), 1e-6))
+
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for station, c in enumerate(coords):
+            if c is not None:
+                self.cells.setdefault(self._cell(c), []).append(station)
+        rows = [cell[0] for cell in self.cells] or [0]
+        cols = [cell[1] for cell in self.cells] or [0]
+        self._bounds = (min(rows), max(rows), min(cols), max(cols))
+
+    def _cell(self, point: LatLon) -> Tuple[int, int]:
+        return math.floor(point[0] / self.lat_step), math.floor(point[1] / self.lon_step)
+
+    def __len__(self) -> int:
+        return sum(len(stations) for stations in self.cells.values())
+
+    def within(self, point: LatLon, max_km: float) -> List[Tuple[float, int]]:
+        """Every (distance in km, station ID) pair within max_km of point, nearest first."""
+        if not self.cells:
+            return []
+        row, col = self._cell(point)
+        rings = math.ceil(max_km / self.cell_km)
+        found = []
+        for r in range(row - rings, row + rings + 1):
+            for c in range(col - rings, col + rings + 1):
+                for station in self.cells.get((r, c), ()):
+                    km = haversine_km(point, self.coords[station])
+                    if km <= max_km:
+                        found.append((km, station))
+        found.sort()
+        return found
+
+    def nearest(self, point: LatLon, k: int = 1, max_km: float = math.inf) -> List[Tuple[float, int]]:
+        """
+        Up to k (distance in km, station ID) pairs closest to point, nearest
+        first, leaving out stations further than max_km.
+        """
+        if k <= 0 or not self.cells:
+            return []
+        row, col = self._cell(point)
+        min_row, max_row, min_col, max_col = self._bounds
+        # Beyond this many rings there are no more cells
+        last_ring = max(abs(row - min_row), abs(row - max_row), abs(col - min_col), abs(col - max_col))
+
+        found: List[Tuple[float, int]] = []
+        for ring in range(last_ring + 1):
+            for r in range(row - ring, row + ring + 1):
+                # Only the border of the ring; the inside was searched already
+                step = 1 if r in (row - ring, row + ring) else 2 * ring or 1
+                for c in range(col - ring, col + ring + 1, step):
+                    for station in self.cells.get((r, c), ()):
+                        km = haversine_km(point, self.coords[station])
+                        if km <= max_km:
+                            found.append((km, station))
+            found.sort()
+            del found[k:]
+            reach = ring * self.cell_km
+            if reach >= max_km or (len(found) == k and found[-1][0] <= reach):
+                break
+        return found
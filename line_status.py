@@ -0,0 +1,85 @@
+"""
+Structured line status parsed from ODPT train information.
+
+odpt:TrainInformation only carries free Japanese text such as
+"現在、平常どおり運転しています。" or "人身事故の影響で、運転を見合わせています。".
+parse_status() turns that text into a LineStatus (normal, delayed by some
+minutes, or suspended), and line_statuses() indexes the statuses of a feed
+by our line IDs, which are the odpt.Railway IDs without their prefix.
+"""
+
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+NORMAL = "normal"
+DELAYED = "delayed"
+SUSPENDED = "suspended"
+
+# Assumed delay when the text reports one without saying how long
+DEFAULT_DELAY_MINUTES = 10
+# A suspension on part of a line is treated as a long delay on all of it
+PARTIAL_SUSPENSION_DELAY_MINUTES = 30
+
+_SUSPENDED = re.compile(r"運転(を)?見合わせ|運休|不通")
+# Service has resumed ("運転を再開しました", "見合わせていましたが"), but not
+# a resumption that is only expected ("運転再開見込みは12時頃")
+_RESUMED = re.compile(r"再開(?!見込|の見込|予定|時刻|は未定)|見合わせていました")
+_PARTIAL = re.compile(r"一部|間で|区間")
+_NORMAL = re.compile(r"平常|はありません|通常通り")
+_DELAY_MINUTES = re.compile(r"(\d+)分(?:程度|前後|以上|ほど)?(?:の)?(?:遅れ|遅延)")
+_DELAYED = re.compile(r"遅れ|遅延|ダイヤ(が|の)乱れ|運転間隔")
+
+
+class LineStatus(NamedTuple):
+    state: str
+    # Expected extra minutes when boarding the line (0 unless delayed)
+    delay_minutes: int
+    # The original Japanese text
+    text: str
+
+    @property
+    def disrupted(self) -> bool:
+        return self.state != NORMAL
+
+
+def parse_status(text: str, status: Optional[str] = None) -> LineStatus:
+    """
+    Classify a trainInformationText (and the optional short
+    trainInformationStatus). Unrecognised text counts as normal.
+    """
+    combined = unicodedata.normalize("NFKC", f"{status or ''} {text or ''}")
+    # Trains running again after a suspension are usually still late
+    if _RESUMED.search(combined):
+        if _NORMAL.search(combined):
+            return LineStatus(NORMAL, 0, text)
+        minutes = _DELAY_MINUTES.search(combined)
+        return LineStatus(DELAYED, int(minutes.group(1)) if minutes else DEFAULT_DELAY_MINUTES, text)
+    if _SUSPENDED.search(combined):
+        if _PARTIAL.search(combined):
+            return LineStatus(DELAYED, PARTIAL_SUSPENSION_DELAY_MINUTES, text)
+        return LineStatus(SUSPENDED, 0, text)
+    # "15分以上の遅延はありません" mentions a delay only to deny it
+    if _NORMAL.search(combined):
+        return LineStatus(NORMAL, 0, text)
+    minutes = _DELAY_MINUTES.search(combined)
+    if minutes:
+        return LineStatus(DELAYED, int(minutes.group(1)), text)
+    if _DELAYED.search(combined):
+        return LineStatus(DELAYED, DEFAULT_DELAY_MINUTES, text)
+    return LineStatus(NORMAL, 0, text)
+
+
+def line_statuses(train_info: Iterable[Dict[str, Any]]) -> Dict[str, LineStatus]:
+    """Status per line ID (e.g. "TokyoMetro.Ginza") for odpt:TrainInformation records."""
+    statuses = {}
+    for item in train_info:
+        railway = item.get("odpt:railway") or item.get("owl:sameAs", "")
+        line_id = railway.split(":", 1)[-1]
+        text = (item.get("odpt:trainInformationText") or {}).get("ja", "")
+        status = item.get("odpt:trainInformationStatus")
+        if isinstance(status, dict):
+            status = status.get("ja")
+        if line_id:
+            statuses[line_id] = parse_status(text, status)
+    return statuses
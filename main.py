@@ -1,21 +1,40 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from pathlib import Path
+import io
 import json
 
+import numpy as np
+
 from scoring import score_route
-from route_finder import find_routes, get_all_stations, get_all_lines
+from encoded_responses import ResponseCache, encoded_json_response, parse_fields, project
+from batch_routing import MAX_BATCH_PAIRS, run_batch_ndjson, shutdown as stop_batch_workers
+from realtime_data import add_listener, realtime_status, start_poller, stop_poller
+from status_stream import broadcaster, event_stream, parse_lines
+from timetable import calendar_for_date, parse_clock
+from route_finder import (find_routes, get_all_stations, get_station_records, get_all_lines, search_stations, next_departures, route_cache_stats,
+                          network_status, reload_network, watch_network, travel_time_matrix, reachable_stations,
+                          nearest_stations, find_routes_between_coordinates, line_statuses, set_line_statuses,
+                          transfer_index, SEARCH_MODES, WALK_SPEED_FACTORS)
 
 app = FastAPI(title='Japan Route Optimizer')
 templates = Jinja2Templates(directory="templates")
 DATA_DIR = Path('data')
+# Pre-encoded bodies of the large data endpoints, rebuilt when their data changes
+_encoded_responses = ResponseCache()
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+@app.on_event("startup")
+def start_network_watcher():
+    """Pick up changes to the network data files without a restart."""
+    watch_network()
+
 @app.get('/')
 def root(request: Request):
     return templates.TemplateResponse(
@@ -23,54 +42,112 @@ def root(request: Request):
         {"request": request}
     )
 
-@app.get('/lines')
-def lines():
-    p = DATA_DIR / 'train_lines.json'
+def _file_version(path: Path):
+    """Data version of a file: its modification time and size."""
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+def _data_file_response(request: Request, name: str, fields: str | None):
+    """A data file as pre-encoded JSON, optionally projected to some fields of each record."""
+    p = DATA_DIR / name
     if not p.exists():
-        raise HTTPException(404, 'train_lines.json not found; run scripts/fetch_odpt.py')
-    return json.loads(p.read_text(encoding='utf-8'))
+        raise HTTPException(404, f'{name} not found; run scripts/fetch_odpt.py')
+    projection = parse_fields(fields)
+    encoded = _encoded_responses.get(
+        (name, projection), _file_version(p),
+        lambda: project(json.loads(p.read_text(encoding='utf-8')), projection))
+    return encoded_json_response(request, encoded)
+
+@app.get('/lines')
+def lines(request: Request, fields: str | None = None):
+    """train_lines.json; fields=owl:sameAs,odpt:railwayTitle keeps only those keys of each line."""
+    return _data_file_response(request, 'train_lines.json', fields)
 
 @app.get('/stations')
-def stations():
-    p = DATA_DIR / 'stations.json'
-    if not p.exists():
-        raise HTTPException(404, 'stations.json not found; run scripts/fetch_odpt.py')
-    return json.loads(p.read_text(encoding='utf-8'))
+def stations(request: Request, fields: str | None = None):
+    """stations.json; fields=owl:sameAs,odpt:stationTitle keeps only those keys of each station."""
+    return _data_file_response(request, 'stations.json', fields)
 
 @app.get('/api/network-stations')
-def network_stations():
-    """Get all available stations from the route finder network with bilingual names."""
-    stations_data = []
-    station_names = get_all_stations()
-    
-    # Load stations.json for Japanese names
-    stations_path = DATA_DIR / 'stations.json'
-    stations_map = {}
-    
-    if stations_path.exists():
-        stations_json = json.loads(stations_path.read_text(encoding='utf-8'))
-        for station in stations_json:
-            title = station.get('odpt:stationTitle', {})
-            en_name = title.get('en', '')
-            ja_name = title.get('ja', '')
-            if en_name:
-                # Normalize the English name to match network.json format
-                normalized = en_name.lower().replace(' ', '-')
-                stations_map[en_name] = ja_name
-                stations_map[normalized] = ja_name
-    
-    # Build structured station data
-    for station_name in station_names:
-        normalized_id = station_name.lower().replace(' ', '-')
-        ja_name = stations_map.get(station_name, stations_map.get(normalized_id, ''))
-        
-        stations_data.append({
-            'id': normalized_id,
-            'name_en': station_name,
-            'name_ja': ja_name
-        })
-    
-    return {"stations": stations_data}
+def network_stations(request: Request, fields: str | None = None):
+    """
+    Get all available stations from the route finder network with bilingual
+    names, ODPT IDs, station codes and positions. Built once per network
+    version; fields=id,name_ja keeps only those keys.
+    """
+    projection = parse_fields(fields)
+    encoded = _encoded_responses.get(('network-stations', projection), network_status()["version"],
+                                     lambda: {"stations": project(get_station_records(), projection)})
+    return encoded_json_response(request, encoded)
+
+@app.get('/api/stations/autocomplete')
+def stations_autocomplete(q: str = '', limit: int = 10):
+    """Ranked station suggestions matching English, Japanese or romanized input."""
+    limit = max(1, min(limit, 50))
+    return {"query": q, "stations": search_stations(q, limit)}
+
+def _check_coordinates(lat: float, lon: float):
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(400, f"Invalid coordinates: {lat}, {lon}")
+
+def _check_walking_speed(walking_speed: str):
+    if walking_speed not in WALK_SPEED_FACTORS:
+        raise HTTPException(400, f"walking_speed must be one of {', '.join(WALK_SPEED_FACTORS)}")
+
+@app.get('/api/stations/nearest')
+def stations_nearest(lat: float, lon: float, k: int = 5, max_km: Optional[float] = None, walking_speed: str = "normal"):
+    """The k stations closest to a GPS coordinate, with distance and walking time."""
+    _check_coordinates(lat, lon)
+    _check_walking_speed(walking_speed)
+    k = max(1, min(k, 50))
+    return {"lat": lat, "lon": lon,
+            "stations": nearest_stations(lat, lon, k, max_km if max_km is not None else float("inf"), walking_speed)}
+
+@app.get('/api/routes/coordinates')
+def routes_between_coordinates(from_lat: float, from_lon: float, to_lat: float, to_lon: float,
+                               max_routes: int = 5, walking_speed: str = "normal"):
+    """
+    Routes between two GPS coordinates, walking to and from whichever
+    nearby stations make the quickest journeys.
+    """
+    _check_coordinates(from_lat, from_lon)
+    _check_coordinates(to_lat, to_lon)
+    _check_walking_speed(walking_speed)
+    max_routes = max(1, min(max_routes, 10))
+    try:
+        routes = find_routes_between_coordinates((from_lat, from_lon), (to_lat, to_lon), max_routes,
+                                                 walking_speed=walking_speed)
+    except ValueError as e:
+        raise HTTPException(404, str(e))
+    transfers = transfer_index()
+    for route in routes:
+        route["score"] = score_route(route, walking_speed=walking_speed, transfer_index=transfers)
+    return {"routes": routes}
+
+@app.get('/api/departures')
+def departures(station: str, date: str | None = None, time: str | None = None, direction: str | None = None, limit: int = 5):
+    """Next departures from a station after a time, from the loaded station timetables."""
+    limit = max(1, min(limit, 100))
+    try:
+        return {"station": station, "departures": next_departures(station, date, time, direction, limit)}
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+@app.get('/api/route-cache/stats')
+def route_cache_statistics():
+    """Hit, miss and eviction counters of the route result cache."""
+    return route_cache_stats()
+
+@app.get('/api/admin/network')
+def admin_network_status():
+    """Version, build time and source files of the live network snapshot."""
+    return network_status()
+
+@app.post('/api/admin/network/reload')
+def admin_network_reload(force: bool = False):
+    """Rebuild the network snapshot now if its data files changed (or always, with force)."""
+    reloaded = reload_network(force)
+    return {"reloaded": reloaded, **network_status()}
 
 @app.get('/api/network-lines')
 def network_lines():
@@ -82,17 +159,143 @@ class RouteCandidate(BaseModel):
 
 @app.post('/score-route')
 def post_score(candidate: RouteCandidate):
-    return score_route(candidate.dict())
+    return score_route(candidate.dict(), transfer_index=transfer_index())
 
 @app.post('/compare')
 def compare(candidates: List[RouteCandidate]):
     out = []
+    transfers = transfer_index()
     for c in candidates:
-        s = score_route(c.dict())
+        s = score_route(c.dict(), transfer_index=transfers)
         out.append({'candidate': c, 'score': s})
     out.sort(key=lambda x: x['score']['total_seconds'])
     return out
 
+class BatchPair(BaseModel):
+    origin: str
+    destination: str
+    via: List[str] = []
+    id: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    pairs: List[BatchPair]
+    date: Optional[str] = None
+    time: Optional[str] = None
+    time_type: str = "departure"
+    max_routes: int = 5
+    score: bool = True
+    # Shortest-path algorithm: "dijkstra", "astar" or "bidirectional"
+    search: str = "bidirectional"
+
+@app.post('/api/routes/batch')
+def routes_batch(batch: BatchRequest):
+    """
+    Route many origin/destination pairs on the worker pool. Streams one JSON
+    object per pair (NDJSON) in completion order; a failed pair carries an
+    "error" instead of "routes".
+    """
+    if len(batch.pairs) > MAX_BATCH_PAIRS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_PAIRS} pairs per batch")
+    if batch.search not in SEARCH_MODES:
+        raise HTTPException(400, f"search must be one of {', '.join(SEARCH_MODES)}")
+    options = {
+        "date": batch.date,
+        "time": batch.time,
+        "time_type": batch.time_type,
+        "max_routes": max(1, min(batch.max_routes, 10)),
+        "score": batch.score,
+        "search": batch.search,
+    }
+    pairs = [pair.dict() for pair in batch.pairs]
+    return StreamingResponse(run_batch_ndjson(pairs, options), media_type="application/x-ndjson")
+
+@app.get('/api/isochrone')
+def isochrone(station: str, minutes: float = 30, max_transfers: int = 3):
+    """
+    Stations reachable from station within minutes and max_transfers.
+    Each station lists its (seconds, transfers) Pareto front, so clients can
+    filter for any smaller threshold (e.g. a time slider) without another
+    request.
+    """
+    minutes = max(1, min(minutes, 300))
+    max_transfers = max(0, min(max_transfers, 6))
+    try:
+        origin, reachable = reachable_stations(station, minutes, max_transfers)
+    except ValueError:
+        raise HTTPException(404, f"Station not found: {station}")
+    return {
+        "origin": origin,
+        "minutes": minutes,
+        "max_transfers": max_transfers,
+        "stations": [
+            {
+                "id": r.key,
+                "name_en": r.name,
+                "name_ja": r.name_ja,
+                "seconds": r.front[0][0],
+                "transfers": r.front[0][1],
+                "front": [list(point) for point in r.front],
+            }
+            for r in reachable
+        ],
+    }
+
+class MatrixRequest(BaseModel):
+    origins: List[str]
+    destinations: List[str]
+    date: Optional[str] = None
+    time: Optional[str] = None
+    # "json", "csv" or "npz"
+    format: str = "json"
+    # Matrix written by the csv format: "seconds" or "transfers"
+    metric: str = "seconds"
+
+MAX_MATRIX_STATIONS = 1000
+
+@app.post('/api/matrix')
+def matrix(request: MatrixRequest):
+    """
+    Origin x destination travel-time and transfer-count matrices.
+
+    format=npz returns a compressed NumPy archive with seconds (float32, NaN
+    where unreachable), transfers (int8, -1 where unreachable), origins and
+    destinations; format=csv streams one matrix row per origin.
+    """
+    if max(len(request.origins), len(request.destinations)) > MAX_MATRIX_STATIONS:
+        raise HTTPException(413, f"At most {MAX_MATRIX_STATIONS} origins and destinations")
+    if request.format not in ("json", "csv", "npz") or request.metric not in ("seconds", "transfers"):
+        raise HTTPException(400, "format must be json, csv or npz; metric must be seconds or transfers")
+    try:
+        result = travel_time_matrix(request.origins, request.destinations, request.date, request.time)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    if request.format == "npz":
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, seconds=result.seconds, transfers=result.transfers,
+                            origins=np.array(result.origins), destinations=np.array(result.destinations))
+        return Response(buffer.getvalue(), media_type="application/octet-stream",
+                        headers={"Content-Disposition": 'attachment; filename="matrix.npz"'})
+
+    if request.format == "csv":
+        values = result.seconds if request.metric == "seconds" else result.transfers
+
+        def rows():
+            yield "origin," + ",".join(result.destinations) + "\n"
+            for origin, row in zip(result.origins, values):
+                cells = ("" if value != value or value < 0 else str(int(value)) for value in row.tolist())
+                yield origin + "," + ",".join(cells) + "\n"
+
+        return StreamingResponse(rows(), media_type="text/csv")
+
+    return {
+        "origins": result.origins,
+        "destinations": result.destinations,
+        "source": result.source,
+        "seconds": [[None if value != value else int(value) for value in row] for row in result.seconds.tolist()],
+        "transfers": result.transfers.tolist(),
+    }
+
 @app.get("/search")
 def search_page(request: Request, q: str | None = None):
     p = DATA_DIR / "stations.json"
@@ -125,16 +328,58 @@ def search_page(request: Request, q: str | None = None):
         }
     )
 
-from realtime_data import get_train_information_dict
+@app.on_event("startup")
+async def start_realtime_poller():
+    """
+    Refresh train information in the background; requests only read memory.
+    Every new snapshot's line statuses go straight into routing and out to
+    status stream subscribers.
+    """
+    add_listener(lambda snapshot: set_line_statuses(snapshot.version, snapshot.statuses))
+    add_listener(lambda snapshot: broadcaster().publish(snapshot.version, snapshot.statuses))
+    start_poller()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    """Stop the train information poller and any batch routing worker processes."""
+    await stop_poller()
+    stop_batch_workers()
+
+@app.get('/api/realtime/status')
+def realtime_poller_status():
+    """Version, age and error state of the in-memory train information."""
+    return realtime_status()
+
+@app.get('/api/realtime/stream')
+async def realtime_status_stream(lines: str | None = None, last_event_id: str | None = Header(None)):
+    """
+    Server-sent events with line status changes. lines is a comma-separated
+    list of line IDs (e.g. the line_ids of the displayed routes); without it
+    every line is sent. The first event is a snapshot of the subscribed
+    lines, later ones only carry lines whose status changed.
+    """
+    stream = broadcaster()
+    if stream.subscribers >= stream.max_subscribers:
+        raise HTTPException(status_code=503, detail="Too many status streams open")
+    return StreamingResponse(event_stream(stream, parse_lines(lines), last_event_id),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # ... (existing code) ...
 
-from fastapi import Header
 from i18n import get_translator, get_best_match_language
 # ... (imports)
 
 # ... (existing code) ...
 
+def _valid(parse, value: str) -> bool:
+    """Whether parse (parse_clock, calendar_for_date) accepts value."""
+    try:
+        parse(value)
+    except ValueError:
+        return False
+    return True
+
 @app.get("/route-compare")
 def route_compare_page(request: Request, origin: str | None = None, destination:str | None = None, transit: str | None = None, date: str | None = None, time: str | None = None, time_type: str = "departure", fare_type: str = "ic", seat_type: str = "unreserved", walking_speed: str = "normal", sort_order: str = "fastest", accept_language: str | None = Header(None)):
     """Main route comparison UI."""
@@ -154,7 +399,7 @@ def route_compare_page(request: Request, origin: str | None = None, destination:
             error_message = _("error_enter_destination")
         else:
             # Normalize station names
-            from route_finder import _normalize_station, _find_station
+            from route_finder import _find_station
             
             origin_normalized = _find_station(origin)
             destination_normalized = _find_station(destination)
@@ -166,48 +411,42 @@ def route_compare_page(request: Request, origin: str | None = None, destination:
                 error_message = _("error_station_not_found", station_name=destination)
             elif origin_normalized == destination_normalized:
                 error_message = _("error_origin_destination_same")
+            elif time and not _valid(parse_clock, time):
+                error_message = _("error_invalid_time", time=time)
+            elif date and not _valid(calendar_for_date, date):
+                error_message = _("error_invalid_date", date=date)
             else:
                 # Find route alternatives
                 if transit and transit.strip():
-                    transit_normalized = _find_station(transit)
-                    if not transit_normalized:
-                        error_message = _("error_station_not_found", station_name=transit)
+                    # Several via stations may be given, separated by commas
+                    via = [station.strip() for station in transit.split(",") if station.strip()]
+                    missing = next((station for station in via if not _find_station(station)), None)
+                    if missing:
+                        error_message = _("error_station_not_found", station_name=missing)
                     else:
-                        routes_to_transit = find_routes(origin, transit_normalized, date, time, time_type)
-                        routes_from_transit = find_routes(transit_normalized, destination, date, time, time_type)
-                        
-                        # Combine routes (simplified for now - more complex merging might be needed)
-                        # This will create a cartesian product of routes which can be large. 
-                        # For a real application, a more sophisticated merging strategy might be required.
-                        for r1 in routes_to_transit:
-                            for r2 in routes_from_transit:
-                                combined_segments = r1['segments'] + r2['segments']
-                                combined_name = f"{r1['name']} via {transit} to {r2['name']}"
-                                routes.append({'name': combined_name, 'segments': combined_segments})
-
+                        routes = find_routes(origin, destination, date, time, time_type, via=via)
+                        for route in routes:
+                            route["name"] = f"{route['name']} via {', '.join(via)}"
                 else:
                     routes = find_routes(origin, destination, date, time, time_type)
                 
-                # Get real-time train information
-                train_info = get_train_information_dict()
-                normal_statuses = {"平常どおり運転", "平常運行", "遅延はありません"}
+                # Realtime status of the lines, parsed when it was fetched
+                statuses = line_statuses()
                 
-                # Add delay info to routes
-                for route in routes:
-                    for segment in route.get("segments", []):
-                        if segment.get("type") == "ride":
-                            delay_text = ""
-                            for line_id in segment.get("line_ids", []):
-                                odpt_line_id = f"odpt.TrainInformation:{line_id}"
-                                status = train_info.get(odpt_line_id)
-                                if status and not any(normal in status for normal in normal_statuses):
-                                    delay_text = status
-                                    break
-                            segment["delay_info"] = delay_text
+                # Add delay info to routes (on copies of the ride segments)
+                def with_delay_info(segment):
+                    if segment.get("type") != "ride":
+                        return segment
+                    status = next((statuses[line_id] for line_id in segment.get("line_ids", [])
+                                   if line_id in statuses and statuses[line_id].disrupted), None)
+                    return {**segment, "delay_info": status.text if status else ""}
+
+                routes = [{**route, "segments": [with_delay_info(s) for s in route.get("segments", [])]} for route in routes]
 
                 # Score each route
+                transfers = transfer_index()
                 for route in routes:
-                    score = score_route(route, fare_type=fare_type, seat_type=seat_type)
+                    score = score_route(route, fare_type=fare_type, seat_type=seat_type, transfer_index=transfers)
                     scored_routes.append({
                         'name': route.get('name', 'Unnamed Route'),
                         'segments': route['segments'],
@@ -0,0 +1,393 @@
+"""
+Compiled network bundle: the network snapshot and timetables in one
+memory-mapped binary file.
+
+Building a snapshot parses network.json, stations.json and transfers.json
+and runs the graph, join and footpath builders; loading timetables parses
+every station timetable file. scripts/compile_network.py does that work
+once and writes data/network.bundle. Worker processes then map the file
+instead: the large arrays (timetable columns, ride-time tables, string
+tables) are used in place as read-only memoryviews, and strings are decoded
+only when looked up. Every process mapping the same bundle shares those
+physical pages, so adding workers does not add copies of them. The CSR
+edge and footpath arrays are copied out (a memcpy each): they are small
+next to the timetables, and the route search indexes them so often that
+array indexing is measurably faster than memoryview indexing.
+
+Not everything is mapped. Each process still parses the metadata JSON
+section (the network.json document and the transfers.json records) and
+rebuilds the Python-object indexes from the bundle's arrays: the transfer
+index, the station search trie and the spatial grid. These are dicts whose
+lookups need real Python objects, so they cannot be views of the file;
+they are built from already-decoded data, without running the join or
+footpath builders, and take milliseconds for the sample network.
+
+Layout (native byte order, recorded in the metadata):
+
+    header    MAGIC, FORMAT_VERSION, section count
+    directory one fixed-size entry per section: name, typecode, byte
+              offset, item count
+    sections  arrays, each starting at an 8-byte boundary
+
+Strings live in string tables (a utf-8 blob plus an offsets array); other
+sections refer to them by index. Small, irregular data (line metadata,
+transfer records, source file times) is one JSON section. A bundle is only
+used while the source times it records match the data files; otherwise
+the JSON files are read as before.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from footpaths import Footpaths
+from geo import GridIndex, LatLon
+from network_graph import CompiledNetwork
+from network_snapshot import NetworkSnapshot, build_snapshot, source_mtimes
+from scoring import build_transfer_index
+from station_join import JoinIndex
+from station_search import StationSearchIndex
+from timetable import DepartureTable, StringTable, TimetableStore, load_timetable_store, timetable_sources
+
+BUNDLE_NAME = "network.bundle"
+MAGIC = b"RTBUNDLE"
+# Bump whenever the layout or the meaning of a section changes
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<8sII")
+_SECTION = struct.Struct("<32s4sQQ")
+_MAX_NAME = 32
+_ALIGN = 8
+
+
+class MappedStrings:
+    """A read-only string table in a bundle; strings are decoded on access."""
+
+    def __init__(self, blob: memoryview, offsets: memoryview):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, code: int) -> str:
+        return str(self._blob[self._offsets[code]:self._offsets[code + 1]], "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[code] for code in range(len(self)))
+
+
+class BundleWriter:
+    """Collects sections in memory and writes them out as one bundle."""
+
+    def __init__(self):
+        self.sections: List[Tuple[str, str, bytes, int]] = []
+        self.names = StringTable()
+
+    def array(self, name: str, typecode: str, values: Iterable) -> None:
+        data = array(typecode, values)
+        self.sections.append((name, typecode, data.tobytes(), len(data)))
+
+    def rows(self, name: str, typecode: str, rows: Iterable[Sequence]) -> None:
+        """A list of variable-length rows, as offsets plus concatenated values."""
+        offsets = array("Q", [0])
+        values = array(typecode)
+        for row in rows:
+            values.extend(row)
+            offsets.append(len(values))
+        self.array(f"{name}.offsets", "Q", offsets)
+        self.array(f"{name}.values", typecode, values)
+
+    def strings(self, name: str, values: Iterable[str]) -> None:
+        blob = bytearray()
+        offsets = array("Q", [0])
+        for value in values:
+            blob += value.encode("utf-8")
+            offsets.append(len(blob))
+        self.array(f"{name}.offsets", "Q", offsets)
+        self.sections.append((f"{name}.blob", "B", bytes(blob), len(blob)))
+
+    def string(self, value: str) -> int:
+        """Code of a string in the shared "names" table."""
+        return self.names.code(value)
+
+    def json(self, name: str, value: Any) -> None:
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        self.sections.append((name, "B", data, len(data)))
+
+    def write(self, path: Path) -> int:
+        """Write the bundle atomically; returns its size in bytes."""
+        self.strings("names", self.names.strings)
+        position = _HEADER.size + _SECTION.size * len(self.sections)
+        directory = []
+        for name, typecode, data, count in self.sections:
+            if len(name) > _MAX_NAME:
+                raise ValueError(f"section name longer than {_MAX_NAME} bytes: {name}")
+            position += -position % _ALIGN
+            directory.append(_SECTION.pack(name.encode("ascii"), typecode.encode("ascii"), position, count))
+            position += len(data)
+
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(self.sections)))
+            f.write(b"".join(directory))
+            for (_name, _typecode, data, _count), entry in zip(self.sections, directory):
+                offset = _SECTION.unpack(entry)[2]
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(data)
+        # Processes that mapped the old file keep reading it until they reload
+        os.replace(tmp, path)
+        return position
+
+
+class Bundle:
+    """A memory-mapped bundle. Raises ValueError if the file is not a bundle of this format."""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        if len(self._view) < _HEADER.size:
+            raise ValueError(f"{path} is too short to be a bundle")
+        magic, version, count = _HEADER.unpack_from(self._view)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a network bundle")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+
+        self.sections: Dict[str, Tuple[str, int, int]] = {}
+        for i in range(count):
+            name, typecode, offset, items = _SECTION.unpack_from(self._view, _HEADER.size + i * _SECTION.size)
+            self.sections[name.rstrip(b"\0").decode("ascii")] = (typecode.rstrip(b"\0").decode("ascii"), offset, items)
+        self.meta: Dict[str, Any] = self.json("meta")
+        if self.meta.get("byteorder") != sys.byteorder:
+            raise ValueError(f"{path} was compiled on a {self.meta.get('byteorder')}-endian machine")
+        self.names = self.strings("names")
+
+    def array(self, name: str) -> memoryview:
+        """A section as a read-only typed view into the mapped file."""
+        typecode, offset, items = self.sections[name]
+        size = struct.calcsize(typecode)
+        return self._view[offset:offset + items * size].cast(typecode)
+
+    def copy(self, name: str) -> array:
+        """A section copied into an array, for data indexed in tight loops."""
+        typecode, offset, items = self.sections[name]
+        copied = array(typecode)
+        copied.frombytes(self._view[offset:offset + items * copied.itemsize])
+        return copied
+
+    def rows(self, name: str) -> List[memoryview]:
+        offsets = self.array(f"{name}.offsets")
+        values = self.array(f"{name}.values")
+        return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    def strings(self, name: str) -> MappedStrings:
+        return MappedStrings(self.array(f"{name}.blob"), self.array(f"{name}.offsets"))
+
+    def json(self, name: str) -> Any:
+        return json.loads(str(self.array(name), "utf-8"))
+
+    def size(self) -> int:
+        return len(self._view)
+
+
+def _coordinate_values(coords: Sequence[Optional[LatLon]]) -> Iterator[float]:
+    for c in coords:
+        yield from (c if c is not None else (float("nan"), float("nan")))
+
+
+def _coordinates(values: memoryview) -> Tuple[Optional[LatLon], ...]:
+    return tuple((values[i], values[i + 1]) if values[i] == values[i] else None for i in range(0, len(values), 2))
+
+
+def _add_snapshot(writer: BundleWriter, snap: NetworkSnapshot) -> None:
+    net = snap.net
+    join = snap.join
+    code = writer.string
+
+    writer.array("station.keys", "I", (code(key) for key in net.station_keys))
+    writer.array("station.names", "I", (code(name) for name in net.station_names))
+    writer.array("net.offsets", "I", net.offsets)
+    writer.array("net.neighbors", "I", net.neighbors)
+    writer.array("net.edge_lines", "H", net.edge_lines)
+    writer.array("net.weights", "I", net.weights)
+    writer.array("net.reverse_edges", "I", net.reverse_edges)
+    writer.rows("net.cumulative", "I", net.line_cumulative)
+    writer.array("net.cycle_seconds", "I", net.line_cycle_seconds)
+    writer.array("net.through_services", "I", (i for service in sorted(net.through_services) for i in service))
+    writer.array("coordinates", "d", _coordinate_values(snap.coordinates))
+
+    writer.array("footpaths.offsets", "I", snap.footpaths.offsets)
+    writer.array("footpaths.neighbors", "I", snap.footpaths.neighbors)
+    writer.array("footpaths.distance_m", "I", snap.footpaths.distance_m)
+    writer.array("footpaths.seconds", "I", snap.footpaths.seconds)
+
+    writer.array("join.odpt_keys", "I", (code(s) for pair in join.odpt_keys.items() for s in pair))
+    writer.rows("join.odpt_ids", "I", ([code(odpt_id) for odpt_id in ids] for ids in join.odpt_ids))
+    writer.rows("join.codes", "I", ([code(c) for c in codes] for codes in join.codes))
+    writer.array("join.names_ja", "I", (code(name) for name in join.names_ja))
+    writer.array("join.surveyed", "d", _coordinate_values(join.surveyed_coordinates))
+    writer.array("join.connections", "I", (sid for pair in join.connections for sid in pair))
+    writer.array("join.railway_ids", "i", (code(r) if r is not None else -1 for r in join.railway_ids))
+    writer.array("join.line_names_ja", "I", (code(name) for name in join.line_names_ja))
+
+
+def _add_timetables(writer: BundleWriter, store: TimetableStore) -> None:
+    code = writer.string
+    keys = array("I")
+    offsets = array("Q", [0])
+    columns = {name: array(typecode) for name, typecode in
+               (("minutes", "H"), ("trains", "I"), ("train_types", "I"), ("destinations", "I"))}
+    for (station, direction, calendar), table in store.tables.items():
+        keys.extend((code(station), code(direction), code(calendar), code(table.railway)))
+        for name, column in columns.items():
+            column.extend(getattr(table, name))
+        offsets.append(len(columns["minutes"]))
+    writer.array("timetables.keys", "I", keys)
+    writer.array("timetables.offsets", "Q", offsets)
+    for name, column in columns.items():
+        writer.array(f"timetables.{name}", column.typecode, column)
+    writer.strings("timetables.train_ids", store.train_ids.strings)
+    writer.strings("timetables.strings", store.strings.strings)
+
+
+def compile_bundle(data_dir: Path = Path("data"), path: Optional[Path] = None) -> Tuple[Path, int]:
+    """
+    Build the snapshot and timetables from the JSON files and write them as
+    a bundle (data_dir/network.bundle by default). Returns the path and size.
+    """
+    path = path or data_dir / BUNDLE_NAME
+    sources = source_mtimes(data_dir)
+    timetable_mtimes = timetable_sources(data_dir)
+    snap = build_snapshot(data_dir, 1)
+    transfers_path = data_dir / "transfers.json"
+    transfers = json.loads(transfers_path.read_text(encoding="utf-8")) if transfers_path.exists() else []
+
+    writer = BundleWriter()
+    _add_snapshot(writer, snap)
+    _add_timetables(writer, load_timetable_store(data_dir))
+    writer.json("meta", {
+        "byteorder": sys.byteorder,
+        "compiled_at": time.time(),
+        "sources": sources,
+        "timetable_sources": timetable_mtimes,
+        "network": snap.network,
+        "transfers": transfers,
+        "seconds_per_km": snap.seconds_per_km,
+    })
+    return path, writer.write(path)
+
+
+def snapshot_from_bundle(bundle: Bundle, version: int) -> NetworkSnapshot:
+    """A NetworkSnapshot over the bundle's arrays."""
+    meta = bundle.meta
+    names = bundle.names
+    network = meta["network"]
+
+    net = CompiledNetwork.from_arrays(
+        network,
+        station_keys=[names[c] for c in bundle.array("station.keys")],
+        station_names=[names[c] for c in bundle.array("station.names")],
+        offsets=bundle.copy("net.offsets"),
+        neighbors=bundle.copy("net.neighbors"),
+        edge_lines=bundle.copy("net.edge_lines"),
+        weights=bundle.copy("net.weights"),
+        reverse_edges=bundle.copy("net.reverse_edges"),
+        line_cumulative=bundle.rows("net.cumulative"),
+        line_cycle_seconds=bundle.array("net.cycle_seconds"),
+        through_services=zip(*[iter(bundle.array("net.through_services"))] * 3),
+    )
+
+    odpt_keys = bundle.array("join.odpt_keys")
+    join = JoinIndex.from_tables(
+        net.line_keys,
+        odpt_keys={names[odpt_keys[i]]: names[odpt_keys[i + 1]] for i in range(0, len(odpt_keys), 2)},
+        odpt_ids=[[names[c] for c in row] for row in bundle.rows("join.odpt_ids")],
+        codes=[[names[c] for c in row] for row in bundle.rows("join.codes")],
+        names_ja=[names[c] for c in bundle.array("join.names_ja")],
+        surveyed_coordinates=_coordinates(bundle.array("join.surveyed")),
+        connections=zip(*[iter(bundle.array("join.connections"))] * 2),
+        railway_ids=[names[c] if c >= 0 else None for c in bundle.array("join.railway_ids")],
+        line_names_ja=[names[c] for c in bundle.array("join.line_names_ja")],
+    )
+
+    coordinates = _coordinates(bundle.array("coordinates"))
+    footpaths = Footpaths.from_arrays(bundle.copy("footpaths.offsets"), bundle.copy("footpaths.neighbors"),
+                                      bundle.copy("footpaths.distance_m"), bundle.copy("footpaths.seconds"))
+    search_index = StationSearchIndex(
+        (key, [net.station_names[sid], key, join.names_ja[sid]])
+        for sid, key in enumerate(net.station_keys)
+    )
+    return NetworkSnapshot(
+        version=version,
+        built_at=time.time(),
+        sources=tuple(tuple(source) for source in meta["sources"]),
+        network=network,
+        net=net,
+        search_index=search_index,
+        join=join,
+        transfer_index=build_transfer_index(meta["transfers"]),
+        coordinates=coordinates,
+        seconds_per_km=meta["seconds_per_km"],
+        surveyed=frozenset(sid for sid, c in enumerate(join.surveyed_coordinates) if c is not None),
+        spatial_index=GridIndex(coordinates),
+        footpaths=footpaths,
+    )
+
+
+def timetables_from_bundle(bundle: Bundle) -> TimetableStore:
+    """A TimetableStore whose departure columns are views of the bundle."""
+    names = bundle.names
+    store = TimetableStore()
+    store.train_ids = bundle.strings("timetables.train_ids")
+    store.strings = bundle.strings("timetables.strings")
+    keys = bundle.array("timetables.keys")
+    offsets = bundle.array("timetables.offsets")
+    columns = [bundle.array(f"timetables.{name}") for name in ("minutes", "trains", "train_types", "destinations")]
+    for t in range(len(offsets) - 1):
+        start, end = offsets[t], offsets[t + 1]
+        station, direction, calendar, railway = (names[c] for c in keys[t * 4:t * 4 + 4])
+        store.tables[(station, direction, calendar)] = DepartureTable.from_arrays(
+            railway, *(column[start:end] for column in columns))
+    return store
+
+
+def _open_bundle(data_dir: Path) -> Optional[Bundle]:
+    path = data_dir / BUNDLE_NAME
+    if not path.exists():
+        return None
+    try:
+        return Bundle(path)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring {path}: {e}")
+        return None
+
+
+def load_snapshot(data_dir: Path, version: int) -> NetworkSnapshot:
+    """
+    The network snapshot from data_dir/network.bundle if it was compiled from
+    the current data files, else built from the JSON files.
+    """
+    bundle = _open_bundle(data_dir)
+    if bundle is not None:
+        if tuple(tuple(source) for source in bundle.meta["sources"]) == source_mtimes(data_dir):
+            return snapshot_from_bundle(bundle, version)
+        print(f"{data_dir / BUNDLE_NAME} is out of date; reading the JSON files (run scripts/compile_network.py)")
+    return build_snapshot(data_dir, version)
+
+
+def load_timetables(data_dir: Path = Path("data")) -> TimetableStore:
+    """Station timetables from the bundle if it is current, else parsed from the JSON files."""
+    bundle = _open_bundle(data_dir)
+    if bundle is not None:
+        recorded = [tuple(source) for source in bundle.meta["timetable_sources"]]
+        if recorded == timetable_sources(data_dir):
+            return timetables_from_bundle(bundle)
+    return load_timetable_store(data_dir)
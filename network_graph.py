@@ -0,0 +1,237 @@
+"""
+Compiled, integer-indexed form of the train network.
+
+network.json describes lines as ordered lists of station names. The route
+finder needs fast neighbor iteration, so the network is compiled once into
+interned station and line IDs with CSR (compressed sparse row) adjacency:
+the edges leaving station s are neighbors[offsets[s]:offsets[s + 1]], with the
+line and ride seconds of each edge in the parallel edge_lines/weights arrays.
+
+Ride times come from per-line cumulative-seconds tables, so the time between
+any two stations on a line is one subtraction regardless of how many stops
+lie between them.
+"""
+
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+
+def normalize_station(name: str) -> str:
+    """
+    Normalize a station name into its lookup key.
+
+    This is the one normalization shared by the graph, through-service and
+    transfer indexes: "Kotake mukaihara", "Kotake-Mukaihara" and
+    "kotake-mukaihara" all map to the same key.
+    """
+    key = name.lower().strip().replace("ō", "o").replace("ū", "u")
+    return "-".join(key.replace("_", " ").replace("-", " ").split())
+
+
+def line_pair(line_a, line_b) -> Tuple:
+    """Order-independent key for a pair of lines."""
+    return (line_a, line_b) if line_a <= line_b else (line_b, line_a)
+
+
+def iter_bits(bitset: int) -> Iterator[int]:
+    """Yield the indexes of the set bits of an integer bitset, lowest first."""
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+
+class CompiledNetwork:
+    """Immutable, array-backed train network with interned station and line IDs."""
+
+    def __init__(self, network: Dict[str, Any]):
+        self.station_keys: List[str] = []
+        self.station_names: List[str] = []
+        self.station_index: Dict[str, int] = {}
+        self.line_keys: List[str] = list(network.get("lines", {}).keys())
+        self.line_index: Dict[str, int] = {line_id: i for i, line_id in enumerate(self.line_keys)}
+        self.lines: Dict[str, Dict[str, Any]] = network.get("lines", {})
+
+        # Per line: station ID -> position, cumulative ride seconds from the
+        # first station at each position, and the full circuit time for loops
+        # (0 for linear lines).
+        self.line_positions: List[Dict[int, int]] = []
+        self.line_cumulative: List[array] = []
+        self.line_cycle_seconds: List[int] = []
+
+        distances = network.get("station_distances", {})
+        adjacency: List[set] = []
+        station_lines: List[int] = []
+
+        for line_idx, line_id in enumerate(self.line_keys):
+            line_data = self.lines[line_id]
+            ids = [self._intern_station(name, adjacency, station_lines) for name in line_data.get("stations", [])]
+            hop_seconds = line_hop_seconds(line_data, distances)
+            is_loop = line_data.get("type", "linear") == "loop" and len(ids) > 2
+
+            cumulative = array("I", [0])
+            for i, sid in enumerate(ids):
+                station_lines[sid] |= 1 << line_idx
+                if i > 0:
+                    adjacency[ids[i - 1]].add((sid, line_idx, hop_seconds))
+                    adjacency[sid].add((ids[i - 1], line_idx, hop_seconds))
+                    cumulative.append(cumulative[-1] + hop_seconds)
+
+            if is_loop:
+                adjacency[ids[0]].add((ids[-1], line_idx, hop_seconds))
+                adjacency[ids[-1]].add((ids[0], line_idx, hop_seconds))
+
+            self.line_positions.append({sid: i for i, sid in reversed(list(enumerate(ids)))})
+            self.line_cumulative.append(cumulative)
+            self.line_cycle_seconds.append(cumulative[-1] + hop_seconds if is_loop else 0)
+
+        self.offsets = array("I", [0])
+        self.neighbors = array("I")
+        self.edge_lines = array("H")
+        self.weights = array("I")
+        for edges in adjacency:
+            for neighbor, line_idx, seconds in sorted(edges):
+                self.neighbors.append(neighbor)
+                self.edge_lines.append(line_idx)
+                self.weights.append(seconds)
+            self.offsets.append(len(self.neighbors))
+
+        # reverse_edges[e] is the edge running the other way along edge e
+        edge_ids = {}
+        for station in range(len(adjacency)):
+            for e in range(self.offsets[station], self.offsets[station + 1]):
+                edge_ids[(station, self.neighbors[e], self.edge_lines[e])] = e
+        self.reverse_edges = array("I", (
+            edge_ids[(self.neighbors[e], station, self.edge_lines[e])]
+            for station in range(len(adjacency))
+            for e in range(self.offsets[station], self.offsets[station + 1])
+        ))
+
+        self.station_lines: Tuple[int, ...] = tuple(station_lines)
+        # The same as line ID tuples; searches iterate them for every label
+        self.station_line_ids: Tuple[Tuple[int, ...], ...] = tuple(tuple(iter_bits(b)) for b in station_lines)
+
+        # (station, line, line) triples, lines ordered, where trains run through
+        self.through_services: Set[Tuple[int, int, int]] = set()
+        for service in network.get("through_services", []):
+            station = self.station_index.get(normalize_station(service.get("connection_station", "")))
+            lines = [self.line_index[l] for l in service.get("lines", []) if l in self.line_index]
+            if station is None:
+                continue
+            for i, line_a in enumerate(lines):
+                for line_b in lines[i + 1:]:
+                    self.through_services.add((station, *line_pair(line_a, line_b)))
+
+    @classmethod
+    def from_arrays(cls, network: Dict[str, Any], station_keys: Sequence[str], station_names: Sequence[str],
+                    offsets: Sequence[int], neighbors: Sequence[int], edge_lines: Sequence[int],
+                    weights: Sequence[int], reverse_edges: Sequence[int], line_cumulative: Sequence[Sequence[int]],
+                    line_cycle_seconds: Sequence[int],
+                    through_services: Iterable[Tuple[int, int, int]]) -> "CompiledNetwork":
+        """
+        A network from the arrays an earlier compile of the same network
+        produced (see network_bundle), without building the graph again. The
+        arrays can be read-only views of a memory-mapped file; only the small
+        lookup dicts are rebuilt.
+        """
+        net = cls.__new__(cls)
+        net.station_keys = list(station_keys)
+        net.station_names = list(station_names)
+        net.station_index = {key: sid for sid, key in enumerate(net.station_keys)}
+        net.line_keys = list(network.get("lines", {}).keys())
+        net.line_index = {line_id: i for i, line_id in enumerate(net.line_keys)}
+        net.lines = network.get("lines", {})
+
+        net.line_positions = []
+        station_lines = [0] * len(net.station_keys)
+        for line_idx, line_id in enumerate(net.line_keys):
+            ids = [net.station_index[normalize_station(name)] for name in net.lines[line_id].get("stations", [])]
+            for sid in ids:
+                station_lines[sid] |= 1 << line_idx
+            net.line_positions.append({sid: i for i, sid in reversed(list(enumerate(ids)))})
+        net.station_lines = tuple(station_lines)
+        net.station_line_ids = tuple(tuple(iter_bits(b)) for b in station_lines)
+
+        net.line_cumulative = list(line_cumulative)
+        net.line_cycle_seconds = list(line_cycle_seconds)
+        net.offsets = offsets
+        net.neighbors = neighbors
+        net.edge_lines = edge_lines
+        net.weights = weights
+        net.reverse_edges = reverse_edges
+        net.through_services = set(through_services)
+        return net
+
+    def _intern_station(self, name: str, adjacency: List[set], station_lines: List[int]) -> int:
+        key = normalize_station(name)
+        sid = self.station_index.get(key)
+        if sid is None:
+            sid = len(self.station_keys)
+            self.station_index[key] = sid
+            self.station_keys.append(key)
+            self.station_names.append(name)
+            adjacency.append(set())
+            station_lines.append(0)
+        return sid
+
+    @property
+    def num_stations(self) -> int:
+        return len(self.station_keys)
+
+    def lines_at(self, station: int) -> Tuple[int, ...]:
+        """The line IDs serving a station, lowest first."""
+        return self.station_line_ids[station]
+
+    def edges(self, station: int) -> range:
+        """Range of edge indexes leaving a station."""
+        return range(self.offsets[station], self.offsets[station + 1])
+
+    def ride_seconds(self, from_station: int, to_station: int, line: int,
+                     next_station: Optional[int] = None) -> Optional[int]:
+        """
+        Ride seconds between two stations on the same line, or None if either
+        station is not on it. On loop lines the shorter direction is used,
+        unless next_station (the stop after from_station) fixes the direction.
+        """
+        positions = self.line_positions[line]
+        from_pos = positions.get(from_station)
+        to_pos = positions.get(to_station)
+        if from_pos is None or to_pos is None:
+            return None
+
+        cumulative = self.line_cumulative[line]
+        seconds = abs(cumulative[to_pos] - cumulative[from_pos])
+        cycle = self.line_cycle_seconds[line]
+        if not cycle:
+            return seconds
+
+        next_pos = positions.get(next_station) if next_station is not None else None
+        if next_pos is None:
+            return min(seconds, cycle - seconds)
+        # Travelling towards higher positions (wrapping from last to first)?
+        forward = next_pos == (from_pos + 1) % len(cumulative)
+        wraps = (to_pos < from_pos) if forward else (to_pos > from_pos)
+        return cycle - seconds if wraps else seconds
+
+    def has_through_service(self, station: int, line_a: int, line_b: int) -> bool:
+        """Check if trains run through between two lines at a station."""
+        return (station, *line_pair(line_a, line_b)) in self.through_services
+
+    def display_name(self, station: int) -> str:
+        return self.station_names[station].replace("-", " ")
+
+
+def line_hop_seconds(line_data: Dict[str, Any], distances: Dict[str, float]) -> int:
+    """Ride seconds for one stop on a line, using the average-speed model (with 30 s dwell)."""
+    avg_speed = line_data.get("avg_speed_kmh", 30)
+    avg_distance = distances.get("default_km", 1.2)
+    if line_data.get("type") == "loop":
+        avg_distance = distances.get("loop_station_km", 0.9)
+
+    time_seconds = int(avg_distance / avg_speed * 3600) + 30
+    return max(60, time_seconds)
+
+
+def compile_network(network: Dict[str, Any]) -> CompiledNetwork:
+    """Compile a network.json document into a CompiledNetwork."""
+    return CompiledNetwork(network)
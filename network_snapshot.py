@@ -0,0 +1,192 @@
+"""
+Immutable, hot-reloadable snapshots of the network data.
+
+Everything built from the data files (compiled graph, line metadata,
+station-name index, ODPT join index, transfer index) lives in one
+NetworkSnapshot that is never modified after it is built. The
+NetworkSnapshotManager publishes a new snapshot with a single reference
+assignment, so a query that took a snapshot keeps using it to the end while
+later queries see the new one. A background thread can poll the data files
+and rebuild when they change.
+"""
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, NamedTuple, Optional, Tuple
+
+from footpaths import Footpaths, build_footpaths
+from geo import GridIndex, LatLon, min_seconds_per_km, station_coordinates
+from network_graph import CompiledNetwork, compile_network
+from scoring import build_transfer_index
+from station_join import JoinIndex
+from station_search import StationSearchIndex
+
+# Files a snapshot is built from, relative to the data directory
+SNAPSHOT_SOURCES = ("network.json", "stations.json", "transfers.json", "train_lines.json")
+
+DEFAULT_POLL_SECONDS = 5.0
+
+
+class NetworkSnapshot(NamedTuple):
+    version: int
+    built_at: float
+    # (file name, mtime) of every source file, None for missing files
+    sources: Tuple[Tuple[str, Optional[float]], ...]
+    network: Dict[str, Any]
+    net: CompiledNetwork
+    search_index: StationSearchIndex
+    # ODPT IDs, Japanese names and station codes per station and line ID
+    join: JoinIndex
+    transfer_index: Dict[tuple, Dict]
+    # Position per station ID (None if unknown) and the fastest ride
+    # seconds per straight-line km, for distance-based lower bounds
+    coordinates: Tuple[Optional[LatLon], ...]
+    seconds_per_km: float
+    # Station IDs whose position comes from stations.json rather than
+    # interpolation, and a grid over all positions for nearest-station lookups
+    surveyed: FrozenSet[int]
+    spatial_index: GridIndex
+    # Walking links between differently named stations
+    footpaths: Footpaths
+
+
+def source_mtimes(data_dir: Path) -> Tuple[Tuple[str, Optional[float]], ...]:
+    """Modification times of the snapshot source files."""
+    mtimes = []
+    for name in SNAPSHOT_SOURCES:
+        path = data_dir / name
+        mtimes.append((name, path.stat().st_mtime if path.exists() else None))
+    return tuple(mtimes)
+
+
+def _read_json(path: Path, default: Any) -> Any:
+    if not path.exists():
+        return default
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def build_snapshot(data_dir: Path, version: int) -> NetworkSnapshot:
+    """Read the data files and build a complete snapshot."""
+    sources = source_mtimes(data_dir)
+    network = _read_json(data_dir / "network.json", {"lines": {}})
+    net = compile_network(network)
+
+    # stations.json and train_lines.json give ODPT IDs, Japanese names,
+    # coordinates and connections of our stations and lines
+    join = JoinIndex(net, _read_json(data_dir / "stations.json", []), _read_json(data_dir / "train_lines.json", []))
+
+    coordinates = tuple(station_coordinates(net, join.surveyed_by_key(net)))
+    surveyed = frozenset(sid for sid, c in enumerate(join.surveyed_coordinates) if c is not None)
+    spatial_index = GridIndex(coordinates)
+    footpaths = build_footpaths(net.num_stations, coordinates, surveyed, join.connections, spatial_index)
+    # Footpaths are edges too; the distance bound must not overestimate them
+    seconds_per_km = min(min_seconds_per_km(net, coordinates), footpaths.min_seconds_per_km(coordinates))
+
+    search_index = StationSearchIndex(
+        (key, [net.station_names[sid], key, join.names_ja[sid]])
+        for sid, key in enumerate(net.station_keys)
+    )
+
+    return NetworkSnapshot(
+        version=version,
+        built_at=time.time(),
+        sources=sources,
+        network=network,
+        net=net,
+        search_index=search_index,
+        join=join,
+        transfer_index=build_transfer_index(_read_json(data_dir / "transfers.json", [])),
+        coordinates=coordinates,
+        seconds_per_km=seconds_per_km,
+        surveyed=surveyed,
+        spatial_index=spatial_index,
+        footpaths=footpaths,
+    )
+
+
+class NetworkSnapshotManager:
+    """Builds, publishes and (optionally) watches network snapshots."""
+
+    def __init__(self, data_dir: Path = Path("data"),
+                 build: Callable[[Path, int], NetworkSnapshot] = build_snapshot):
+        self.data_dir = data_dir
+        # build(data_dir, version) makes a snapshot, e.g. build_snapshot or
+        # network_bundle.load_snapshot
+        self.build = build
+        self._snapshot: Optional[NetworkSnapshot] = None
+        self._build_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.last_error: Optional[str] = None
+
+    def current(self) -> NetworkSnapshot:
+        """The published snapshot, built on first use."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._build_lock:
+                if self._snapshot is None:
+                    self._snapshot = self.build(self.data_dir, 1)
+                snapshot = self._snapshot
+        return snapshot
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Rebuild the snapshot if the source files changed (or always, if
+        force). Returns True if a new snapshot was published. A failed build
+        keeps the current snapshot and records the error in last_error.
+        """
+        with self._build_lock:
+            current = self._snapshot
+            if current is not None and not force and source_mtimes(self.data_dir) == current.sources:
+                return False
+            try:
+                snapshot = self.build(self.data_dir, current.version + 1 if current else 1)
+            # Malformed data can fail in any way (a TypeError from a list
+            # where an object belongs, ...); none of them may end the watcher
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Network reload failed, keeping version {current.version if current else None}: {self.last_error}")
+                return False
+            self.last_error = None
+            # Publishing is a single reference assignment
+            self._snapshot = snapshot
+            print(f"Published network snapshot version {snapshot.version}")
+            return True
+
+    def start_watcher(self, poll_seconds: float = DEFAULT_POLL_SECONDS):
+        """Poll the source files in a daemon thread and reload on change."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+
+        def watch():
+            while not self._stop.wait(poll_seconds):
+                self.reload()
+
+        self._watcher = threading.Thread(target=watch, name="network-snapshot-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    @property
+    def watching(self) -> bool:
+        return self._watcher is not None and self._watcher.is_alive()
+
+    def status(self) -> Dict[str, Any]:
+        """Version, build time and sources of the published snapshot."""
+        snapshot = self.current()
+        return {
+            "version": snapshot.version,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(snapshot.built_at)),
+            "sources": {name: mtime for name, mtime in snapshot.sources},
+            "stations": snapshot.net.num_stations,
+            "lines": len(snapshot.net.line_keys),
+            "watching": self.watching,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,364 @@
+"""
+Concurrent, incremental download of ODPT datasets.
+
+OdptFetcher runs many requests at once on the event loop: every request is
+streamed in a worker thread over one pooled requests.Session, with at most
+`concurrency` in flight, requests spaced to `rate_per_second`, and retries
+with exponential backoff (or the server's Retry-After) on connection
+errors, 429 and 5xx responses.
+
+Responses are never held whole. iter_json_array() decodes the JSON array
+record by record as chunks arrive, and every record goes straight into an
+NdjsonStore: one record per line, keyed by owl:sameAs. A store remembers
+each record's dc:date, so a record that has not changed since the last
+fetch is not written again, and a fetch that changed nothing leaves the
+file (and its mtime, which the network bundle checks) untouched. Memory
+stays at one chunk and one record per request in flight, plus the store's
+index of IDs, however much is fetched.
+
+fetch_datasets() fetches everything the app uses: railways and stations
+(also exported as the JSON arrays the network is built from) and then the
+timetables of every station.
+"""
+
+import asyncio
+import codecs
+import json
+import os
+import random
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BASE = os.getenv('ODPT_BASE', 'https://api.odpt.org/api/v4')
+HEADERS = {'Accept': 'application/json'}
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RATE_PER_SECOND = 10.0
+DEFAULT_RETRIES = 4
+# Retry delays: BACKOFF_BASE_SECONDS doubling up to BACKOFF_MAX_SECONDS, with jitter
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# (connect, read) timeouts for one request; the read timeout is per chunk
+REQUEST_TIMEOUT = (5, 30)
+CHUNK_BYTES = 64 * 1024
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# (endpoint, NDJSON store, exported JSON array)
+DATASETS = [
+    ("odpt:Railway", "train_lines.ndjson", "train_lines.json"),
+    ("odpt:Station", "stations.ndjson", "stations.json"),
+]
+# Timetables of every station, read directly by the timetable loader
+TIMETABLES = "station_timetables.ndjson"
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Yield the elements of a JSON array from its bytes in arbitrary chunks,
+    each as soon as it is complete. Raises ValueError if the data is not a
+    JSON array or ends before the array does.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    for chunk in chunks:
+        buffer += text.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError(f"expected a JSON array, got {buffer[pos:pos + 80]!r}")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                value, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The element continues in the next chunk
+                break
+            yield value
+        buffer = buffer[pos:]
+    raise ValueError("response ended inside the JSON array")
+
+
+def record_id(record: Dict[str, Any]) -> str:
+    return record.get("owl:sameAs") or record.get("@id", "")
+
+
+class NdjsonStore:
+    """
+    ODPT records in a newline-delimited JSON file, one per ID, updated in
+    place by a fetch.
+
+    Records are put() while the store is open (from any thread); a record
+    whose dc:date matches the one in the file is only marked as seen.
+    close() writes the new file: changed records as they were put, the
+    unchanged ones copied over line by line from the old file. Records the
+    fetch did not see are dropped if it was complete, kept otherwise.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.tmp_path = path.with_name(path.name + ".tmp")
+        # ID -> (dc:date, byte offset, byte length) of its line in the old file
+        self._index: Dict[str, Tuple[Optional[str], int, int]] = {}
+        if path.exists():
+            offset = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._index[record_id(record)] = (record.get("dc:date"), offset, len(line))
+                    offset += len(line)
+        self._seen = set()
+        # Seen IDs whose line is carried over from the old file
+        self._unchanged = set()
+        self._lock = threading.Lock()
+        self._out = open(self.tmp_path, "wb")
+        self.written = 0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def unchanged(self) -> int:
+        return len(self._unchanged)
+
+    def put(self, record: Dict[str, Any]) -> bool:
+        """Store one record; False if it is unchanged (or was already put by this fetch)."""
+        key = record_id(record)
+        old = self._index.get(key)
+        line = None
+        if old is None or old[0] is None or old[0] != record.get("dc:date"):
+            line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            if line is None:
+                self._unchanged.add(key)
+                return False
+            self._out.write(line)
+            self.written += 1
+            return True
+
+    def close(self, complete: bool = True) -> bool:
+        """Replace the file if anything changed. Returns True if it did."""
+        with self._lock:
+            dropped = complete and any(key not in self._seen for key in self._index)
+            if not self.written and not dropped and self.path.exists():
+                self._out.close()
+                self.tmp_path.unlink()
+                return False
+            carried = sorted(entry[1:] for key, entry in self._index.items()
+                             if key in self._unchanged or (not complete and key not in self._seen))
+            if carried:
+                with open(self.path, "rb") as old:
+                    for offset, length in carried:
+                        old.seek(offset)
+                        self._out.write(old.read(length))
+            self._out.close()
+            os.replace(self.tmp_path, self.path)
+            return True
+
+    def abort(self):
+        """Discard everything put since the store was opened."""
+        with self._lock:
+            self._out.close()
+            self.tmp_path.unlink(missing_ok=True)
+
+    def export_json(self, path: Path):
+        """Write the records as one compact JSON array, streaming them from the file."""
+        tmp = path.with_name(path.name + ".tmp")
+        with open(self.path, "rb") as source, open(tmp, "wb") as out:
+            out.write(b"[")
+            first = True
+            for line in source:
+                line = line.strip()
+                if line:
+                    out.write(line if first else b",\n" + line)
+                    first = False
+            out.write(b"]\n")
+        os.replace(tmp, path)
+
+
+def read_ndjson(path: Path) -> Iterator[Dict[str, Any]]:
+    """The records of a newline-delimited JSON file, one at a time."""
+    if not path.exists():
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class FetchFailed(Exception):
+    """A request that failed for good (after any retries)."""
+
+
+class _Retryable(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Spaces calls to wait() at least 1 / rate_per_second apart."""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+class OdptFetcher:
+    """Fetches ODPT endpoints concurrently into NdjsonStores."""
+
+    def __init__(self, base: str = BASE, token: Optional[str] = None, concurrency: int = DEFAULT_CONCURRENCY,
+                 rate_per_second: float = DEFAULT_RATE_PER_SECOND, retries: int = DEFAULT_RETRIES,
+                 session: Optional[requests.Session] = None):
+        self.base = base
+        self.token = token
+        self.retries = retries
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate_per_second)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.requests = 0
+        self.retried = 0
+        self.failures: List[str] = []
+
+    def _stream(self, endpoint: str, params: Dict[str, str], store: NdjsonStore) -> int:
+        """One streamed GET into store (in a worker thread); the number of records. Raises on failure."""
+        query = dict(params)
+        if self.token:
+            query["acl:consumerKey"] = self.token
+        try:
+            with self.session.get(f"{self.base}/{endpoint}", params=query, headers=HEADERS,
+                                  timeout=REQUEST_TIMEOUT, stream=True) as response:
+                if response.status_code in RETRY_STATUSES:
+                    raise _Retryable(f"HTTP {response.status_code}", _retry_after(response))
+                if response.status_code >= 400:
+                    raise FetchFailed(f"HTTP {response.status_code}")
+                count = 0
+                for record in iter_json_array(response.iter_content(CHUNK_BYTES)):
+                    store.put(record)
+                    count += 1
+                return count
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            raise _Retryable(f"{type(e).__name__}: {e}")
+        except ValueError as e:
+            # A truncated body is retried; anything else is not ODPT data
+            if "ended inside" in str(e):
+                raise _Retryable(str(e))
+            raise FetchFailed(str(e))
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before retry number attempt (1-based)."""
+        if retry_after is not None:
+            return min(retry_after, BACKOFF_MAX_SECONDS)
+        delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempt - 1), BACKOFF_MAX_SECONDS)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def fetch(self, endpoint: str, store: NdjsonStore, params: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Fetch one endpoint into store, retrying transient failures. Returns
+        False (and records the failure) if it failed for good.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        params = params or {}
+        what = f"{endpoint} {params}" if params else endpoint
+        for attempt in range(self.retries + 1):
+            await self.limiter.wait()
+            try:
+                async with self._semaphore:
+                    self.requests += 1
+                    await asyncio.to_thread(self._stream, endpoint, params, store)
+                return True
+            except _Retryable as e:
+                if attempt == self.retries:
+                    self.failures.append(f"{what}: {e} (after {attempt + 1} attempts)")
+                    return False
+                self.retried += 1
+                await asyncio.sleep(self.backoff(attempt + 1, e.retry_after))
+            except FetchFailed as e:
+                self.failures.append(f"{what}: {e}")
+                return False
+        return False
+
+    async def fetch_all(self, endpoint: str, store: NdjsonStore, param: str, values: Iterable[str]) -> int:
+        """Fetch endpoint once per value of param (e.g. per station), concurrently. Returns the failures."""
+        results = await asyncio.gather(*(self.fetch(endpoint, store, {param: value}) for value in values))
+        return results.count(False)
+
+    def close(self):
+        self.session.close()
+
+
+def _report(name: str, store: NdjsonStore, changed: bool):
+    state = "updated" if changed else "unchanged"
+    print(f"{name}: {store.written} records written, {store.unchanged} unchanged ({state})")
+
+
+async def fetch_datasets(fetcher: OdptFetcher, data_dir: Path, timetables: bool = True) -> bool:
+    """Fetch every dataset into data_dir; False if any request failed for good."""
+    for endpoint, name, export in DATASETS:
+        print(f"Fetching {endpoint}...")
+        store = NdjsonStore(data_dir / name)
+        try:
+            ok = await fetcher.fetch(endpoint, store)
+        except BaseException:
+            store.abort()
+            raise
+        changed = store.close(complete=ok)
+        _report(name, store, changed)
+        if changed or not (data_dir / export).exists():
+            store.export_json(data_dir / export)
+            print(f"Saved {data_dir / export}")
+
+    if timetables:
+        stations = [record_id(station) for station in read_ndjson(data_dir / "stations.ndjson")]
+        print(f"Fetching odpt:StationTimetable for {len(stations)} stations...")
+        store = NdjsonStore(data_dir / TIMETABLES)
+        try:
+            failed = await fetcher.fetch_all("odpt:StationTimetable", store, "odpt:station", stations)
+        except BaseException:
+            store.abort()
+            raise
+        _report(TIMETABLES, store, store.close(complete=not failed))
+
+    for failure in fetcher.failures:
+        print(f"Failed: {failure}")
+    return not fetcher.failures
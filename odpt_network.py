@@ -0,0 +1,312 @@
+"""
+Routing network generated from ODPT railway data.
+
+network.json is maintained by hand. build_network() derives the same kind
+of document from the odpt:Railway station orders in train_lines.json, so
+every railway ODPT describes can be routed over:
+
+- each railway with an odpt:stationOrder becomes a line (keyed by its
+  railway ID, like the hand-written lines) with its stations in odpt:index
+  order. An order that returns to its first station is a loop; if it goes
+  on from there (the Oedo line's "6" shape) the rest becomes a second
+  "<line>Branch" line with through service to the loop;
+- stations are named by their English title without annotations, and
+  platforms of different railways whose titles fold to the same name and
+  lie within HOMONYM_KM of each other are one station, so changing between
+  them is a transfer. Where network.json already names a station that name
+  is kept, so transfers.json still applies. Same-named stations further
+  apart stay separate, with the operator appended to the later one;
+- lines of the base network that ODPT gives no station order for are kept,
+  and so are its through services (while their lines and station exist),
+  transfer times and distance model.
+
+Links between differently named stations (odpt:connectingStation) need no
+edges here: the network snapshot turns them into footpaths.
+
+build_network() also returns a NetworkReport of what it generated, kept,
+renamed and dropped, and how well the result is connected.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from geo import LatLon, haversine_km
+from network_graph import normalize_station
+from station_join import station_fold, station_title
+
+# Same-named stations further apart than this are different stations
+HOMONYM_KM = 3.0
+# Line attributes for railways network.json does not describe
+DEFAULT_AVG_SPEED_KMH = 30
+DEFAULT_COLOR = "#666666"
+BRANCH_SUFFIX = "Branch"
+
+
+def _suffix(odpt_id: str) -> str:
+    return odpt_id.split(":", 1)[-1]
+
+
+class NetworkReport:
+    """What build_network() did, and what may need a look."""
+
+    def __init__(self):
+        self.generated_lines: List[str] = []
+        self.kept_lines: List[str] = []
+        # Railways without a station order that network.json does not have either
+        self.skipped_railways: List[str] = []
+        self.default_speed_lines: List[str] = []
+        # Loop lines split off a tail, and orders cut short at an irregular repeat
+        self.split_lines: List[str] = []
+        self.truncated_lines: Dict[str, List[str]] = {}
+        # Station order entries stations.json does not list
+        self.unknown_stations: List[str] = []
+        # Names given to same-named stations far from the first one
+        self.homonyms: List[str] = []
+        self.dropped_through_services: List[str] = []
+        # Generated lines whose stations differ from network.json: added / removed names
+        self.changed_lines: Dict[str, Dict[str, List[str]]] = {}
+        self.stations = 0
+        self.edges = 0
+        # connectingStation pairs between differently named stations (footpaths)
+        # and pairs with an end on no line
+        self.footpath_connections = 0
+        self.unresolved_connections = 0
+        # Sizes of the connected components (rides and footpaths), largest first
+        self.components: List[int] = []
+
+    def warnings(self) -> List[str]:
+        warnings = []
+        if len(self.components) > 1:
+            warnings.append(f"{len(self.components)} disconnected components; "
+                            f"smaller ones have {self.components[1:]} stations")
+        for line, dropped in self.truncated_lines.items():
+            warnings.append(f"{line}: station order revisits a station; dropped {', '.join(dropped)}")
+        for name in self.homonyms:
+            warnings.append(f"same-named station far apart: {name}")
+        for service in self.dropped_through_services:
+            warnings.append(f"dropped through service: {service}")
+        if self.unknown_stations:
+            warnings.append(f"{len(self.unknown_stations)} station order entries missing from stations.json")
+        if self.default_speed_lines:
+            warnings.append(f"{len(self.default_speed_lines)} lines use the default "
+                            f"{DEFAULT_AVG_SPEED_KMH} km/h: {', '.join(self.default_speed_lines)}")
+        return warnings
+
+    def to_dict(self) -> Dict[str, Any]:
+        report = dict(vars(self))
+        report["warnings"] = self.warnings()
+        return report
+
+    def format(self) -> str:
+        lines = [
+            f"{len(self.generated_lines)} lines generated from station orders, "
+            f"{len(self.kept_lines)} kept from network.json, {len(self.skipped_railways)} railways skipped",
+            f"{self.stations} stations, {self.edges} ride edges, {self.footpath_connections} connections "
+            f"left to footpaths ({self.unresolved_connections} unresolved)",
+        ]
+        for line, change in sorted(self.changed_lines.items()):
+            lines.append(f"{line}: +{change['added']} -{change['removed']} against network.json")
+        lines.extend(f"warning: {warning}" for warning in self.warnings())
+        return "\n".join(lines)
+
+
+class _StationNames:
+    """Assigns one name per physical station across railways."""
+
+    def __init__(self, base_names: Dict[str, str], report: NetworkReport):
+        # station_fold -> name network.json uses for it
+        self.base_names = base_names
+        self.report = report
+        # station_fold -> [(name, position)] of the stations already named
+        self.places: Dict[str, List[Tuple[str, Optional[LatLon]]]] = defaultdict(list)
+
+    def name(self, title: str, position: Optional[LatLon], operator: str) -> str:
+        folded = station_fold(title)
+        places = self.places[folded]
+        for name, at in places:
+            if at is None or position is None or haversine_km(at, position) <= HOMONYM_KM:
+                if at is None and position is not None:
+                    places[places.index((name, at))] = (name, position)
+                return name
+        if places:
+            # A third far-away namesake from the same operator needs a counter,
+            # or both would merge into one graph node
+            taken = {name for name, _ in places}
+            name = f"{title} ({operator})"
+            count = 1
+            while name in taken:
+                count += 1
+                name = f"{title} ({operator} {count})"
+            self.report.homonyms.append(name)
+        else:
+            name = self.base_names.get(folded, title)
+        places.append((name, position))
+        return name
+
+
+def _ordered_stations(railway: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return sorted(railway.get("odpt:stationOrder") or [], key=lambda entry: entry.get("odpt:index", 0))
+
+
+def _split_order(key: str, names: List[str], report: NetworkReport) -> Tuple[List[str], List[str], bool]:
+    """(main stations, branch stations, main is a loop) for a station order that may revisit a station."""
+    seen = {}
+    for i, name in enumerate(names):
+        if name in seen:
+            first = seen[name]
+            if first == 0:
+                if len(names) - i > 1:
+                    report.split_lines.append(key)
+                return names[:i], names[i:] if len(names) - i > 1 else [], True
+            report.truncated_lines[key] = names[i:]
+            return names[:i], [], False
+        seen[name] = i
+    return names, [], False
+
+
+def build_network(railways: Iterable[Dict[str, Any]], stations: Iterable[Dict[str, Any]],
+                  base: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], NetworkReport]:
+    """
+    A network.json document generated from odpt:Railway records (with
+    station orders) and odpt:Station records, on top of an optional base
+    network.json document. Returns the document and its report.
+    """
+    base = base or {"lines": {}}
+    base_lines = base.get("lines", {})
+    report = NetworkReport()
+    records = {station.get("owl:sameAs"): station for station in stations}
+
+    base_names = {}
+    for line in base_lines.values():
+        for name in line.get("stations", []):
+            base_names.setdefault(station_fold(name), name)
+    names = _StationNames(base_names, report)
+    # ODPT station ID -> generated station name
+    station_names: Dict[str, str] = {}
+
+    lines: Dict[str, Dict[str, Any]] = {}
+    through_services: List[Dict[str, Any]] = []
+    for railway in railways:
+        key = _suffix(railway.get("owl:sameAs", ""))
+        order = _ordered_stations(railway)
+        if len(order) < 2:
+            if key and key not in base_lines:
+                report.skipped_railways.append(key)
+            continue
+
+        operator = _suffix(railway.get("odpt:operator", ""))
+        ordered_names = []
+        for entry in order:
+            odpt_id = entry.get("odpt:station", "")
+            record = records.get(odpt_id)
+            if record is None:
+                report.unknown_stations.append(odpt_id)
+            title = ((entry.get("odpt:stationTitle") or {}).get("en")
+                     or ((record or {}).get("odpt:stationTitle") or {}).get("en")
+                     or _suffix(odpt_id).split(".")[-1])
+            position = None
+            if record is not None and record.get("geo:lat") is not None and record.get("geo:long") is not None:
+                position = (record["geo:lat"], record["geo:long"])
+            name = names.name(station_title(title), position, operator)
+            station_names[odpt_id] = name
+            if not ordered_names or ordered_names[-1] != name:
+                ordered_names.append(name)
+
+        main, branch, is_loop = _split_order(key, ordered_names, report)
+        base_line = base_lines.get(key, {})
+        title = railway.get("odpt:railwayTitle") or {}
+        line = {
+            "name": base_line.get("name") or (title.get("en") or key).replace(" line", " Line"),
+            "name_ja": base_line.get("name_ja") or title.get("ja", ""),
+            "color": base_line.get("color") or railway.get("odpt:color") or DEFAULT_COLOR,
+            "type": "loop" if is_loop else "linear",
+            "operator": base_line.get("operator") or operator,
+            "avg_speed_kmh": base_line.get("avg_speed_kmh", DEFAULT_AVG_SPEED_KMH),
+            "stations": main,
+        }
+        if "avg_speed_kmh" not in base_line:
+            report.default_speed_lines.append(key)
+        lines[key] = line
+        report.generated_lines.append(key)
+        if base_line:
+            old = {station_fold(name) for name in base_line.get("stations", [])}
+            new = {station_fold(name) for name in main}
+            added = [name for name in main if station_fold(name) not in old]
+            removed = [name for name in base_line.get("stations", []) if station_fold(name) not in new]
+            if added or removed:
+                report.changed_lines[key] = {"added": added, "removed": removed}
+
+        if branch:
+            branch_key = key + BRANCH_SUFFIX
+            lines[branch_key] = {**line, "name": f"{line['name']} ({branch[-1]} branch)", "type": "linear",
+                                 "stations": branch}
+            report.generated_lines.append(branch_key)
+            through_services.append({"name": f"{line['name']} through service", "lines": [key, branch_key],
+                                     "connection_station": branch[0],
+                                     "description": "Trains run between the loop and the branch"})
+
+    for key, line in base_lines.items():
+        if key not in lines:
+            lines[key] = {**line, "stations": [base_names.get(station_fold(name), name)
+                                               for name in line.get("stations", [])]}
+            report.kept_lines.append(key)
+
+    line_keys = {key: {normalize_station(name) for name in line["stations"]} for key, line in lines.items()}
+    for service in base.get("through_services", []):
+        station = base_names.get(station_fold(service.get("connection_station", "")),
+                                 service.get("connection_station", ""))
+        if all(normalize_station(station) in line_keys.get(key, ()) for key in service.get("lines", [])):
+            through_services.append({**service, "connection_station": station})
+        else:
+            report.dropped_through_services.append(service.get("name", str(service.get("lines"))))
+
+    _check_connectivity(lines, records, station_names, report)
+
+    network = {key: value for key, value in base.items() if key not in ("lines", "through_services")}
+    network["lines"] = lines
+    network["through_services"] = through_services
+    return network, report
+
+
+def _check_connectivity(lines: Dict[str, Dict[str, Any]], records: Dict[str, Dict[str, Any]],
+                        station_names: Dict[str, str], report: NetworkReport):
+    """Count stations, edges and connected components, counting connectingStation links as footpaths."""
+    parent: Dict[str, str] = {}
+
+    def find(key: str) -> str:
+        while parent.setdefault(key, key) != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    def union(a: str, b: str):
+        parent[find(a)] = find(b)
+
+    edges = set()
+    for line in lines.values():
+        keys = [normalize_station(name) for name in line["stations"]]
+        for a, b in zip(keys, keys[1:] + (keys[:1] if line.get("type") == "loop" else [])):
+            find(a)
+            union(a, b)
+            edges.add((min(a, b), max(a, b)))
+        for key in keys:
+            find(key)
+
+    for odpt_id, record in records.items():
+        if odpt_id not in station_names:
+            continue
+        for other in record.get("odpt:connectingStation", []):
+            if other not in station_names:
+                report.unresolved_connections += 1
+                continue
+            a, b = normalize_station(station_names[odpt_id]), normalize_station(station_names[other])
+            if a != b:
+                report.footpath_connections += 1
+                union(a, b)
+
+    sizes = defaultdict(int)
+    for key in parent:
+        sizes[find(key)] += 1
+    report.stations = len(parent)
+    report.edges = len(edges)
+    report.components = sorted(sizes.values(), reverse=True)
@@ -0,0 +1,258 @@
+"""
+RAPTOR (Round-bAsed Public Transit Optimized Router) over ODPT timetables.
+
+Station timetables list departures per station; grouping them by train gives
+each train's stop sequence. Trains with the same line and stop sequence form
+a RAPTOR route whose trips are kept in FIFO order, so the earliest trip that
+can be caught at any stop is a binary search down that stop's column.
+
+Round k of the search finds the earliest arrival at every stop using at
+most k trips, so the rounds that improve the destination give the Pareto set
+of (arrival time, number of transfers). Arrive-by queries run the same search
+over a time-reversed copy of the timetable.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from timetable import TimetableStore
+
+# Minimum time to change trains at a station
+MIN_TRANSFER_SECONDS = 120
+
+INFINITY = float("inf")
+
+
+class Leg(NamedTuple):
+    line: str
+    from_stop: str
+    to_stop: str
+    departure: int
+    arrival: int
+    train: str
+
+
+class Journey(NamedTuple):
+    departure: int
+    arrival: int
+    legs: List[Leg]
+
+
+class RaptorRoute:
+    """Trips sharing one line and stop sequence, in FIFO order."""
+
+    def __init__(self, line: str, stops: Tuple[str, ...]):
+        self.line = line
+        self.stops = stops
+        self.trains: List[str] = []
+        # columns[pos][trip] is the departure of that trip at stop pos
+        self.columns: List[List[int]] = [[] for _ in stops]
+
+    def can_append(self, times: List[int]) -> bool:
+        """A trip can join if it does not overtake the last trip anywhere."""
+        return not self.trains or all(column[-1] <= t for column, t in zip(self.columns, times))
+
+    def append(self, train: str, times: List[int]):
+        self.trains.append(train)
+        for column, t in zip(self.columns, times):
+            column.append(t)
+
+    def earliest_trip(self, pos: int, ready: int) -> Optional[int]:
+        """Index of the first trip leaving stop pos at or after ready."""
+        trip = bisect_left(self.columns[pos], ready)
+        return trip if trip < len(self.trains) else None
+
+    def time(self, trip: int, pos: int) -> int:
+        return self.columns[pos][trip]
+
+
+class TimetableNetwork:
+    """RAPTOR routes and the stop -> (route, position) index for one calendar."""
+
+    def __init__(self, trips: List[Tuple[str, str, List[Tuple[int, str]]]]):
+        """trips is a list of (train, line, [(time, stop), ...]) in stop order."""
+        patterns: Dict[Tuple[str, Tuple[str, ...]], List[Tuple[List[int], str]]] = defaultdict(list)
+        for train, line, stop_times in trips:
+            stops = tuple(stop for _t, stop in stop_times)
+            patterns[(line, stops)].append(([t for t, _stop in stop_times], train))
+
+        self.routes: List[RaptorRoute] = []
+        for (line, stops), pattern_trips in patterns.items():
+            pattern_trips.sort()
+            lanes: List[RaptorRoute] = []
+            for times, train in pattern_trips:
+                lane = next((r for r in lanes if r.can_append(times)), None)
+                if lane is None:
+                    lane = RaptorRoute(line, stops)
+                    lanes.append(lane)
+                lane.append(train, times)
+            self.routes.extend(lanes)
+
+        self.routes_at: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for r, route in enumerate(self.routes):
+            for pos, stop in enumerate(route.stops):
+                self.routes_at[stop].append((r, pos))
+
+        self._trips = trips
+        self._reversed: Optional["TimetableNetwork"] = None
+
+    def has_stop(self, stop: str) -> bool:
+        return stop in self.routes_at
+
+    def reversed(self) -> "TimetableNetwork":
+        """The same timetable run backwards in time, for arrive-by queries."""
+        if self._reversed is None:
+            self._reversed = TimetableNetwork([
+                (train, line, [(-t, stop) for t, stop in reversed(stop_times)])
+                for train, line, stop_times in self._trips
+            ])
+        return self._reversed
+
+
+def build_timetable_network(store: TimetableStore, calendar: str, stop_key: Callable[[str], str]) -> TimetableNetwork:
+    """
+    Build a TimetableNetwork from the store's tables for one calendar.
+    stop_key maps an ODPT station ID to the stop key to route on.
+    """
+    by_train: Dict[int, List[Tuple[int, str]]] = defaultdict(list)
+    train_lines: Dict[int, str] = {}
+
+    for (station, _direction, _calendar), table in store.tables_for(calendar):
+        stop = stop_key(station)
+        for minute, train in zip(table.minutes, table.trains):
+            by_train[train].append((minute * 60, stop))
+            train_lines[train] = table.railway
+
+    trips = []
+    for train, stop_times in by_train.items():
+        stop_times.sort()
+        deduped = [stop_times[0]]
+        for time, stop in stop_times[1:]:
+            if stop != deduped[-1][1]:
+                deduped.append((time, stop))
+        if len(deduped) > 1:
+            trips.append((store.train_ids[train], train_lines[train], deduped))
+
+    return TimetableNetwork(trips)
+
+
+def _rounds(network: TimetableNetwork, origin: str, departure: int, max_rounds: int, transfer_seconds: int,
+            destination: Optional[str] = None) -> Iterator[Tuple[int, List[Dict], Dict[str, int]]]:
+    """
+    Run RAPTOR rounds from origin, yielding (k, parents, best) after each
+    round. parents[k] maps the stops improved in round k to how they were
+    reached; best is the earliest arrival per stop so far. With a
+    destination, stops reached after the destination's arrival are pruned.
+    """
+    # arrivals[k] is the earliest arrival per stop using at most k trips;
+    # parents[k] records how the stops improved in round k were reached.
+    arrivals: List[Dict[str, int]] = [{origin: departure}]
+    parents: List[Dict[str, Tuple[int, int, int, int]]] = [{}]
+    best: Dict[str, int] = {origin: departure}
+    marked = {origin}
+
+    for k in range(1, max_rounds + 1):
+        previous = arrivals[k - 1]
+        current: Dict[str, int] = dict(previous)
+        parent: Dict[str, Tuple[int, int, int, int]] = {}
+        arrivals.append(current)
+        parents.append(parent)
+
+        # Each route is scanned once, from its earliest marked stop
+        queue: Dict[int, int] = {}
+        for stop in marked:
+            for r, pos in network.routes_at[stop]:
+                if pos < queue.get(r, len(network.routes[r].stops)):
+                    queue[r] = pos
+
+        marked = set()
+        for r, start in queue.items():
+            route = network.routes[r]
+            trip = None
+            board_pos = start
+            for pos in range(start, len(route.stops)):
+                stop = route.stops[pos]
+
+                if trip is not None:
+                    arrival = route.time(trip, pos)
+                    if arrival < min(best.get(stop, INFINITY), best.get(destination, INFINITY)):
+                        current[stop] = arrival
+                        best[stop] = arrival
+                        parent[stop] = (r, trip, board_pos, pos)
+                        marked.add(stop)
+
+                reached = previous.get(stop)
+                if reached is not None:
+                    ready = reached + (transfer_seconds if k > 1 else 0)
+                    if trip is None or ready <= route.time(trip, pos):
+                        earlier = route.earliest_trip(pos, ready)
+                        if earlier is not None and (trip is None or earlier < trip):
+                            trip = earlier
+                            board_pos = pos
+
+        yield k, parents, best
+        if not marked:
+            break
+
+
+def earliest_arrival(network: TimetableNetwork, origin: str, destination: str, departure: int,
+                     max_rounds: int = 4, transfer_seconds: int = MIN_TRANSFER_SECONDS) -> List[Journey]:
+    """
+    Journeys leaving origin at or after departure, one per number of trips
+    that improves the arrival time at destination, earliest arrival last.
+    """
+    if not network.has_stop(origin) or not network.has_stop(destination) or origin == destination:
+        return []
+
+    journeys = []
+    for k, parents, _best in _rounds(network, origin, departure, max_rounds, transfer_seconds, destination):
+        if destination in parents[k]:
+            journeys.append(_unwind(network, parents, destination, k))
+    return journeys
+
+
+def earliest_arrivals(network: TimetableNetwork, origin: str, departure: int, max_rounds: int = 4,
+                      transfer_seconds: int = MIN_TRANSFER_SECONDS) -> Dict[str, Tuple[int, int]]:
+    """
+    One-to-all search: the earliest (arrival, trips) at every stop reachable
+    from origin when leaving at or after departure.
+    """
+    reached: Dict[str, Tuple[int, int]] = {}
+    if not network.has_stop(origin):
+        return reached
+    for k, parents, best in _rounds(network, origin, departure, max_rounds, transfer_seconds):
+        for stop in parents[k]:
+            reached[stop] = (best[stop], k)
+    return reached
+
+
+def latest_departure(network: TimetableNetwork, origin: str, destination: str, arrival: int,
+                     max_rounds: int = 4, transfer_seconds: int = MIN_TRANSFER_SECONDS) -> List[Journey]:
+    """Journeys reaching destination by arrival, leaving origin as late as possible."""
+    backwards = earliest_arrival(network.reversed(), destination, origin, -arrival, max_rounds, transfer_seconds)
+    journeys = []
+    for journey in backwards:
+        legs = [
+            Leg(leg.line, leg.to_stop, leg.from_stop, -leg.arrival, -leg.departure, leg.train)
+            for leg in reversed(journey.legs)
+        ]
+        journeys.append(Journey(legs[0].departure, legs[-1].arrival, legs))
+    return journeys
+
+
+def _unwind(network: TimetableNetwork, parents: List[Dict], stop: str, k: int) -> Journey:
+    legs = []
+    while k > 0 and stop in parents[k]:
+        r, trip, board_pos, alight_pos = parents[k][stop]
+        route = network.routes[r]
+        board_stop = route.stops[board_pos]
+        legs.append(Leg(route.line, board_stop, stop, route.time(trip, board_pos),
+                        route.time(trip, alight_pos), route.trains[trip]))
+        stop = board_stop
+        k -= 1
+        # The boarding stop may have been reached in an earlier round
+        while k > 0 and stop not in parents[k]:
+            k -= 1
+    legs.reverse()
+    return Journey(legs[0].departure, legs[-1].arrival, legs)
@@ -1,9 +1,28 @@
+"""
+Realtime train information from the ODPT API.
+
+A TrainInformationPoller refreshes odpt:TrainInformation in the background
+on the server's event loop and keeps the processed result in memory as an
+immutable TrainInformationSnapshot. Request handlers only read the current
+snapshot and never wait on the network: when a refresh is late or failing
+they keep getting the last good data (stale-while-revalidate), and status()
+reports how old it is.
+
+Refreshes reuse one pooled requests.Session, send If-None-Match /
+If-Modified-Since so an unchanged feed costs a 304 without a body, and back
+off exponentially after failures. Listeners registered with add_listener()
+are called on the event loop with every new snapshot.
+"""
+
+import asyncio
 import os
-import json
-from pathlib import Path
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
 import requests
 from dotenv import load_dotenv
-import time
+
+from line_status import LineStatus, line_statuses
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,21 +33,37 @@ TOKEN = os.getenv('ODPT_TOKEN')
 if not TOKEN:
     raise SystemExit('Set ODPT_TOKEN in .env')
 
-import tempfile
+# Define headers for the API request
+HEADERS = {'Accept': 'application/json'}
+
+# Seconds between refreshes while the feed is healthy
+REFRESH_SECONDS = 60
+# Data older than this is reported as stale (it is still served)
+STALE_AFTER_SECONDS = 5 * 60
+# Retry delays after failures: BACKOFF_BASE_SECONDS doubling up to BACKOFF_MAX_SECONDS
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 10 * 60
+# (connect, read) timeouts for one request
+REQUEST_TIMEOUT = (5, 15)
 
-# ... (existing imports) ...
 
-# Define the directory for storing data
-# Use tempfile.gettempdir() for cross-platform temporary directory
-TMP_DIR = Path(tempfile.gettempdir())
+class TrainInformationSnapshot(NamedTuple):
+    # Incremented whenever the feed content changes; 0 before the first fetch
+    version: int
+    # Wall-clock time the content was last fetched or revalidated
+    fetched_at: Optional[float]
+    # TrainInformation ID (odpt.TrainInformation:...) -> Japanese status text
+    info: Dict[str, str]
+    # The raw odpt:TrainInformation records
+    items: Tuple[Dict[str, Any], ...]
+    # Parsed status per line ID (e.g. "TokyoMetro.Ginza")
+    statuses: Dict[str, LineStatus]
 
-# Define headers for the API request
-HEADERS = {'Accept': 'application/json'}
-CACHE_FILE = TMP_DIR / 'train_information.json'
-RAW_CACHE_FILE = TMP_DIR / 'train_information_raw.json'
-CACHE_DURATION_SECONDS = 5 * 60  # 5 minutes
 
-def _process_train_info_to_dict(train_info):
+EMPTY_SNAPSHOT = TrainInformationSnapshot(0, None, {}, (), {})
+
+
+def _process_train_info_to_dict(train_info: List[Dict[str, Any]]) -> Dict[str, str]:
     """Processes the raw train info list into a dictionary."""
     info_dict = {}
     for item in train_info:
@@ -38,59 +73,163 @@ def _process_train_info_to_dict(train_info):
             info_dict[line_id] = info_text
     return info_dict
 
-def fetch_train_information():
-    """
-    Fetches train information data from the ODPT API.
-    """
-    endpoint = 'odpt:TrainInformation'
-    params = {'acl:consumerKey': TOKEN}
-    url = f"{BASE}/{endpoint}"
-    
-    try:
-        response = requests.get(url, params=params, headers=HEADERS, timeout=30)
+
+class TrainInformationPoller:
+    """Keeps the latest train information in memory, refreshed in the background."""
+
+    def __init__(self, base: str = BASE, token: Optional[str] = TOKEN, refresh_seconds: float = REFRESH_SECONDS,
+                 session: Optional[requests.Session] = None):
+        self.url = f"{base}/odpt:TrainInformation"
+        self.token = token
+        self.refresh_seconds = refresh_seconds
+        self.session = session or requests.Session()
+        self._snapshot = EMPTY_SNAPSHOT
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[TrainInformationSnapshot], None]] = []
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def current(self) -> TrainInformationSnapshot:
+        """The latest snapshot; never blocks."""
+        return self._snapshot
+
+    def add_listener(self, listener: Callable[[TrainInformationSnapshot], None]):
+        """Call listener with every snapshot whose content changed."""
+        self._listeners.append(listener)
+
+    def _publish(self, snapshot: TrainInformationSnapshot):
+        self._snapshot = snapshot
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"Train information listener failed: {type(e).__name__}: {e}")
+
+    def _fetch(self) -> Optional[List[Dict[str, Any]]]:
+        """One conditional GET; None if the feed has not changed. Raises on failure."""
+        headers = dict(HEADERS)
+        if self._etag:
+            headers['If-None-Match'] = self._etag
+        if self._last_modified:
+            headers['If-Modified-Since'] = self._last_modified
+        response = self.session.get(self.url, params={'acl:consumerKey': self.token}, headers=headers,
+                                    timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            return None
         response.raise_for_status()
         train_info = response.json()
-        
-        # Save the raw fetched data to a file
-        with open(RAW_CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(train_info, f, ensure_ascii=False, indent=2)
-        
+        if not isinstance(train_info, list):
+            raise ValueError(f"expected a list of records, got {type(train_info).__name__}")
+        self._etag = response.headers.get('ETag')
+        self._last_modified = response.headers.get('Last-Modified')
         return train_info
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching train information: {e}")
-        return None
 
-def get_train_information_dict():
+    async def refresh(self) -> bool:
+        """
+        Fetch the feed once (in a worker thread) and publish a new snapshot
+        if it changed. Returns True if it did. Raises on failure, leaving the
+        current snapshot in place.
+        """
+        train_info = await asyncio.to_thread(self._fetch)
+        current = self._snapshot
+        if train_info is None:
+            self._snapshot = current._replace(fetched_at=time.time())
+            return False
+        info = _process_train_info_to_dict(train_info)
+        if current.version and info == current.info:
+            self._snapshot = current._replace(fetched_at=time.time(), items=tuple(train_info))
+            return False
+        self._publish(TrainInformationSnapshot(current.version + 1, time.time(), info, tuple(train_info),
+                                               line_statuses(train_info)))
+        return True
+
+    def next_delay(self) -> float:
+        """Seconds until the next refresh, backing off after consecutive failures."""
+        if not self.failures:
+            return self.refresh_seconds
+        return min(BACKOFF_BASE_SECONDS * 2 ** (self.failures - 1), BACKOFF_MAX_SECONDS)
+
+    async def run(self):
+        """Refresh forever; errors are recorded and retried with backoff."""
+        while True:
+            try:
+                if await self.refresh():
+                    print(f"Train information updated to version {self._snapshot.version}")
+                self.failures = 0
+                self.last_error = None
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Error fetching train information (attempt {self.failures}): {self.last_error}")
+            await asyncio.sleep(self.next_delay())
+
+    def start(self):
+        """Start refreshing on the running event loop (idempotent)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        age = time.time() - snapshot.fetched_at if snapshot.fetched_at is not None else None
+        return {
+            "version": snapshot.version,
+            "lines": len(snapshot.info),
+            "age_seconds": round(age, 1) if age is not None else None,
+            "stale": age is None or age > STALE_AFTER_SECONDS,
+            "running": self._task is not None and not self._task.done(),
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+_poller = TrainInformationPoller()
+
+
+def start_poller():
+    """Start the background refresher on the running event loop."""
+    _poller.start()
+
+
+async def stop_poller():
+    await _poller.stop()
+
+
+def add_listener(listener: Callable[[TrainInformationSnapshot], None]):
+    """Call listener with every new train information snapshot."""
+    _poller.add_listener(listener)
+
+
+def realtime_status() -> Dict[str, Any]:
+    return _poller.status()
+
+
+def get_train_information_dict() -> Dict[str, str]:
     """
-    Returns a dictionary of train information, from cache if available and recent,
-    otherwise by fetching from the API.
+    The latest train information by TrainInformation ID, from memory. Empty
+    until the background refresher has fetched it once.
     """
-    if CACHE_FILE.exists():
-        last_modified_time = CACHE_FILE.stat().st_mtime
-        if (time.time() - last_modified_time) < CACHE_DURATION_SECONDS:
-            print("Loading train information from cache.")
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-
-    print("Fetching fresh train information.")
-    raw_info = fetch_train_information()
-    if raw_info:
-        info_dict = _process_train_info_to_dict(raw_info)
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(info_dict, f, ensure_ascii=False, indent=2)
-        print(f"Successfully fetched and saved processed train information to {CACHE_FILE}")
-        return info_dict
-    else:
-        print("Failed to fetch train information, returning empty dict.")
-        return {}
+    return _poller.current().info
 
 
 if __name__ == '__main__':
     print("Getting train information dictionary...")
+    try:
+        asyncio.run(_poller.refresh())
+    except Exception as e:
+        print(f"Error fetching train information: {e}")
     train_information_dict = get_train_information_dict()
     if train_information_dict:
-        print("Successfully got train information.")
+        print(f"Successfully got train information for {len(train_information_dict)} lines.")
     else:
         print("Failed to get train information.")
-
@@ -3,306 +3,942 @@ Route finding logic - generates multiple route alternatives using graph-based pa
 Finds routes between any two stations in the Tokyo train network.
 """
 
-import json
+import heapq
+import itertools
+import threading
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Set, Tuple, Optional
-from collections import defaultdict, deque
-
-_network = None
-_graph = None
-_station_to_lines = None
-_station_display_names = None
-_through_services = None
-
-def _load_network():
-    """Load the train network data and build the graph."""
-    global _network, _graph, _station_to_lines, _station_display_names, _through_services
-    
-    if _network is not None:
-        return
-    
-    network_path = Path('data/network.json')
-    if not network_path.exists():
-        _network = {"lines": {}}
-        _graph = defaultdict(set)
-        _station_to_lines = defaultdict(set)
-        _station_display_names = {}
-        return
-    
-    _network = json.loads(network_path.read_text(encoding='utf-8'))
-    _graph = defaultdict(set)
-    _station_to_lines = defaultdict(set)
-    _station_display_names = {}
-    _through_services = _network.get('through_services', [])
-    
-    for line_id, line_data in _network.get("lines", {}).items():
-        stations = line_data.get("stations", [])
-        line_type = line_data.get("type", "linear")
-        
-        for i, station in enumerate(stations):
-            station_key = station.lower().replace(" ", "-")
-            _station_to_lines[station_key].add(line_id)
-            _station_display_names[station_key] = station.replace("-", " ")
-            
-            if i > 0:
-                prev_station = stations[i-1].lower().replace(" ", "-")
-                _graph[station_key].add((prev_station, line_id))
-                _graph[prev_station].add((station_key, line_id))
-        
-        if line_type == "loop" and len(stations) > 2:
-            first = stations[0].lower().replace(" ", "-")
-            last = stations[-1].lower().replace(" ", "-")
-            _graph[first].add((last, line_id))
-            _graph[last].add((first, line_id))
+from typing import List, Dict, Any, FrozenSet, Tuple, Optional, NamedTuple, Sequence, Union
+
+import numpy as np
+
+from route_cache import RouteCache, thaw
+from network_graph import CompiledNetwork, line_hop_seconds, line_pair, normalize_station
+from network_snapshot import DEFAULT_POLL_SECONDS, NetworkSnapshot, NetworkSnapshotManager
+from network_bundle import load_snapshot, load_timetables
+from geo import WALK_DETOUR_FACTOR, DistanceBounds, LatLon, haversine_km
+from line_status import SUSPENDED, LineStatus
+from scoring import calculate_transfer_time
+from station_search import StationSearchIndex
+from raptor import TimetableNetwork, Journey, build_timetable_network, earliest_arrival, earliest_arrivals, latest_departure
+from timetable import TimetableStore, calendar_for_date, format_clock, odpt_suffix, parse_clock, timetable_sources
+
+# Built from data/network.bundle when it is current (scripts/compile_network.py)
+_snapshots = NetworkSnapshotManager(Path('data'), build=load_snapshot)
+# Station timetables with the (file, mtime) list they were loaded from, and
+# the RAPTOR networks built from that store by (snapshot version, calendar),
+# since stop keys depend on the snapshot. Both are replaced with a single
+# assignment, never modified, so queries read them without the lock.
+_timetables: Tuple[Optional[List[Tuple[str, float]]], Optional[TimetableStore]] = (None, None)
+_timetable_networks: Tuple[Optional[TimetableStore], Dict[Tuple[int, str], TimetableNetwork]] = (None, {})
+_timetable_lock = threading.Lock()
+_route_cache = RouteCache()
+# Realtime line statuses (version, status by line ID) and the search
+# overlays compiled from them per network snapshot
+_line_statuses: Tuple[int, Dict[str, LineStatus]] = (0, {})
+_line_overlays: Dict[Tuple[int, int], "LineOverlay"] = {}
+_line_status_lock = threading.Lock()
+# Transfer penalties of the last snapshot searched, by (station, from line,
+# to line); hub stations are crossed by every search, so they repeat a lot
+_transfer_penalties: Tuple[Optional[NetworkSnapshot], Dict[Tuple[int, int, int], float]] = (None, {})
+
+# A raw route hop: (from_station_id, to_station_id, line_id) in the compiled network
+Hop = Tuple[int, int, int]
+
+def _snapshot() -> NetworkSnapshot:
+    """
+    The current network snapshot. A query should take it once and pass it
+    along, so a reload in the middle of the query cannot mix two networks.
+    """
+    return _snapshots.current()
+
+def _load_network() -> CompiledNetwork:
+    """Load the train network data and compile the graph."""
+    return _snapshot().net
+
+def network_status() -> Dict[str, Any]:
+    """Version, build time and sources of the current network snapshot."""
+    return _snapshots.status()
+
+def reload_network(force: bool = False) -> bool:
+    """Rebuild the network snapshot if its data files changed (or if force)."""
+    return _snapshots.reload(force)
+
+def watch_network(poll_seconds: float = DEFAULT_POLL_SECONDS):
+    """Reload the network in the background whenever its data files change."""
+    _snapshots.start_watcher(poll_seconds)
 
 def _get_display_name(station_key: str) -> str:
     """Get the display name for a station key."""
-    _load_network()
-    return _station_display_names.get(station_key, station_key.replace("-", " ").title())
+    net = _load_network()
+    sid = net.station_index.get(station_key)
+    if sid is None:
+        return station_key.replace("-", " ").title()
+    return net.display_name(sid)
 
-def _normalize_station(name: str) -> str:
-    """Normalize station name for matching."""
-    return name.lower().strip().replace(" ", "-").replace("ō", "o").replace("ū", "u")
+def _odpt_station_key(odpt_station_id: str, snap: Optional[NetworkSnapshot] = None) -> str:
+    """Station key for an ODPT station ID such as odpt.Station:TokyoMetro.Marunouchi.Tokyo."""
+    key = (snap or _snapshot()).join.station_key(odpt_station_id)
+    if key is None:
+        key = normalize_station(odpt_suffix(odpt_station_id).split(".")[-1])
+    return key
 
-def _find_station(query: str) -> Optional[str]:
-    """Find a station by partial or full name match."""
-    _load_network()
-    query_lower = _normalize_station(query)
-    
-    if query_lower in _station_to_lines:
-        return query_lower
-    
-    for station in _station_to_lines.keys():
-        if query_lower in station or station in query_lower:
-            return station
-    
-    for station in _station_to_lines.keys():
-        station_simple = station.replace("-", "")
-        query_simple = query_lower.replace("-", "")
-        if query_simple in station_simple or station_simple in query_simple:
-            return station
-    
-    return None
+def _load_search_index() -> StationSearchIndex:
+    """The station-name search index over the network's stations."""
+    return _snapshot().search_index
+
+def _find_station(query: str, snap: Optional[NetworkSnapshot] = None) -> Optional[str]:
+    """Find the best-matching station key for a full, partial or Japanese name."""
+    return (snap or _snapshot()).search_index.best(query)
+
+def search_stations(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """Return ranked station candidates for autocomplete."""
+    snap = _snapshot()
+    net = snap.net
+    results = []
+    for key, score in snap.search_index.search(query, limit):
+        results.append({
+            "id": key,
+            "name_en": net.station_names[net.station_index[key]],
+            "name_ja": snap.join.names_ja[net.station_index[key]],
+            "score": score
+        })
+    return results
+
+# Walking to and from stations: 80 m per minute (the Japanese real-estate
+# convention) along streets WALK_DETOUR_FACTOR times the straight-line distance
+WALK_METERS_PER_SECOND = 80 / 60
+WALK_SPEED_FACTORS = {"slow": 1.2, "normal": 1.0, "fast": 0.8}
+# Stations a coordinate endpoint may walk to: the nearest few within range
+# (or else just the nearest one)
+ACCESS_CANDIDATES = 5
+MAX_ACCESS_KM = 1.5
+
+def _walk_seconds(km: float, walking_speed: str = "normal") -> int:
+    """Walking time for a straight-line distance."""
+    return round(km * 1000 * WALK_DETOUR_FACTOR / WALK_METERS_PER_SECOND * WALK_SPEED_FACTORS.get(walking_speed, 1.0))
+
+def nearest_stations(lat: float, lon: float, k: int = ACCESS_CANDIDATES,
+                     max_km: float = float("inf"), walking_speed: str = "normal") -> List[Dict[str, Any]]:
+    """
+    The k stations closest to a coordinate, nearest first, with straight-line
+    distance and estimated walking time. "approximate" marks stations whose
+    position was interpolated because stations.json has none for them.
+    """
+    snap = _snapshot()
+    net = snap.net
+    results = []
+    for km, sid in snap.spatial_index.nearest((lat, lon), k, max_km):
+        key = net.station_keys[sid]
+        results.append({
+            "id": key,
+            "name_en": net.display_name(sid),
+            "name_ja": snap.join.names_ja[sid],
+            "lat": snap.coordinates[sid][0],
+            "lon": snap.coordinates[sid][1],
+            "distance_m": round(km * 1000),
+            "walk_seconds": _walk_seconds(km, walking_speed),
+            "approximate": sid not in snap.surveyed,
+        })
+    return results
 
 def _get_line_info(line_id: str) -> Dict:
     """Get line information."""
-    _load_network()
-    return _network.get("lines", {}).get(line_id, {})
+    return _load_network().lines.get(line_id, {})
 
 def _has_through_service(line1: str, line2: str, station: str) -> bool:
     """Check if two lines have through-service at a given station."""
-    _load_network()
-    for service in _through_services:
-        lines = service.get('lines', [])
-        connection = service.get('connection_station', '')
-        if (line1 in lines and line2 in lines and 
-            station.lower().replace('-', '') == connection.lower().replace('-', '')):
-            return True
-    return False
+    net = _load_network()
+    station_id = net.station_index.get(normalize_station(station))
+    line1_id = net.line_index.get(line1)
+    line2_id = net.line_index.get(line2)
+    if station_id is None or line1_id is None or line2_id is None:
+        return False
+    return net.has_through_service(station_id, line1_id, line2_id)
 
 def _estimate_ride_time(from_station: str, to_station: str, line_id: str) -> int:
     """Estimate ride time between two stations on the same line in seconds."""
-    _load_network()
-    line_info = _get_line_info(line_id)
-    stations = [s.lower() for s in line_info.get("stations", [])]
-    
-    try:
-        from_idx = stations.index(from_station.lower())
-        to_idx = stations.index(to_station.lower())
-        num_stops = abs(to_idx - from_idx)
-    except ValueError:
-        num_stops = 1
-    
-    avg_speed = line_info.get("avg_speed_kmh", 30)
-    avg_distance = _network.get("station_distances", {}).get("default_km", 1.2)
-    
-    if line_info.get("type") == "loop":
-        avg_distance = _network.get("station_distances", {}).get("loop_station_km", 0.9)
-    
-    distance_km = num_stops * avg_distance
-    time_hours = distance_km / avg_speed
-    time_seconds = int(time_hours * 3600)
-    
-    time_seconds += num_stops * 30
-    
-    return max(60, time_seconds)
+    snap = _snapshot()
+    net = snap.net
+    line = net.line_index.get(line_id)
+    from_id = net.station_index.get(normalize_station(from_station))
+    to_id = net.station_index.get(normalize_station(to_station))
+
+    seconds = None
+    if line is not None and from_id is not None and to_id is not None:
+        seconds = net.ride_seconds(from_id, to_id, line)
+    if seconds is None:
+        # Unknown stations are treated as a single stop, as before
+        line_info = net.lines.get(line_id, {})
+        distances = snap.network.get("station_distances", {})
+        seconds = line_hop_seconds(line_info, distances)
+
+    return max(60, seconds)
+
+class SearchResult(NamedTuple):
+    """Raw routes found by a search plus the number of labels it settled."""
+    routes: List[List[Hop]]
+    expanded: int
+
+class _Path(NamedTuple):
+    hops: Optional[List[Hop]]
+    edges: List[int]
+    cost: float
+    expanded: int
 
-def _bfs_find_routes(origin: str, destination: str, max_routes: int = 5, max_transfers: int = 2) -> List[List[Tuple[str, str, str]]]:
+# Multiplier applied to an edge's weight each time a found path uses it
+ALTERNATIVE_EDGE_PENALTY = 1.4
+# Alternatives may take at most this many times as long as the best route
+ALTERNATIVE_MAX_STRETCH = 1.5
+# Transfers allowed between the origin, each via station and the destination
+MAX_TRANSFERS_PER_LEG = 3
+# Label edge marking a footpath walk (-1 marks a change of line in place),
+# and the line of the walking hops it produces
+FOOTPATH_EDGE = -2
+WALK_LINE = -1
+# Shortest-path algorithms find_routes can use
+SEARCH_MODES = ("dijkstra", "astar", "bidirectional")
+DEFAULT_SEARCH = "bidirectional"
+
+def _transfer_penalty(snap: NetworkSnapshot, station: int, from_line: int, to_line: int) -> float:
+    """Seconds charged for changing from one line to another at a station."""
+    global _transfer_penalties
+
+    cached_snap, penalties = _transfer_penalties
+    if cached_snap is not snap:
+        penalties = {}
+        _transfer_penalties = (snap, penalties)
+    key = (station, from_line, to_line)
+    penalty = penalties.get(key)
+    if penalty is None:
+        penalty = penalties[key] = _compute_transfer_penalty(snap, station, from_line, to_line)
+    return penalty
+
+def _compute_transfer_penalty(snap: NetworkSnapshot, station: int, from_line: int, to_line: int) -> float:
+    net = snap.net
+    if net.has_through_service(station, from_line, to_line):
+        return 0
+
+    from_line_id = net.line_keys[from_line]
+    to_line_id = net.line_keys[to_line]
+    transfer_data = snap.transfer_index.get((net.station_keys[station], line_pair(from_line_id, to_line_id)))
+    if transfer_data:
+        return calculate_transfer_time(transfer_data)
+
+    defaults = snap.network.get("transfer_times", {}).get("default", {})
+    same_company = net.lines[from_line_id].get("operator") == net.lines[to_line_id].get("operator")
+    if same_company:
+        return defaults.get("same_company", 180)
+    return defaults.get("different_company", 300)
+
+class LineOverlay(NamedTuple):
+    """Realtime line statuses compiled for the search, by compiled line ID."""
+    version: int
+    # Suspended lines, which cannot be boarded
+    excluded: FrozenSet[int]
+    # Expected delay in seconds, added whenever the line is boarded
+    boarding_seconds: Tuple[int, ...]
+
+def set_line_statuses(version: int, statuses: Dict[str, LineStatus]):
     """
-    Find multiple routes using optimized BFS.
-    Returns list of routes, where each route is a list of (from_station, to_station, line_id) tuples.
+    Publish realtime line statuses (by line ID) for routing. Searches pick
+    them up as an overlay on the unchanged network snapshot.
     """
-    _load_network()
-    
-    origin_norm = _find_station(origin)
-    dest_norm = _find_station(destination)
-    
-    if not origin_norm or not dest_norm:
-        return []
-    
-    if origin_norm == dest_norm:
-        return []
-    
-    routes = []
-    visited_paths = set()
-    
-    dest_lines = _station_to_lines.get(dest_norm, set())
-    
-    max_iterations = 5000
-    iterations = 0
-    
-    queue = deque()
-    visited_global = {}
-    
-    for start_line in _station_to_lines.get(origin_norm, set()):
-        queue.append((origin_norm, start_line, [], 0))
-        visited_global[(origin_norm, start_line)] = 0
-    
-    while queue and len(routes) < max_routes and iterations < max_iterations:
-        iterations += 1
-        current_station, current_line, path, num_transfers = queue.popleft()
-        
-        if num_transfers > max_transfers:
+    global _line_statuses
+
+    with _line_status_lock:
+        _line_statuses = (version, dict(statuses))
+        _line_overlays.clear()
+
+def transfer_index() -> Dict[tuple, Dict]:
+    """transfers.json records of the current network snapshot, indexed for score_route."""
+    return _snapshot().transfer_index
+
+def line_statuses() -> Dict[str, LineStatus]:
+    """The published realtime status per line ID."""
+    return _line_statuses[1]
+
+def _line_overlay(snap: NetworkSnapshot) -> LineOverlay:
+    """The search overlay for the current line statuses on snap's lines."""
+    version, statuses = _line_statuses
+    overlay = _line_overlays.get((snap.version, version))
+    if overlay is None:
+        net = snap.net
+        excluded = frozenset(net.line_index[line_id] for line_id, status in statuses.items()
+                             if status.state == SUSPENDED and line_id in net.line_index)
+        boarding = tuple(statuses[line_id].delay_minutes * 60 if line_id in statuses else 0
+                         for line_id in net.line_keys)
+        overlay = LineOverlay(version, excluded, boarding)
+        with _line_status_lock:
+            if _line_statuses[0] == version:
+                _line_overlays[(snap.version, version)] = overlay
+    return overlay
+
+def _no_overlay(net: CompiledNetwork) -> LineOverlay:
+    return LineOverlay(0, frozenset(), (0,) * len(net.line_keys))
+
+def _shortest_path(snap: NetworkSnapshot, origin: int, destination: int, max_transfers: int,
+                   edge_factors: Optional[Dict[int, float]] = None, max_cost: float = float("inf"),
+                   via: Sequence[int] = (), potentials: Optional[List[Dict[int, float]]] = None,
+                   overlay: Optional[LineOverlay] = None) -> _Path:
+    """
+    Label-setting (Dijkstra) search over (station, line) states for the
+    cheapest route from origin to destination. With potentials (see
+    _potentials) it is A*: labels are ordered by cost plus a lower bound on
+    the cost still to go.
+
+    Via stations are handled by layering the state space: a label's layer
+    counts the waypoints passed so far, and reaching via[layer] moves the
+    label up one layer. Only a label in the last layer can settle the
+    destination, so one search finds the best route through every waypoint
+    in order.
+
+    Labels are expanded in order of accumulated seconds: the ride seconds of
+    every edge, scaled by edge_factors where given, plus a transfer penalty
+    for every line change. Footpaths to differently named stations are
+    walked as transfers onto any line there, costing their walking seconds
+    instead of a penalty; their hops have line WALK_LINE. A realtime
+    overlay adds each line's delay whenever it is boarded and keeps
+    suspended lines from being boarded at all. A label is only settled if
+    no cheaper label at the same state used as few transfers, which keeps
+    the max_transfers limit exact. The search stops as soon as the destination is settled, or once
+    every remaining label costs more than max_cost, in which case the
+    returned path has hops None.
+    """
+    net = snap.net
+    foot = snap.footpaths
+    num_lines = len(net.line_keys)
+    layer_size = net.num_stations * num_lines
+    last_layer = len(via)
+    neighbors, edge_lines, weights, offsets = net.neighbors, net.edge_lines, net.weights, net.offsets
+    factors = edge_factors or {}
+    overlay = overlay or _no_overlay(net)
+    excluded, boarding = overlay.excluded, overlay.boarding_seconds
+
+    # Label: (priority, tie-breaker, station, line, transfers, parent label, edge, true cost, layer,
+    # penalized cost); priority is the penalized cost plus the potential.
+    counter = itertools.count()
+    heap = []
+    start = potentials[0][origin] if potentials else 0
+    for start_line in net.lines_at(origin):
+        if start_line not in excluded:
+            delay = boarding[start_line]
+            heapq.heappush(heap, (start + delay, next(counter), origin, start_line, 0, None, -1, delay, 0, delay))
+
+    # Fewest transfers among settled labels per state; a later (costlier)
+    # label is only useful if it needed fewer transfers.
+    settled_transfers = {}
+    expanded = 0
+
+    while heap:
+        label = heapq.heappop(heap)
+        priority, _, station, line, num_transfers, _parent, _edge, cost, layer, g = label
+        if priority > max_cost:
+            break
+        while layer < last_layer and station == via[layer]:
+            layer += 1
+        base = layer * layer_size
+        state = base + station * num_lines + line
+
+        if settled_transfers.get(state, max_transfers + 1) <= num_transfers:
             continue
-        
-        if len(path) > 30:
+        settled_transfers[state] = num_transfers
+        expanded += 1
+
+        if station == destination and layer == last_layer:
+            hops, edges = _unwind_label(label)
+            return _Path(hops, edges, cost, expanded)
+
+        potential = potentials[layer] if potentials else None
+        for e in range(offsets[station], offsets[station + 1]):
+            if edge_lines[e] == line:
+                weight = weights[e]
+                neighbor = neighbors[e]
+                child_g = g + weight * factors.get(e, 1)
+                child_priority = child_g + potential[neighbor] if potential is not None else child_g
+                heapq.heappush(heap, (child_priority, next(counter), neighbor, line, num_transfers, label, e,
+                                      cost + weight, layer, child_g))
+
+        if num_transfers < max_transfers:
+            for new_line in net.lines_at(station):
+                if (new_line != line and new_line not in excluded
+                        and settled_transfers.get(base + station * num_lines + new_line, max_transfers + 1) > num_transfers + 1):
+                    penalty = _transfer_penalty(snap, station, line, new_line) + boarding[new_line]
+                    heapq.heappush(heap, (priority + penalty, next(counter), station, new_line,
+                                          num_transfers + 1, label, -1, cost + penalty, layer, g + penalty))
+
+            # Walking to another station is a transfer onto any of its lines
+            for f in foot.walks(station):
+                other, walk = foot.neighbors[f], foot.seconds[f]
+                child_g = g + walk
+                child_priority = child_g + potential[other] if potential is not None else child_g
+                for new_line in net.lines_at(other):
+                    if (new_line not in excluded
+                            and settled_transfers.get(base + other * num_lines + new_line, max_transfers + 1) > num_transfers + 1):
+                        delay = boarding[new_line]
+                        heapq.heappush(heap, (child_priority + delay, next(counter), other, new_line, num_transfers + 1,
+                                              label, FOOTPATH_EDGE, cost + walk + delay, layer, child_g + delay))
+
+    return _Path(None, [], float("inf"), expanded)
+
+def _potentials(snap: NetworkSnapshot, destination: int, via: Sequence[int] = ()) -> List[Dict[int, float]]:
+    """
+    A* potentials per via layer: a straight-line lower bound on the seconds
+    from each station through the remaining waypoints to destination,
+    computed for a station when the search first reaches it.
+    """
+    targets = [*via, destination]
+    coords, rate = snap.coordinates, snap.seconds_per_km
+    # Bound for the legs between consecutive targets, from each target on
+    rest = [0.0] * len(targets)
+    for i in range(len(targets) - 2, -1, -1):
+        rest[i] = rest[i + 1] + DistanceBounds(coords, targets[i + 1], rate)[targets[i]]
+    return [DistanceBounds(coords, target, rate, rest[i]) for i, target in enumerate(targets)]
+
+def _bidirectional_path(snap: NetworkSnapshot, origin: Union[int, Dict[int, float]],
+                        destination: Union[int, Dict[int, float]], max_transfers: int,
+                        edge_factors: Optional[Dict[int, float]] = None, max_cost: float = float("inf"),
+                        overlay: Optional[LineOverlay] = None) -> _Path:
+    """
+    Bidirectional label-setting search: one search forward from origin and
+    one backward from destination over the reversed edges, each keeping the
+    same per-state transfer pruning as _shortest_path. Every label pushed
+    onto either queue is joined with the labels the other side settled (or
+    started from) at the same state, within max_transfers in total, and the
+    search stops once the two queue minima add up to at least the best join
+    found.
+
+    origin and destination may also be {station: seconds} dicts, which
+    seed that side from every station at once with the given starting cost
+    (e.g. the walk to or from the station); the returned cost includes it.
+    A route must leave its seed station. A realtime overlay is applied as
+    in _shortest_path; the backward search charges a line's delay where it
+    leaves the line, which is where the forward route boards it.
+    """
+    net = snap.net
+    foot = snap.footpaths
+    num_lines = len(net.line_keys)
+    neighbors, edge_lines, weights, offsets = net.neighbors, net.edge_lines, net.weights, net.offsets
+    reverse_edges = net.reverse_edges
+    factors = edge_factors or {}
+    overlay = overlay or _no_overlay(net)
+    excluded, boarding = overlay.excluded, overlay.boarding_seconds
+
+    # Label: (penalized cost, tie-breaker, station, line, transfers, parent label, edge, true cost,
+    # whether it has moved off its seed station)
+    counter = itertools.count()
+    heaps = ([], [])
+    # Seed labels per state and side; like settled labels, a label pushed
+    # onto the other side's queue is joined with them
+    seeded: Tuple[Dict[int, list], Dict[int, list]] = ({}, {})
+    for side, seeds in enumerate((origin, destination)):
+        for start, seconds in (seeds.items() if isinstance(seeds, dict) else ((seeds, 0),)):
+            for start_line in net.lines_at(start):
+                if start_line not in excluded:
+                    cost = seconds + (boarding[start_line] if side == 0 else 0)
+                    label = (cost, next(counter), start, start_line, 0, None, -1, cost, False)
+                    heapq.heappush(heaps[side], label)
+                    seeded[side].setdefault(start * num_lines + start_line, []).append((cost, 0, label))
+
+    # Settled (penalized cost, transfers, label) per state and side, cost
+    # increasing and transfers decreasing
+    settled: Tuple[Dict[int, list], Dict[int, list]] = ({}, {})
+    best = max_cost
+    meeting = None
+    expanded = 0
+
+    def push(side: int, label: tuple):
+        nonlocal best, meeting
+        g, num_transfers = label[0], label[4]
+        state = label[2] * num_lines + label[3]
+        for other_g, other_transfers, other in (*settled[1 - side].get(state, ()), *seeded[1 - side].get(state, ())):
+            if (num_transfers + other_transfers <= max_transfers and g + other_g < best
+                    and (label[8] or other[8])):
+                best = g + other_g
+                meeting = (label, other) if side == 0 else (other, label)
+        heapq.heappush(heaps[side], label)
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        label = heapq.heappop(heaps[side])
+        g, _, station, line, num_transfers, _parent, _edge, cost, moved = label
+        state = station * num_lines + line
+
+        labels = settled[side].setdefault(state, [])
+        if labels and labels[-1][1] <= num_transfers:
             continue
-        
-        if current_station == dest_norm:
-            lines_used = tuple(sorted(set(p[2] for p in path)))
-            transfer_points = tuple(p[0] for i, p in enumerate(path) if i > 0 and path[i-1][2] != p[2])
-            path_signature = (lines_used, transfer_points)
-            
-            if path_signature not in visited_paths:
-                visited_paths.add(path_signature)
-                routes.append(path)
+        labels.append((g, num_transfers, label))
+        expanded += 1
+
+        for e in range(offsets[station], offsets[station + 1]):
+            if edge_lines[e] == line:
+                weight = weights[e]
+                # Backward labels walk edges against their direction of travel
+                factor = factors.get(e if side == 0 else reverse_edges[e], 1)
+                push(side, (g + weight * factor, next(counter), neighbors[e], line,
+                            num_transfers, label, e, cost + weight, True))
+
+        if num_transfers < max_transfers:
+            for new_line in net.lines_at(station):
+                if new_line == line or new_line in excluded:
+                    continue
+                other_labels = settled[side].get(station * num_lines + new_line)
+                if not other_labels or other_labels[-1][1] > num_transfers + 1:
+                    penalty = _transfer_penalty(snap, station, line, new_line) + boarding[new_line if side == 0 else line]
+                    push(side, (g + penalty, next(counter), station, new_line,
+                                num_transfers + 1, label, -1, cost + penalty, moved))
+
+            # Footpaths are walked the same way in both directions
+            for f in foot.walks(station):
+                other, walk = foot.neighbors[f], foot.seconds[f]
+                for new_line in net.lines_at(other):
+                    if new_line in excluded:
+                        continue
+                    other_labels = settled[side].get(other * num_lines + new_line)
+                    if not other_labels or other_labels[-1][1] > num_transfers + 1:
+                        walk_cost = walk + boarding[new_line if side == 0 else line]
+                        push(side, (g + walk_cost, next(counter), other, new_line,
+                                    num_transfers + 1, label, FOOTPATH_EDGE, cost + walk_cost, True))
+
+    if meeting is None:
+        return _Path(None, [], float("inf"), expanded)
+
+    forward, backward = meeting
+    hops, edges = _unwind_label(forward)
+    # The backward half runs from the meeting state to the destination
+    label = backward
+    while label[5] is not None:
+        parent = label[5]
+        if label[6] >= 0:
+            hops.append((label[2], parent[2], label[3]))
+            edges.append(reverse_edges[label[6]])
+        elif label[6] == FOOTPATH_EDGE:
+            hops.append((label[2], parent[2], WALK_LINE))
+        label = parent
+    return _Path(hops, edges, forward[7] + backward[7], expanded)
+
+def _unwind_label(label: tuple) -> Tuple[List[Hop], List[int]]:
+    """
+    Rebuild the hops of a route from its destination label, plus the edge
+    indexes of its ride hops (walking hops, with line WALK_LINE, have none).
+    """
+    hops = []
+    edges = []
+    while label[5] is not None:
+        parent = label[5]
+        if label[6] >= 0:
+            hops.append((parent[2], label[2], label[3]))
+            edges.append(label[6])
+        elif label[6] == FOOTPATH_EDGE:
+            hops.append((parent[2], label[2], WALK_LINE))
+        label = parent
+    hops.reverse()
+    edges.reverse()
+    return hops, edges
+
+def _overlap(net: CompiledNetwork, path: _Path, other: _Path) -> float:
+    """Fraction of the shorter path's ride seconds spent on track the other path also rides."""
+    def track(p: _Path) -> Dict[Tuple[int, int, int], int]:
+        rides = [hop for hop in p.hops if hop[2] != WALK_LINE]
+        return {(min(a, b), max(a, b), line): net.weights[e] for (a, b, line), e in zip(rides, p.edges)}
+
+    mine, theirs = track(path), track(other)
+    shared = sum(seconds for key, seconds in mine.items() if key in theirs)
+    shortest = min(sum(mine.values()), sum(theirs.values())) or 1
+    return shared / shortest
+
+def _find_alternative_routes(origin: str, destination: str, max_routes: int = 5, max_transfers: int = 3,
+                             diversity_threshold: float = 0.3, via: Sequence[str] = (),
+                             snap: Optional[NetworkSnapshot] = None, search: str = DEFAULT_SEARCH,
+                             overlay: Optional[LineOverlay] = None) -> SearchResult:
+    """
+    Find up to max_routes diverse routes with the penalty method, passing
+    through the via stations in order. search picks the shortest-path
+    algorithm (one of SEARCH_MODES); all of them find the same cheapest
+    cost, and bidirectional search falls back to A* for via queries.
+
+    Each iteration runs one early-terminating shortest-path search, then
+    multiplies the weight of every edge the found path used by
+    ALTERNATIVE_EDGE_PENALTY so the next search is pushed onto other track.
+    A path is kept only if at least diversity_threshold of its ride time
+    (relative to the shorter path) differs from every route kept so far.
+    Searches are cut off at ALTERNATIVE_MAX_STRETCH times the best route's
+    cost, and there are at most 3 * max_routes of them, so the work grows
+    with max_routes rather than with the explored frontier.
+
+    Routes are returned cheapest first, each a list of (from_station,
+    to_station, line) hops in compiled network IDs.
+    """
+    snap = snap or _snapshot()
+    net = snap.net
+
+    origin_norm = _find_station(origin, snap)
+    dest_norm = _find_station(destination, snap)
+
+    if not origin_norm or not dest_norm or origin_norm == dest_norm:
+        return SearchResult([], 0)
+
+    via_ids = []
+    for station in via:
+        station_norm = _find_station(station, snap)
+        if not station_norm:
+            return SearchResult([], 0)
+        via_ids.append(net.station_index[station_norm])
+
+    origin_id = net.station_index[origin_norm]
+    dest_id = net.station_index[dest_norm]
+
+    if search not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {search}")
+    if search == "bidirectional" and via_ids:
+        search = "astar"
+
+    paths, expanded = _alternative_paths(snap, origin_id, dest_id, max_routes, max_transfers,
+                                         diversity_threshold, via_ids, search, overlay)
+    return SearchResult([p.hops for p in paths], expanded)
+
+def _alternative_paths(snap: NetworkSnapshot, origin: Union[int, Dict[int, float]],
+                       destination: Union[int, Dict[int, float]], max_routes: int, max_transfers: int,
+                       diversity_threshold: float, via_ids: Sequence[int] = (),
+                       search: str = DEFAULT_SEARCH, overlay: Optional[LineOverlay] = None) -> Tuple[List[_Path], int]:
+    """
+    The penalty-method loop of _find_alternative_routes on compiled station
+    IDs: the accepted paths, cheapest first, and the labels expanded.
+    Seeded endpoints ({station: seconds} dicts) need bidirectional search.
+    """
+    net = snap.net
+    potentials = _potentials(snap, destination, via_ids) if search == "astar" else None
+
+    edge_factors: Dict[int, float] = {}
+    accepted: List[_Path] = []
+    expanded = 0
+
+    max_cost = float("inf")
+    for _attempt in range(3 * max_routes):
+        if search == "bidirectional":
+            path = _bidirectional_path(snap, origin, destination, max_transfers, edge_factors, max_cost, overlay)
+        else:
+            path = _shortest_path(snap, origin, destination, max_transfers, edge_factors, max_cost, via_ids,
+                                  potentials, overlay)
+        expanded += path.expanded
+        if path.hops is None:
+            break
+        if not accepted:
+            max_cost = path.cost * ALTERNATIVE_MAX_STRETCH
+
+        if all(_overlap(net, path, other) <= 1 - diversity_threshold for other in accepted):
+            accepted.append(path)
+            if len(accepted) >= max_routes:
+                break
+
+        if not path.edges:
+            # Walking the whole way; there is no track to penalize
+            break
+        for e in path.edges:
+            edge_factors[e] = edge_factors.get(e, 1) * ALTERNATIVE_EDGE_PENALTY
+
+    accepted.sort(key=lambda p: p.cost)
+    return accepted, expanded
+
+def _one_to_all(snap: NetworkSnapshot, origin: int, max_transfers: int,
+                max_cost: float = float("inf"), overlay: Optional[LineOverlay] = None) -> List[List[Tuple[int, int]]]:
+    """
+    Label-setting search from origin to every station within max_cost.
+
+    Returns, per station ID, the Pareto front of (cost, transfers) pairs:
+    cost in seconds (ride time plus transfer penalties, as in
+    _shortest_path) increasing and transfers decreasing. The first pair is
+    the cheapest route; later pairs trade time for fewer transfers.
+    Unreached stations have an empty front. Footpaths count as transfers,
+    and a realtime overlay applies as in _shortest_path.
+    """
+    net = snap.net
+    foot = snap.footpaths
+    overlay = overlay or _no_overlay(net)
+    excluded, boarding = overlay.excluded, overlay.boarding_seconds
+    num_lines = len(net.line_keys)
+    neighbors, edge_lines, weights, offsets = net.neighbors, net.edge_lines, net.weights, net.offsets
+
+    fronts: List[List[Tuple[int, int]]] = [[] for _ in range(net.num_stations)]
+
+    # Label: (cost, station, line, transfers)
+    heap = [(boarding[line], origin, line, 0) for line in net.lines_at(origin) if line not in excluded]
+    heapq.heapify(heap)
+    settled_transfers = {}
+
+    while heap:
+        cost, station, line, num_transfers = heapq.heappop(heap)
+        if cost > max_cost:
+            break
+        state = station * num_lines + line
+        if settled_transfers.get(state, max_transfers + 1) <= num_transfers:
             continue
-        
-        neighbors = list(_graph.get(current_station, []))
-        
-        same_line_neighbors = [(n, l) for n, l in neighbors if l == current_line]
-        for next_station, line_id in same_line_neighbors:
-            state = (next_station, line_id)
-            new_path_len = len(path) + 1
-            
-            if state not in visited_global or visited_global[state] > new_path_len:
-                visited_global[state] = new_path_len
-                extended_path = path + [(current_station, next_station, line_id)]
-                queue.append((next_station, line_id, extended_path, num_transfers))
-        
+        settled_transfers[state] = num_transfers
+        front = fronts[station]
+        if not front or num_transfers < front[-1][1]:
+            front.append((cost, num_transfers))
+
+        for e in range(offsets[station], offsets[station + 1]):
+            if edge_lines[e] == line:
+                heapq.heappush(heap, (cost + weights[e], neighbors[e], line, num_transfers))
+
         if num_transfers < max_transfers:
-            for new_line in _station_to_lines.get(current_station, set()):
-                if new_line != current_line:
-                    for next_station, line_id in neighbors:
-                        if line_id == new_line:
-                            state = (next_station, new_line)
-                            new_path_len = len(path) + 1
-                            
-                            if state not in visited_global or visited_global[state] > new_path_len + 5:
-                                visited_global[state] = new_path_len
-                                transfer_path = path + [(current_station, next_station, new_line)]
-                                queue.append((next_station, new_line, transfer_path, num_transfers + 1))
-    
-    return routes[:max_routes]
+            for new_line in net.lines_at(station):
+                if (new_line != line and new_line not in excluded
+                        and settled_transfers.get(station * num_lines + new_line, max_transfers + 1) > num_transfers + 1):
+                    penalty = _transfer_penalty(snap, station, line, new_line) + boarding[new_line]
+                    heapq.heappush(heap, (cost + penalty, station, new_line, num_transfers + 1))
 
-def _consolidate_segments(raw_route: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
-    """Consolidate consecutive segments on the same line into single ride segments."""
-    if not raw_route:
-        return []
-    
+            for f in foot.walks(station):
+                other = foot.neighbors[f]
+                for new_line in net.lines_at(other):
+                    if (new_line not in excluded
+                            and settled_transfers.get(other * num_lines + new_line, max_transfers + 1) > num_transfers + 1):
+                        heapq.heappush(heap, (cost + foot.seconds[f] + boarding[new_line], other, new_line, num_transfers + 1))
+
+    return fronts
+
+class TravelTimeMatrix(NamedTuple):
+    """Origin x destination matrices; rows follow origins, columns destinations."""
+    origins: List[str]
+    destinations: List[str]
+    # Seconds from origin to destination, NaN where unreachable
+    seconds: np.ndarray
+    # Transfers on that route, -1 where unreachable
+    transfers: np.ndarray
+    # "graph" (average-speed model) or "timetable" (RAPTOR)
+    source: str
+
+def travel_time_matrix(origins: Sequence[str], destinations: Sequence[str], date: str | None = None,
+                       time: str | None = None) -> TravelTimeMatrix:
+    """
+    Travel-time and transfer-count matrices between every origin and
+    destination, with one one-to-all search per origin.
+
+    Without a time the graph search's costs are used (ride time plus
+    transfer penalties and current line delays, as find_routes ranks
+    routes). With a time and
+    loaded timetables, each row is a one-to-all RAPTOR search leaving at
+    that time, and seconds include the initial wait. Raises ValueError for
+    station names that cannot be resolved.
+    """
+    snap = _snapshot()
+    net = snap.net
+
+    origin_keys = [_find_station(name, snap) for name in origins]
+    dest_keys = [_find_station(name, snap) for name in destinations]
+    unknown = [name for name, key in zip([*origins, *destinations], [*origin_keys, *dest_keys]) if not key]
+    if unknown:
+        raise ValueError(f"Unknown stations: {', '.join(unknown)}")
+
+    seconds = np.full((len(origin_keys), len(dest_keys)), np.nan, dtype=np.float32)
+    transfers = np.full((len(origin_keys), len(dest_keys)), -1, dtype=np.int8)
+
+    network = _load_timetable_network(calendar_for_date(date), snap) if time else None
+    if network is not None:
+        departure = parse_clock(time)
+        for i, origin_key in enumerate(origin_keys):
+            reached = earliest_arrivals(network, origin_key, departure)
+            reached[origin_key] = (departure, 1)
+            for j, dest_key in enumerate(dest_keys):
+                if dest_key in reached:
+                    arrival, trips = reached[dest_key]
+                    seconds[i, j] = arrival - departure
+                    transfers[i, j] = trips - 1
+        return TravelTimeMatrix(origin_keys, dest_keys, seconds, transfers, "timetable")
+
+    dest_ids = np.array([net.station_index[key] for key in dest_keys], dtype=np.intp)
+    overlay = _line_overlay(snap)
+    rows: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    for i, origin_key in enumerate(origin_keys):
+        if origin_key not in rows:
+            fronts = _one_to_all(snap, net.station_index[origin_key], MAX_TRANSFERS_PER_LEG, overlay=overlay)
+            rows[origin_key] = (np.array([f[0][0] if f else np.inf for f in fronts], dtype=np.float32),
+                                np.array([f[0][1] if f else -1 for f in fronts], dtype=np.int8))
+        costs, row_transfers = rows[origin_key]
+        seconds[i] = costs[dest_ids]
+        transfers[i] = row_transfers[dest_ids]
+    seconds[np.isinf(seconds)] = np.nan
+    return TravelTimeMatrix(origin_keys, dest_keys, seconds, transfers, "graph")
+
+class ReachableStation(NamedTuple):
+    key: str
+    name: str
+    name_ja: str
+    # Pareto front of (seconds, transfers): seconds increasing, transfers decreasing
+    front: List[Tuple[int, int]]
+
+    def seconds_within(self, max_transfers: int) -> Optional[int]:
+        """Fastest time using at most max_transfers, or None."""
+        return next((seconds for seconds, transfers in self.front if transfers <= max_transfers), None)
+
+def reachable_stations(station: str, max_minutes: float,
+                       max_transfers: int = MAX_TRANSFERS_PER_LEG) -> Tuple[str, List[ReachableStation]]:
+    """
+    The resolved origin key and every station reachable from it within
+    max_minutes using at most max_transfers transfers, fastest first.
+
+    One bounded one-to-all search on the graph (ride times from the
+    per-line tables, transfer penalties from transfers.json). Each result
+    carries its full time/transfer Pareto front, so any smaller time or
+    transfer threshold can be answered by filtering, without searching
+    again. The list is empty when every line at the origin is suspended.
+    Raises ValueError for a station name that cannot be resolved.
+    """
+    snap = _snapshot()
+    net = snap.net
+    key = _find_station(station, snap)
+    if not key:
+        raise ValueError(f"Unknown station: {station}")
+
+    fronts = _one_to_all(snap, net.station_index[key], max_transfers, max_minutes * 60, _line_overlay(snap))
+    reachable = [
+        ReachableStation(net.station_keys[sid], net.display_name(sid),
+                         snap.join.names_ja[sid], front)
+        for sid, front in enumerate(fronts) if front
+    ]
+    reachable.sort(key=lambda r: (r.front[0][0], r.key))
+    return key, reachable
+
+def _ride_segment(net: CompiledNetwork, from_station: int, to_station: int, lines_in_segment: List[int], duration: int) -> Dict[str, Any]:
+    """Build the ride segment dict for one consolidated ride."""
+    line_ids = [net.line_keys[l] for l in lines_in_segment]
+    if len(line_ids) > 1:
+        line_info_first = net.lines[line_ids[0]]
+        line_info_last = net.lines[line_ids[-1]]
+        line_display = f"{line_info_first.get('name', line_ids[0])} → {line_info_last.get('name', line_ids[-1])}"
+    else:
+        line_display = net.lines[line_ids[0]].get('name', line_ids[0])
+
+    return {
+        "type": "ride",
+        "from_station": net.display_name(from_station),
+        "to_station": net.display_name(to_station),
+        "line": line_display,
+        "line_ids": line_ids,
+        "duration_seconds": duration,
+        "is_transfer": False,
+        "through_service": len(line_ids) > 1
+    }
+
+def _consolidate_segments(raw_route: List[Hop], snap: Optional[NetworkSnapshot] = None) -> List[Dict[str, Any]]:
+    """
+    Consolidate consecutive hops on the same line into single ride segments.
+    A footpath between two rides becomes a transfer segment with the walking
+    distance; one at either end of the route becomes a walk segment.
+    """
+    snap = snap or _snapshot()
+    net = snap.net
+    foot = snap.footpaths
+
+    # Split into runs of ride hops and runs of walking hops
+    runs = [list(group) for _walking, group in itertools.groupby(raw_route, key=lambda hop: hop[2] == WALK_LINE)]
+    segments = []
+    for i, run in enumerate(runs):
+        if run[0][2] != WALK_LINE:
+            segments.extend(_consolidate_rides(run, net))
+            continue
+
+        distance_m = sum(foot.distance_m[foot.find(a, b)] for a, b, _line in run)
+        seconds = sum(foot.seconds[foot.find(a, b)] for a, b, _line in run)
+        from_station, to_station = net.display_name(run[0][0]), net.display_name(run[-1][1])
+        if 0 < i < len(runs) - 1:
+            from_line = net.line_keys[runs[i - 1][-1][2]]
+            to_line = net.line_keys[runs[i + 1][0][2]]
+            segments.append({
+                "type": "transfer",
+                "from_station": from_station,
+                "to_station": to_station,
+                "from_line": net.lines[from_line].get('name', from_line),
+                "to_line": net.lines[to_line].get('name', to_line),
+                "from_line_id": from_line,
+                "to_line_id": to_line,
+                "duration_seconds": 0,
+                "distance_m": distance_m,
+                "is_transfer": True,
+                "same_company_transfer": net.lines[from_line].get("operator") == net.lines[to_line].get("operator")
+            })
+        else:
+            segments.append({
+                "type": "walk",
+                "from_station": from_station,
+                "to_station": to_station,
+                "distance_m": distance_m,
+                "duration_seconds": seconds,
+                "is_transfer": False,
+            })
+    return segments
+
+def _consolidate_rides(raw_route: List[Hop], net: CompiledNetwork) -> List[Dict[str, Any]]:
+    """Ride and in-station transfer segments for a run of ride hops."""
     segments = []
-    current_line = raw_route[0][2]
-    current_from = raw_route[0][0]
-    current_to = raw_route[0][1]
+    current_from, current_to, current_line = raw_route[0]
     lines_in_segment = [current_line]
-    segment_hops = [(raw_route[0][0], raw_route[0][1], raw_route[0][2])]
+    # Where the ride on current_line started (differs from current_from
+    # after a through-service line change) and its first stop after that,
+    # which fixes the direction on loop lines.
+    line_from = current_from
+    line_next = current_to
+    duration = 0
     
-    for i in range(1, len(raw_route)):
-        from_station, to_station, line_id = raw_route[i]
-        
-        if line_id == current_line:
+    for from_station, to_station, line in raw_route[1:]:
+        if line == current_line:
             current_to = to_station
-            segment_hops.append((from_station, to_station, line_id))
-        elif _has_through_service(current_line, line_id, current_to):
+        elif net.has_through_service(current_to, current_line, line):
+            duration += net.ride_seconds(line_from, current_to, current_line, line_next)
+            line_from = current_to
+            line_next = to_station
             current_to = to_station
-            current_line = line_id
-            lines_in_segment.append(line_id)
-            segment_hops.append((from_station, to_station, line_id))
+            current_line = line
+            lines_in_segment.append(line)
         else:
-            duration = sum(_estimate_ride_time(hop[0], hop[1], hop[2]) for hop in segment_hops)
-            
-            if len(lines_in_segment) > 1:
-                line_info_first = _get_line_info(lines_in_segment[0])
-                line_info_last = _get_line_info(lines_in_segment[-1])
-                line_display = f"{line_info_first.get('name', lines_in_segment[0])} → {line_info_last.get('name', lines_in_segment[-1])}"
-            else:
-                line_info = _get_line_info(current_line)
-                line_display = line_info.get('name', current_line)
+            duration += net.ride_seconds(line_from, current_to, current_line, line_next)
+            segments.append(_ride_segment(net, current_from, current_to, lines_in_segment, duration))
             
-            segments.append({
-                "type": "ride",
-                "from_station": _get_display_name(current_from),
-                "to_station": _get_display_name(current_to),
-                "line": line_display,
-                "line_ids": lines_in_segment,
-                "duration_seconds": duration,
-                "is_transfer": False,
-                "through_service": len(lines_in_segment) > 1
-            })
-            
-            line_info_from = _get_line_info(current_line)
-            line_info_to = _get_line_info(line_id)
+            line_info_from = net.lines[net.line_keys[current_line]]
+            line_info_to = net.lines[net.line_keys[line]]
             same_company = line_info_from.get("operator") == line_info_to.get("operator")
             
             segments.append({
                 "type": "transfer",
-                "from_station": _get_display_name(current_to),
-                "to_station": _get_display_name(from_station),
-                "from_line": line_info_from.get('name', current_line),
-                "to_line": line_info_to.get('name', line_id),
+                "from_station": net.display_name(current_to),
+                "to_station": net.display_name(from_station),
+                "from_line": line_info_from.get('name', net.line_keys[current_line]),
+                "to_line": line_info_to.get('name', net.line_keys[line]),
+                "from_line_id": net.line_keys[current_line],
+                "to_line_id": net.line_keys[line],
                 "duration_seconds": 0,
                 "is_transfer": True,
                 "same_company_transfer": same_company
             })
             
-            current_line = line_id
+            current_line = line
             current_from = from_station
+            line_from = from_station
+            line_next = to_station
             current_to = to_station
-            lines_in_segment = [line_id]
-            segment_hops = [(from_station, to_station, line_id)]
+            lines_in_segment = [line]
+            duration = 0
     
-    duration = sum(_estimate_ride_time(hop[0], hop[1], hop[2]) for hop in segment_hops)
-    
-    if len(lines_in_segment) > 1:
-        line_info_first = _get_line_info(lines_in_segment[0])
-        line_info_last = _get_line_info(lines_in_segment[-1])
-        line_display = f"{line_info_first.get('name', lines_in_segment[0])} → {line_info_last.get('name', lines_in_segment[-1])}"
-    else:
-        line_info = _get_line_info(current_line)
-        line_display = line_info.get('name', current_line)
-    
-    segments.append({
-        "type": "ride",
-        "from_station": _get_display_name(current_from),
-        "to_station": _get_display_name(current_to),
-        "line": line_display,
-        "line_ids": lines_in_segment,
-        "duration_seconds": duration,
-        "is_transfer": False,
-        "through_service": len(lines_in_segment) > 1
-    })
+    duration += net.ride_seconds(line_from, current_to, current_line, line_next)
+    segments.append(_ride_segment(net, current_from, current_to, lines_in_segment, duration))
     
     return segments
 
 def _generate_route_name(segments: List[Dict]) -> str:
     """Generate a descriptive name for the route."""
     transfers = [s for s in segments if s["type"] == "transfer"]
+    rides = [s for s in segments if s["type"] == "ride"]
     
+    if not rides:
+        return "Walk"
     if not transfers:
-        if segments and segments[0].get("through_service"):
+        if rides and rides[0].get("through_service"):
             return "Direct (through-service)"
         else:
-            line = segments[0]["line"] if segments else "Direct"
+            line = rides[0]["line"] if rides else "Direct"
             return f"Direct ({line})"
     
     transfer_stations = [t["from_station"] for t in transfers]
@@ -313,49 +949,309 @@ def _generate_route_name(segments: List[Dict]) -> str:
     else:
         return f"Via {transfer_str} ({len(transfers)} transfers)"
 
-def find_routes(origin: str, destination: str, date: str | None = None, time: str | None = None, time_type: str = "departure") -> List[Dict[str, Any]]:
+def _load_timetable_store() -> TimetableStore:
     """
-    Find multiple route alternatives between origin and destination.
+    Load the columnar station timetables (memory-mapped from the bundle when
+    it is current), again whenever the timetable files change.
     """
+    global _timetables
 
-    _load_network()
+    data_dir = _snapshots.data_dir
+    sources = timetable_sources(data_dir)
+    loaded_from, store = _timetables
+    if store is None or loaded_from != sources:
+        with _timetable_lock:
+            loaded_from, store = _timetables
+            if store is None or loaded_from != sources:
+                store = load_timetables(data_dir)
+                _timetables = (sources, store)
+    return store
 
-    # Use the correct BFS function
-    raw_routes = _bfs_find_routes(origin, destination, max_routes=5, max_transfers=3)
+def _load_timetable_network(calendar: str, snap: NetworkSnapshot) -> Optional[TimetableNetwork]:
+    """RAPTOR network for one ODPT calendar, or None if no timetables are loaded."""
+    global _timetable_networks
 
-    # If BFS finds nothing → fallback routes
-    if not raw_routes:
-        return _fallback_routes(origin, destination)
+    store = _load_timetable_store()
+    if not store:
+        return None
 
-    routes = []
-    seen_signatures = set()
+    key = (snap.version, calendar)
+    built_from, networks = _timetable_networks
+    network = networks.get(key) if built_from is store else None
+    if network is None:
+        # Build each network once, however many queries are waiting for it
+        with _timetable_lock:
+            built_from, networks = _timetable_networks
+            if built_from is not store:
+                networks = {}
+            network = networks.get(key)
+            if network is None:
+                network = build_timetable_network(store, calendar, lambda odpt_id: _odpt_station_key(odpt_id, snap))
+                # Networks built for older snapshots are no longer needed
+                networks = {k: n for k, n in networks.items() if k[0] == snap.version}
+                networks[key] = network
+                _timetable_networks = (store, networks)
+    return network
 
-    for raw_route in raw_routes:
-        segments = _consolidate_segments(raw_route)
-        if not segments:
-            continue
+def next_departures(station: str, date: str | None = None, time: str | None = None,
+                    direction: str | None = None, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Next departures from a station (ODPT station ID or any name the route
+    finder recognizes) at or after time on the date's calendar.
+    """
+    store = _load_timetable_store()
+    if station.startswith("odpt.Station:"):
+        odpt_ids = [station]
+    else:
+        snap = _snapshot()
+        key = _find_station(station, snap)
+        odpt_ids = list(snap.join.odpt_ids[snap.net.station_index[key]]) if key else []
+
+    if time is None:
+        now = datetime.now()
+        time = f"{now.hour:02d}:{now.minute:02d}"
+    calendar = calendar_for_date(date)
+    after = parse_clock(time)
+
+    departures = []
+    for odpt_id in odpt_ids:
+        departures.extend(store.next_departures(odpt_id, calendar, after, limit, direction))
+    departures.sort(key=lambda d: parse_clock(d.departure_time))
+    return [d._asdict() for d in departures[:limit]]
+
+def _journey_to_route(journey: Journey, net: CompiledNetwork) -> Dict[str, Any]:
+    """Convert a RAPTOR journey into the route dict used by the rest of the app."""
+
+    def display(key: str) -> str:
+        sid = net.station_index.get(key)
+        return net.display_name(sid) if sid is not None else key.replace("-", " ").title()
+
+    segments = []
+    for i, leg in enumerate(journey.legs):
+        line_info = net.lines.get(leg.line, {})
+        if i > 0:
+            prev = journey.legs[i - 1]
+            prev_info = net.lines.get(prev.line, {})
+            segments.append({
+                "type": "transfer",
+                "from_station": display(prev.to_stop),
+                "to_station": display(leg.from_stop),
+                "from_line": prev_info.get('name', prev.line),
+                "to_line": line_info.get('name', leg.line),
+                "from_line_id": prev.line,
+                "to_line_id": leg.line,
+                # Real waiting time between arriving and the next departure
+                "duration_seconds": leg.departure - prev.arrival,
+                "is_transfer": True,
+                "same_company_transfer": prev_info.get("operator") == line_info.get("operator")
+            })
+        segments.append({
+            "type": "ride",
+            "from_station": display(leg.from_stop),
+            "to_station": display(leg.to_stop),
+            "line": line_info.get('name', leg.line),
+            "line_ids": [leg.line],
+            "duration_seconds": leg.arrival - leg.departure,
+            "departure_time": format_clock(leg.departure),
+            "arrival_time": format_clock(leg.arrival),
+            "is_transfer": False,
+            "through_service": False
+        })
+
+    return {
+        "name": _generate_route_name(segments),
+        "segments": segments,
+        "departure_time": format_clock(journey.departure),
+        "arrival_time": format_clock(journey.arrival)
+    }
+
+def _timetable_routes(snap: NetworkSnapshot, origin_key: str, dest_key: str, date: str | None, time: str,
+                      time_type: str) -> List[Dict[str, Any]]:
+    """Routes from the RAPTOR timetable engine; empty if the timetables do not cover the query."""
+    network = _load_timetable_network(calendar_for_date(date), snap)
+    if network is None:
+        return []
+
+    query_time = parse_clock(time)
+    if time_type == "arrival":
+        journeys = latest_departure(network, origin_key, dest_key, query_time)
+        journeys.sort(key=lambda j: -j.departure)
+    else:
+        journeys = earliest_arrival(network, origin_key, dest_key, query_time)
+        journeys.sort(key=lambda j: j.arrival)
+    return [_journey_to_route(j, snap.net) for j in journeys]
+
+def find_routes(origin: str, destination: str, date: str | None = None, time: str | None = None, time_type: str = "departure",
+                max_routes: int = 5, diversity_threshold: float = 0.3, stats: Optional[Dict[str, int]] = None,
+                via: Optional[Sequence[str]] = None, search: str = DEFAULT_SEARCH) -> List[Dict[str, Any]]:
+    """
+    Find up to max_routes route alternatives between origin and destination,
+    passing through the via stations (if any) in order.
+
+    Graph-search alternatives must each differ from the others in at least
+    diversity_threshold of their ride time; search picks the shortest-path
+    algorithm ("dijkstra", "astar" or "bidirectional").
+
+    When a time is given, there are no via stations and timetables cover
+    both stations, routes come from the RAPTOR timetable engine for the
+    date's calendar: time_type "departure" leaves at or after time,
+    "arrival" arrives by it. Otherwise the average-speed graph search is used,
+    with the realtime line statuses published by set_line_statuses():
+    delays are added when a line is boarded and suspended lines are avoided.
+
+    The whole query runs on the network snapshot and line statuses current
+    when it starts. Results are cached by resolved station keys, options and
+    line status version; every call returns its own mutable copy.
 
-        transfer_stations = tuple(s["from_station"] for s in segments if s["type"] == "transfer")
-        lines_used = tuple(s["line"] for s in segments if s["type"] == "ride")
-        signature = (transfer_stations, lines_used)
+    If a stats dict is passed, the number of labels the search expanded is
+    stored in it under "expanded" and whether the result came from the
+    cache under "cached". Raises ValueError for a malformed time or date.
+    """
+
+    # Malformed input is a ValueError here, before it reaches the cache key
+    # or a search
+    calendar = None
+    if time:
+        parse_clock(time)
+        calendar = calendar_for_date(date)
+
+    snap = _snapshot()
+    overlay = _line_overlay(snap)
+
+    station_keys = [_find_station(station, snap) for station in [origin, destination, *(via or ())]]
+    cache_key = None
+    if all(station_keys):
+        cache_key = (tuple(station_keys), len(via or ()), calendar,
+                     time, time_type, max_routes, diversity_threshold, search, overlay.version)
+        cached = _route_cache.get(cache_key, snap.version)
+        if cached is not None:
+            routes, expanded = cached
+            if stats is not None:
+                stats["expanded"] = expanded
+                stats["cached"] = True
+            return thaw(routes)
+
+    routes, expanded = _search_routes(snap, origin, destination, date, time, time_type, max_routes,
+                                      diversity_threshold, via or (), search, overlay)
+    if stats is not None:
+        stats["expanded"] = expanded
+        stats["cached"] = False
+    if cache_key is not None:
+        # put() stores a frozen copy, so routes stays private to this caller
+        _route_cache.put(cache_key, (routes, expanded), snap.version)
+    return routes
+
+def _walk_segment(from_name: str, to_name: str, km: float, walking_speed: str) -> Dict[str, Any]:
+    return {
+        "type": "walk",
+        "from_station": from_name,
+        "to_station": to_name,
+        "distance_m": round(km * 1000),
+        "duration_seconds": _walk_seconds(km, walking_speed),
+        "is_transfer": False,
+    }
 
-        if signature in seen_signatures:
+def find_routes_between_coordinates(origin: LatLon, destination: LatLon, max_routes: int = 5,
+                                    diversity_threshold: float = 0.3, walking_speed: str = "normal",
+                                    stats: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+    """
+    Find up to max_routes routes between two (lat, lon) points.
+
+    The ACCESS_CANDIDATES stations nearest each point within MAX_ACCESS_KM
+    all seed one bidirectional search, each starting from its walking time,
+    so the search itself picks which station to walk to and from instead of
+    running a query per candidate pair. Routes start and end with "walk"
+    segments; if the points are within MAX_ACCESS_KM of each other, walking
+    the whole way is offered too. Uses the average-speed graph search (no
+    timetables, no caching).
+
+    Raises ValueError if a point has no station within MAX_ACCESS_KM and
+    the points are too far apart to walk.
+    """
+    snap = _snapshot()
+    net = snap.net
+    access = {sid: _walk_seconds(km, walking_speed) for km, sid in
+              snap.spatial_index.nearest(origin, ACCESS_CANDIDATES, MAX_ACCESS_KM)}
+    egress = {sid: _walk_seconds(km, walking_speed) for km, sid in
+              snap.spatial_index.nearest(destination, ACCESS_CANDIDATES, MAX_ACCESS_KM)}
+    direct_km = haversine_km(origin, destination)
+    if direct_km > MAX_ACCESS_KM and not (access and egress):
+        # Never route around a walk of unbounded length to the nearest station
+        raise ValueError(f"No station within {MAX_ACCESS_KM} km of the {'destination' if access else 'origin'}")
+
+    paths, expanded = [], 0
+    if access and egress:
+        paths, expanded = _alternative_paths(snap, access, egress, max_routes, MAX_TRANSFERS_PER_LEG,
+                                             diversity_threshold, search="bidirectional", overlay=_line_overlay(snap))
+    if stats is not None:
+        stats["expanded"] = expanded
+
+    routes = []
+    for path in paths:
+        first, last = path.hops[0][0], path.hops[-1][1]
+        if first == last:
+            # Out and back to the same station; walking through it is quicker
             continue
+        segments = _consolidate_segments(path.hops, snap)
+        routes.append((path.cost, {
+            "name": _generate_route_name(segments),
+            "segments": [
+                _walk_segment("Origin", net.display_name(first), haversine_km(origin, snap.coordinates[first]), walking_speed),
+                *segments,
+                _walk_segment(net.display_name(last), "Destination", haversine_km(snap.coordinates[last], destination), walking_speed),
+            ],
+        }))
 
-        seen_signatures.add(signature)
-        route_name = _generate_route_name(segments)
+    if direct_km <= MAX_ACCESS_KM:
+        walk = _walk_segment("Origin", "Destination", direct_km, walking_speed)
+        routes.append((walk["duration_seconds"], {"name": "Walk", "segments": [walk]}))
+
+    routes.sort(key=lambda r: r[0])
+    return [route for _cost, route in routes[:max_routes]]
+
+def route_cache_stats() -> Dict[str, int]:
+    """Hit, miss and eviction counters of the route result cache."""
+    return _route_cache.stats()
+
+def _search_routes(snap: NetworkSnapshot, origin: str, destination: str, date: str | None, time: str | None, time_type: str,
+                   max_routes: int, diversity_threshold: float, via: Sequence[str],
+                   search: str = DEFAULT_SEARCH,
+                   overlay: Optional[LineOverlay] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """Uncached body of find_routes: the routes and the number of labels expanded."""
+    if time and not via:
+        origin_key = _find_station(origin, snap)
+        dest_key = _find_station(destination, snap)
+        if origin_key and dest_key and origin_key != dest_key:
+            timetable_routes = _timetable_routes(snap, origin_key, dest_key, date, time, time_type)
+            if timetable_routes:
+                return timetable_routes[:max_routes], 0
+
+    # Each leg between waypoints may transfer as often as a direct query,
+    # plus one change of train at every waypoint.
+    legs = len(via) + 1
+    result = _find_alternative_routes(origin, destination, max_routes=max_routes,
+                                      max_transfers=MAX_TRANSFERS_PER_LEG * legs + legs - 1,
+                                      diversity_threshold=diversity_threshold, via=via, snap=snap, search=search,
+                                      overlay=overlay)
+    raw_routes = result.routes
+
+    # If the search finds nothing → fallback routes
+    if not raw_routes:
+        return ([] if via else _fallback_routes(origin, destination)), result.expanded
+
+    routes = []
+    for raw_route in raw_routes:
+        segments = _consolidate_segments(raw_route, snap)
+        if not segments:
+            continue
 
         routes.append({
-            "name": route_name,
+            "name": _generate_route_name(segments),
             "segments": segments
         })
 
-    routes.sort(key=lambda r: (
-        len([s for s in r["segments"] if s["type"] == "transfer"]),
-        sum(s["duration_seconds"] for s in r["segments"] if s["type"] == "ride")
-    ))
-
-    return routes[:5]
+    # Alternatives are already ranked by estimated travel time.
+    return routes, result.expanded
 
 def _fallback_routes(origin: str, destination: str) -> List[Dict[str, Any]]:
     """Fallback routes for known origin-destination pairs."""
@@ -466,22 +1362,42 @@ def _matches(station_name: str, search: str) -> bool:
 
 def get_all_stations() -> List[str]:
     """Get a list of all station names in the network."""
-    _load_network()
-    stations = set()
-    for line_data in _network.get("lines", {}).values():
-        for station in line_data.get("stations", []):
-            stations.add(station)
-    return sorted(stations)
+    return sorted(_load_network().station_names)
+
+def get_station_records() -> List[Dict[str, Any]]:
+    """
+    Every network station with its Japanese name, ODPT station IDs, station
+    codes and position, sorted by English name.
+    """
+    snap = _snapshot()
+    net = snap.net
+    join = snap.join
+    records = []
+    for sid, key in enumerate(net.station_keys):
+        coords = snap.coordinates[sid]
+        records.append({
+            "id": key,
+            "name_en": net.station_names[sid],
+            "name_ja": join.names_ja[sid],
+            "odpt_ids": list(join.odpt_ids[sid]),
+            "codes": list(join.codes[sid]),
+            "lat": coords[0] if coords else None,
+            "lon": coords[1] if coords else None,
+        })
+    return sorted(records, key=lambda r: r["name_en"])
 
 def get_all_lines() -> List[Dict[str, str]]:
     """Get a list of all lines with their names."""
-    _load_network()
+    snap = _snapshot()
+    net = snap.net
     lines = []
-    for line_id, line_data in _network.get("lines", {}).items():
+    for line_id, line_data in net.lines.items():
+        line = net.line_index[line_id]
         lines.append({
             "id": line_id,
             "name": line_data.get("name", line_id),
-            "name_ja": line_data.get("name_ja", ""),
+            "name_ja": snap.join.line_names_ja[line],
+            "odpt_id": snap.join.railway_ids[line],
             "color": line_data.get("color", "#666666"),
             "operator": line_data.get("operator", "")
         })
@@ -5,10 +5,10 @@ Route scoring logic for the Japan Route Optimizer.
 This converts human comfort into math.
 """
 
-import json
-from pathlib import Path
 from typing import Optional, Dict
 
+from network_graph import normalize_station, line_pair
+
 HELL_STATIONS = {
     "Otemachi": 90,       # 90 seconds penalty
     "Shinjuku": 75,
@@ -34,33 +34,26 @@ def calculate_fare(segment: dict, fare_type: str = "ic", seat_type: str = "unres
         
     return base_fare
 
-# Load transfer database
-_transfer_db = None
-
-def _load_transfers():
-    global _transfer_db
-    if _transfer_db is None:
-        transfer_path = Path('data/transfers.json')
-        if transfer_path.exists():
-            _transfer_db = json.loads(transfer_path.read_text(encoding='utf-8'))
-        else:
-            _transfer_db = []
-    return _transfer_db
-
-def find_transfer_data(station: str, from_line: str, to_line: str) -> Optional[Dict]:
-    """Find transfer data for a specific station and line combination."""
-    transfers = _load_transfers()
+def build_transfer_index(transfers: list) -> Dict[tuple, Dict]:
+    """
+    Index transfer records by (normalized station, unordered line pair).
+    A transfer is looked up in either direction; the first record listed
+    for a station and line pair wins.
+    """
+    index = {}
     for t in transfers:
-        if (t['station'].lower() == station.lower() and 
-            t['from_line'] == from_line and 
-            t['to_line'] == to_line):
-            return t
-        # Also check reverse direction
-        if (t['station'].lower() == station.lower() and 
-            t['from_line'] == to_line and 
-            t['to_line'] == from_line):
-            return t
-    return None
+        key = (normalize_station(t['station']), line_pair(t['from_line'], t['to_line']))
+        index.setdefault(key, t)
+    return index
+
+def find_transfer_data(station: str, from_line: str, to_line: str,
+                       transfer_index: Dict[tuple, Dict]) -> Optional[Dict]:
+    """
+    Find transfer data for a specific station and line combination in a
+    build_transfer_index() index, normally the network snapshot's, so scores
+    follow a reloaded transfers.json just like the route search does.
+    """
+    return transfer_index.get((normalize_station(station), line_pair(from_line, to_line)))
 
 def calculate_transfer_time(transfer_data: Dict, walking_speed: str = "normal") -> float:
     """
@@ -120,14 +113,19 @@ def calculate_transfer_time(transfer_data: Dict, walking_speed: str = "normal")
     
     return max(30, total)  # Minimum 30 seconds for any transfer
 
-def score_segment(segment: dict, walking_speed: str = "normal") -> dict:
+def score_segment(segment: dict, walking_speed: str = "normal",
+                  transfer_index: Optional[Dict[tuple, Dict]] = None) -> dict:
     """
+    transfer_index is the snapshot's index of transfers.json records; without
+    it, transfers are scored from the segment alone.
+
     A segment is expected to contain:
     - duration_seconds: int (riding time)
     - from_station: str
     - to_station: str
     - from_line: str (optional, for transfer lookup)
     - to_line: str (optional, for transfer lookup)
+    - from_line_id / to_line_id: str (optional, preferred over from_line/to_line for transfer lookup)
     - is_transfer: bool (whether this segment is a transfer)
     
     Legacy fields (still supported):
@@ -139,8 +137,8 @@ def score_segment(segment: dict, walking_speed: str = "normal") -> dict:
     base = segment.get("duration_seconds", 0)
     from_s = segment.get("from_station", "")
     to_s = segment.get("to_station", "")
-    from_line = segment.get("from_line", "")
-    to_line = segment.get("to_line", "")
+    from_line = segment.get("from_line_id") or segment.get("from_line", "")
+    to_line = segment.get("to_line_id") or segment.get("to_line", "")
     is_transfer = segment.get("is_transfer", False)
     
     # Initialize penalties
@@ -153,10 +151,13 @@ def score_segment(segment: dict, walking_speed: str = "normal") -> dict:
     # If this is a transfer segment, try to find detailed transfer data
     if is_transfer and from_line and to_line:
         # Try to find in transfer database
-        transfer_data = find_transfer_data(from_s, from_line, to_line)
+        transfer_data = find_transfer_data(from_s, from_line, to_line, transfer_index) if transfer_index else None
         if transfer_data:
             # Use detailed transfer calculation
             transfer_penalty = calculate_transfer_time(transfer_data, walking_speed)
+        elif segment.get("distance_m"):
+            # Footpath between two stations: a plain walk of that distance
+            transfer_penalty = calculate_transfer_time({"distance_m": segment["distance_m"]}, walking_speed)
         else:
             # Fall back to legacy calculation
             walk = segment.get("walk_seconds", 120)  # Default 2min transfer
@@ -202,10 +203,14 @@ def score_segment(segment: dict, walking_speed: str = "normal") -> dict:
     }
 
 
-def score_route(route: dict, fare_type: str = "ic", seat_type: str = "unreserved", walking_speed: str = "normal") -> dict:
+def score_route(route: dict, fare_type: str = "ic", seat_type: str = "unreserved", walking_speed: str = "normal",
+                transfer_index: Optional[Dict[tuple, Dict]] = None) -> dict:
     """
     Expects:
     { "segments": [ { ... }, { ... } ] }
+
+    Pass the network snapshot's transfer_index (route_finder.transfer_index())
+    to score transfers from transfers.json.
     """
     segments = route.get("segments", [])
     breakdown = []
@@ -213,7 +218,7 @@ def score_route(route: dict, fare_type: str = "ic", seat_type: str = "unreserved
     total_fare = 0
 
     for seg in segments:
-        result = score_segment(seg, walking_speed=walking_speed)
+        result = score_segment(seg, walking_speed=walking_speed, transfer_index=transfer_index)
         # Placeholder: Add fare calculation to segment scoring
         # In a real scenario, fare would be calculated per ride segment
         if seg.get("type") == "ride":
@@ -0,0 +1,93 @@
+"""
+Benchmark the route search algorithms by labels expanded and latency.
+
+Runs every search mode (plain Dijkstra, geo A*, bidirectional) over the
+same origin/destination pairs: a few long cross-city queries plus random
+pairs. It reports total labels expanded and median / p95 latency, both
+for a single shortest-path search and for the full alternatives search
+find_routes runs, and checks that every mode finds the same cheapest cost.
+
+Usage: python scripts/benchmark_search.py [random_pairs] [seed] [data_dir]
+"""
+
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import route_finder  # noqa: E402
+from network_bundle import load_snapshot  # noqa: E402
+from network_snapshot import NetworkSnapshotManager  # noqa: E402
+
+LONG_PAIRS = [
+    ("Tokorozawa", "Yokohama"),
+    ("Hanno", "Yokohama"),
+    ("Hanno", "Shinagawa"),
+    ("Odawara", "Toyosu"),
+    ("Tokorozawa", "Kinshicho"),
+]
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    random_pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    if len(sys.argv) > 3:
+        # e.g. a directory with a generated network.json (scripts/build_network.py)
+        route_finder._snapshots = NetworkSnapshotManager(Path(sys.argv[3]), build=load_snapshot)
+
+    snap = route_finder._snapshot()
+    net = snap.net
+    rng = random.Random(seed)
+    pairs = [(route_finder._find_station(o), route_finder._find_station(d)) for o, d in LONG_PAIRS
+             if route_finder._find_station(o) and route_finder._find_station(d)]
+    pairs += [tuple(rng.sample(net.station_keys, 2)) for _ in range(random_pairs)]
+    ids = [(net.station_index[o], net.station_index[d]) for o, d in pairs]
+
+    print(f"{len(pairs)} pairs, {net.num_stations} stations, "
+          f"heuristic top speed {3600 / snap.seconds_per_km:.0f} km/h\n")
+    print(f"{'mode':<14}{'search':<14}{'expanded':>10}{'median ms':>11}{'p95 ms':>9}")
+
+    costs = {}
+    for mode in route_finder.SEARCH_MODES:
+        expanded = 0
+        latencies = []
+        costs[mode] = []
+        for origin, destination in ids:
+            start = time.perf_counter()
+            if mode == "bidirectional":
+                path = route_finder._bidirectional_path(snap, origin, destination, route_finder.MAX_TRANSFERS_PER_LEG)
+            else:
+                potentials = route_finder._potentials(snap, destination) if mode == "astar" else None
+                path = route_finder._shortest_path(snap, origin, destination, route_finder.MAX_TRANSFERS_PER_LEG,
+                                                   potentials=potentials)
+            latencies.append((time.perf_counter() - start) * 1000)
+            expanded += path.expanded
+            costs[mode].append(path.cost)
+        print(f"{mode:<14}{'single':<14}{expanded:>10}{statistics.median(latencies):>11.2f}{_percentile(latencies, 0.95):>9.2f}")
+
+        expanded = 0
+        latencies = []
+        for origin, destination in pairs:
+            start = time.perf_counter()
+            result = route_finder._find_alternative_routes(origin, destination, search=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+            expanded += result.expanded
+        print(f"{mode:<14}{'alternatives':<14}{expanded:>10}{statistics.median(latencies):>11.2f}{_percentile(latencies, 0.95):>9.2f}")
+
+    reference = costs[route_finder.SEARCH_MODES[0]]
+    for mode, mode_costs in costs.items():
+        mismatches = sum(1 for a, b in zip(reference, mode_costs) if a != b)
+        if mismatches:
+            print(f"\n{mode}: {mismatches} pairs with a different cheapest cost")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Generate data/network.json from the ODPT railway station orders.
+
+Reads train_lines.json and stations.json, builds the network with
+odpt_network.build_network on top of the hand-maintained network (kept as
+network_base.json the first time this replaces network.json) and prints
+the validation report. A running server picks the new network up on its
+next reload; run scripts/compile_network.py afterwards to refresh the
+bundle.
+
+Usage: python scripts/build_network.py [--data-dir data] [--output PATH] [--report PATH] [--strict]
+"""
+
+import argparse
+import json
+import shutil
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from odpt_network import build_network  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-dir", type=Path, default=Path("data"))
+    parser.add_argument("--output", type=Path, help="where to write the network (default: <data-dir>/network.json)")
+    parser.add_argument("--report", type=Path, help="also write the report as JSON")
+    parser.add_argument("--strict", action="store_true", help="exit with status 1 if the report has warnings")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir
+    output = args.output or data_dir / "network.json"
+    base_path = data_dir / "network_base.json"
+    if not base_path.exists():
+        base_path = data_dir / "network.json"
+
+    railways = json.loads((data_dir / "train_lines.json").read_text(encoding="utf-8"))
+    stations = json.loads((data_dir / "stations.json").read_text(encoding="utf-8"))
+    base = json.loads(base_path.read_text(encoding="utf-8")) if base_path.exists() else None
+    network, report = build_network(railways, stations, base)
+
+    if output == data_dir / "network.json" and base_path == output:
+        shutil.copyfile(output, data_dir / "network_base.json")
+        print(f"Kept the hand-maintained network as {data_dir / 'network_base.json'}")
+    tmp = output.with_suffix(".tmp")
+    tmp.write_text(json.dumps(network, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(output)
+    print(f"Wrote {output}")
+    print(report.format())
+
+    if args.report:
+        args.report.write_text(json.dumps(report.to_dict(), ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.strict and report.warnings():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
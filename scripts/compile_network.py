@@ -0,0 +1,45 @@
+"""
+Compile the network data files into data/network.bundle.
+
+Workers memory-map the bundle instead of parsing stations.json and the
+station timetables and running the graph, join and footpath builders, as
+long as it was compiled from the current files. The network.json and
+transfers.json documents are kept as JSON in the bundle, and the search
+and spatial indexes are rebuilt from it at load. Run this after fetching
+new data.
+
+Usage: python scripts/compile_network.py [data_dir]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from network_bundle import Bundle, compile_bundle, load_snapshot, load_timetables  # noqa: E402
+from network_snapshot import build_snapshot  # noqa: E402
+from timetable import load_timetable_store  # noqa: E402
+
+
+def main():
+    data_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("data")
+
+    start = time.perf_counter()
+    path, size = compile_bundle(data_dir)
+    print(f"Wrote {path} ({size / 1024:.0f} KB, {len(Bundle(path).sections)} sections) "
+          f"in {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    build_snapshot(data_dir, 1)
+    load_timetable_store(data_dir)
+    parsed = time.perf_counter() - start
+    start = time.perf_counter()
+    load_snapshot(data_dir, 1)
+    load_timetables(data_dir)
+    mapped = time.perf_counter() - start
+    print(f"Startup from JSON {parsed * 1000:.0f} ms, from the bundle {mapped * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
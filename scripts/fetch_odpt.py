@@ -1,55 +1,73 @@
-import os, json
+"""
+Fetch the ODPT railway, station and station timetable data into data/.
+
+Railways and stations are kept as data/train_lines.ndjson and
+data/stations.ndjson and exported to train_lines.json / stations.json when
+they change; timetables for every station go to
+data/station_timetables.ndjson, which the timetable loader reads directly.
+Records whose dc:date has not changed are not rewritten, and files with no
+changes keep their mtime, so the network bundle stays current.
+
+Usage: python scripts/fetch_odpt.py [--data-dir data] [--concurrency N] [--rate PER_SECOND]
+                                    [--retries N] [--skip-timetables]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
 from pathlib import Path
+
 from dotenv import load_dotenv
-import requests
 
-load_dotenv()
-BASE = os.getenv('ODPT_BASE', 'https://api.odpt.org/api/v4')
-TOKEN = os.getenv('ODPT_TOKEN')
-if not TOKEN:
-    raise SystemExit('Set ODPT_TOKEN in .env')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-DATA_DIR = Path('data')
-DATA_DIR.mkdir(exist_ok=True)
+from odpt_fetch import (BASE, DEFAULT_CONCURRENCY, DEFAULT_RATE_PER_SECOND, DEFAULT_RETRIES,  # noqa: E402
+                        OdptFetcher, fetch_datasets)
 
-HEADERS = {'Accept': 'application/json'}
+STARTER_TRANSFERS = [
+    {"station":"Ikebukuro","from_line":"Fukutoshin","to_line":"Seibu","distance_m":380,"floors":2,"stairs":3,"escalators":2,"crowd_factor":1.4,"confusion_level":3.5},
+    {"station":"Nerima","from_line":"Fukutoshin","to_line":"Seibu","distance_m":45,"floors":0,"stairs":0,"escalators":0,"crowd_factor":1.1,"confusion_level":0.5},
+    {"station":"Iidabashi","from_line":"Yurakucho","to_line":"Tozai","distance_m":260,"floors":1,"stairs":2,"escalators":1,"crowd_factor":1.5,"confusion_level":2.0},
+    {"station":"Otemachi","from_line":"Yurakucho","to_line":"Tozai","distance_m":160,"floors":0,"stairs":1,"escalators":2,"crowd_factor":1.2,"confusion_level":1.0}
+]
 
-def fetch(endpoint, params=None):
-    params = params or {}
-    params.update({'acl:consumerKey': TOKEN})
-    url = f"{BASE}/{endpoint}"
-    r = requests.get(url, params=params, headers=HEADERS, timeout=30)
-    r.raise_for_status()
-    return r.json()
 
-if __name__ == '__main__':
-    print('Fetching odpt:Railway...')
-    railways = fetch('odpt:Railway')
-    (DATA_DIR / 'train_lines.json').write_text(json.dumps(railways, ensure_ascii=False, indent=2), encoding='utf-8')
-    print('Saved data/train_lines.json')
-
-    print('Fetching odpt:Station...')
-    stations = fetch('odpt:Station')
-    (DATA_DIR / 'stations.json').write_text(json.dumps(stations, ensure_ascii=False, indent=2), encoding='utf-8')
-    print('Saved data/stations.json')
-
-    print('Fetching odpt:StationTimetable (sample)...')
-    # Fetch a sample of station timetable data for major stations
-    # In a real scenario, this might need to be more comprehensive or fetched on-demand.
-    station_timetables = fetch('odpt:StationTimetable', params={'odpt:station': 'odpt.Station:TokyoMetro.Marunouchi.Tokyo'})
-    (DATA_DIR / 'station_timetables_sample.json').write_text(json.dumps(station_timetables, ensure_ascii=False, indent=2), encoding='utf-8')
-    print('Saved data/station_timetables_sample.json')
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data-dir', type=Path, default=Path('data'))
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE_PER_SECOND, help='requests per second')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES)
+    parser.add_argument('--skip-timetables', action='store_true')
+    args = parser.parse_args()
+
+    load_dotenv()
+    token = os.getenv('ODPT_TOKEN')
+    if not token:
+        raise SystemExit('Set ODPT_TOKEN in .env')
+    args.data_dir.mkdir(exist_ok=True)
+
+    fetcher = OdptFetcher(os.getenv('ODPT_BASE', BASE), token, args.concurrency, args.rate, args.retries)
+    start = time.perf_counter()
+    try:
+        ok = asyncio.run(fetch_datasets(fetcher, args.data_dir, not args.skip_timetables))
+    finally:
+        fetcher.close()
+    print(f'{fetcher.requests} requests ({fetcher.retried} retried) in {time.perf_counter() - start:.1f} s')
 
     # Create starter transfers.json if not exists
-    transfers_path = DATA_DIR / 'transfers.json'
+    transfers_path = args.data_dir / 'transfers.json'
     if not transfers_path.exists():
-        starter = [
-            {"station":"Ikebukuro","from_line":"Fukutoshin","to_line":"Seibu","distance_m":380,"floors":2,"stairs":3,"escalators":2,"crowd_factor":1.4,"confusion_level":3.5},
-            {"station":"Nerima","from_line":"Fukutoshin","to_line":"Seibu","distance_m":45,"floors":0,"stairs":0,"escalators":0,"crowd_factor":1.1,"confusion_level":0.5},
-            {"station":"Iidabashi","from_line":"Yurakucho","to_line":"Tozai","distance_m":260,"floors":1,"stairs":2,"escalators":1,"crowd_factor":1.5,"confusion_level":2.0},
-            {"station":"Otemachi","from_line":"Yurakucho","to_line":"Tozai","distance_m":160,"floors":0,"stairs":1,"escalators":2,"crowd_factor":1.2,"confusion_level":1.0}
-        ]
-        transfers_path.write_text(json.dumps(starter, ensure_ascii=False, indent=2), encoding='utf-8')
-        print('Created data/transfers.json (starter entries)')
-
-    print('Done.')
+        transfers_path.write_text(json.dumps(STARTER_TRANSFERS, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f'Created {transfers_path} (starter entries)')
+
+    print('Done.' if ok else 'Done, with failures; unfetched records were kept.')
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Station and line identities across datasets, joined once at load time.
+
+The route finder knows a station by its key ("nishi-waseda") and its ID in
+the compiled network; stations.json, the timetables and train information
+use ODPT IDs ("odpt.Station:TokyoMetro.Fukutoshin.NishiWaseda",
+"odpt.Railway:TokyoMetro.Fukutoshin"); the UI shows English and Japanese
+names. JoinIndex matches all of them when a snapshot is built - by station
+key, falling back to the folded name so "Omote-sando" meets "Omotesando"
+and "Nijubashimae<Marunouchi>" meets "Nijubashimae" -
+and keeps the result in tuples indexed by station and line ID. After that
+every lookup is a tuple index or a dict get; nothing joins strings on a
+request path.
+"""
+
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from geo import LatLon
+from network_graph import CompiledNetwork, normalize_station
+from station_search import fold_name
+
+RAILWAY_PREFIX = "odpt.Railway:"
+TRAIN_INFORMATION_PREFIX = "odpt.TrainInformation:"
+
+# Annotations ODPT appends to some English titles: "Oshiage<SKYTREE>"
+_TITLE_NOTE = re.compile(r"\s*[<(（].*?[>)）]\s*")
+
+
+def station_title(title: str) -> str:
+    """An ODPT English station title without annotations."""
+    return _TITLE_NOTE.sub("", title).strip()
+
+
+def station_fold(name: str) -> str:
+    """
+    fold_name plus the Hepburn n/m variants ("Kodemmacho" / "Kodenmacho",
+    "Shimbashi" / "Shinbashi"), for matching one station's names across
+    datasets.
+    """
+    # Hyphens go first, so "Hiro-o" folds its long vowel like "Hiroo"
+    folded = fold_name(station_title(name).replace("-", ""))
+    return folded.replace("mm", "nm").replace("mb", "nb").replace("mp", "np")
+
+
+class JoinIndex:
+    """ODPT IDs, Japanese names, codes and coordinates per station and line."""
+
+    def __init__(self, net: CompiledNetwork, stations: Iterable[Dict[str, Any]],
+                 railways: Iterable[Dict[str, Any]] = ()):
+        # Network station keys by folded name, where the fold is unambiguous
+        folded: Dict[str, List[int]] = defaultdict(list)
+        for sid, key in enumerate(net.station_keys):
+            folded[station_fold(key)].append(sid)
+
+        odpt_ids: List[List[str]] = [[] for _ in range(net.num_stations)]
+        codes: List[List[str]] = [[] for _ in range(net.num_stations)]
+        names_ja: List[str] = [""] * net.num_stations
+        surveyed: List[Optional[LatLon]] = [None] * net.num_stations
+        # ODPT station ID -> station key, for every ODPT station (also ones
+        # outside the network, which timetables still refer to)
+        self.odpt_keys: Dict[str, str] = {}
+        # ODPT station ID -> network station ID
+        self.station_by_odpt: Dict[str, int] = {}
+        connecting: List[Tuple[int, str]] = []
+        railway_ids = set()
+
+        for station in stations:
+            title = station.get("odpt:stationTitle", {})
+            if not title.get("en"):
+                continue
+            odpt_id = station.get("owl:sameAs", "")
+            key = normalize_station(station_title(title["en"]))
+            sid = net.station_index.get(key)
+            if sid is None and len(folded.get(station_fold(key), ())) == 1:
+                sid = folded[station_fold(key)][0]
+                key = net.station_keys[sid]
+            self.odpt_keys[odpt_id] = key
+            if station.get("odpt:railway"):
+                railway_ids.add(station["odpt:railway"])
+            if sid is None:
+                continue
+
+            self.station_by_odpt[odpt_id] = sid
+            odpt_ids[sid].append(odpt_id)
+            if station.get("odpt:stationCode") and station["odpt:stationCode"] not in codes[sid]:
+                codes[sid].append(station["odpt:stationCode"])
+            if title.get("ja") and not names_ja[sid]:
+                names_ja[sid] = title["ja"]
+            if surveyed[sid] is None and station.get("geo:lat") is not None and station.get("geo:long") is not None:
+                surveyed[sid] = (station["geo:lat"], station["geo:long"])
+            connecting.extend((sid, other) for other in station.get("odpt:connectingStation", []))
+
+        # Per network station ID
+        self.odpt_ids: Tuple[Tuple[str, ...], ...] = tuple(tuple(ids) for ids in odpt_ids)
+        self.codes: Tuple[Tuple[str, ...], ...] = tuple(tuple(c) for c in codes)
+        self.names_ja: Tuple[str, ...] = tuple(names_ja)
+        # Position from stations.json, None where it has none
+        self.surveyed_coordinates: Tuple[Optional[LatLon], ...] = tuple(surveyed)
+        # Station ID pairs linked by odpt:connectingStation
+        self.connections: Tuple[Tuple[int, int], ...] = tuple(
+            (sid, self.station_by_odpt[other]) for sid, other in connecting
+            if other in self.station_by_odpt and self.station_by_odpt[other] != sid)
+
+        railway_titles = {}
+        for railway in railways:
+            if railway.get("owl:sameAs"):
+                railway_ids.add(railway["owl:sameAs"])
+                railway_titles[railway["owl:sameAs"]] = railway.get("odpt:railwayTitle", {}).get("ja", "")
+
+        # Per network line ID
+        self.railway_ids: Tuple[Optional[str], ...] = tuple(
+            RAILWAY_PREFIX + key if RAILWAY_PREFIX + key in railway_ids else None for key in net.line_keys)
+        self.line_names_ja: Tuple[str, ...] = tuple(
+            net.lines[key].get("name_ja") or railway_titles.get(RAILWAY_PREFIX + key, "") for key in net.line_keys)
+        self._index_lines(net.line_keys)
+
+    @classmethod
+    def from_tables(cls, line_keys: Sequence[str], odpt_keys: Dict[str, str],
+                    odpt_ids: Sequence[Sequence[str]], codes: Sequence[Sequence[str]], names_ja: Sequence[str],
+                    surveyed_coordinates: Sequence[Optional[LatLon]], connections: Iterable[Tuple[int, int]],
+                    railway_ids: Sequence[Optional[str]], line_names_ja: Sequence[str]) -> "JoinIndex":
+        """An index from the tables of an earlier join (e.g. read back from a bundle)."""
+        join = cls.__new__(cls)
+        join.odpt_keys = odpt_keys
+        join.odpt_ids = tuple(tuple(ids) for ids in odpt_ids)
+        join.station_by_odpt = {odpt_id: sid for sid, ids in enumerate(join.odpt_ids) for odpt_id in ids}
+        join.codes = tuple(tuple(c) for c in codes)
+        join.names_ja = tuple(names_ja)
+        join.surveyed_coordinates = tuple(surveyed_coordinates)
+        join.connections = tuple(connections)
+        join.railway_ids = tuple(railway_ids)
+        join.line_names_ja = tuple(line_names_ja)
+        join._index_lines(line_keys)
+        return join
+
+    def _index_lines(self, line_keys: Sequence[str]):
+        # odpt.Railway and odpt.TrainInformation ID -> network line ID
+        self.line_by_odpt: Dict[str, int] = {}
+        for line, key in enumerate(line_keys):
+            self.line_by_odpt[RAILWAY_PREFIX + key] = line
+            self.line_by_odpt[TRAIN_INFORMATION_PREFIX + key] = line
+
+    def station_key(self, odpt_id: str) -> Optional[str]:
+        """Station key for an ODPT station ID, or None if stations.json does not list it."""
+        return self.odpt_keys.get(odpt_id)
+
+    def line(self, odpt_id: str) -> Optional[int]:
+        """Network line ID for an odpt.Railway or odpt.TrainInformation ID."""
+        return self.line_by_odpt.get(odpt_id)
+
+    def surveyed_by_key(self, net: CompiledNetwork) -> Dict[str, LatLon]:
+        """Coordinates from stations.json by station key."""
+        return {net.station_keys[sid]: c for sid, c in enumerate(self.surveyed_coordinates) if c is not None}
@@ -0,0 +1,156 @@
+"""
+Ranked station-name search.
+
+Station names are indexed once, in English, Japanese and common
+romanization variants (Ōtsuka / Ootsuka / Outsuka / Otsuka), into a prefix
+trie plus a character-bigram inverted index. Queries are ranked so an exact
+name always beats a longer name it is a prefix of ("ueno" finds Ueno before
+Ueno-okachimachi), with fuzzy bigram matches last.
+"""
+
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Score for each kind of match; the best match per station wins.
+EXACT_SCORE = 100.0
+PREFIX_SCORE = 80.0
+TOKEN_PREFIX_SCORE = 60.0
+FUZZY_SCORE = 40.0
+
+# Minimum bigram Dice similarity for a fuzzy match
+FUZZY_THRESHOLD = 0.6
+
+_STATION_SUFFIXES = ("station", "sta", "eki", "駅")
+
+
+def fold_name(name: str) -> str:
+    """
+    Fold a station name (or query) for matching.
+
+    Lowercases, applies NFKC, maps long vowels written as ō/ô/oo/ou to o (and
+    ū/uu to u), and drops spaces and hyphens, so all romanizations of a name
+    fold to the same string.
+    """
+    text = unicodedata.normalize("NFKC", name).lower().strip()
+    for suffix in _STATION_SUFFIXES:
+        if text.endswith(" " + suffix) or (not text.isascii() and text.endswith(suffix) and text != suffix):
+            text = text[: -len(suffix)].strip()
+    text = text.replace("ō", "o").replace("ô", "o").replace("ū", "u").replace("û", "u")
+    text = text.replace("ou", "o").replace("oo", "o").replace("uu", "u")
+    return "".join(ch for ch in text if ch not in " -_・'’.")
+
+
+def _tokens(name: str) -> List[str]:
+    """Word tokens of a name, folded, for matching at word starts."""
+    text = unicodedata.normalize("NFKC", name).lower().replace("_", " ").replace("-", " ")
+    return [fold_name(t) for t in text.split() if fold_name(t)]
+
+
+def _bigrams(term: str) -> Set[str]:
+    padded = f"^{term}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+class StationSearchIndex:
+    """Prefix trie plus bigram index over station name variants."""
+
+    def __init__(self, stations: Iterable[Tuple[str, Iterable[str]]]):
+        """stations is an iterable of (station_key, names) pairs."""
+        self.keys: List[str] = []
+        self._trie: Dict = {}
+        self._bigrams: Dict[str, List[int]] = defaultdict(list)
+        # term ID -> (folded term, station ID, is a full name)
+        self._terms: List[Tuple[str, int, bool]] = []
+        # Folded full name -> the station search() ranks first for it
+        self._exact: Dict[str, int] = {}
+
+        for key, names in stations:
+            sid = len(self.keys)
+            self.keys.append(key)
+            seen = set()
+            for name in names:
+                full = fold_name(name)
+                if full and (full, True) not in seen:
+                    seen.add((full, True))
+                    self._add_term(full, sid, True)
+                for token in _tokens(name):
+                    if token != full and (token, False) not in seen:
+                        seen.add((token, False))
+                        self._add_term(token, sid, False)
+
+    def _add_term(self, term: str, sid: int, is_full: bool):
+        term_id = len(self._terms)
+        self._terms.append((term, sid, is_full))
+
+        node = self._trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node.setdefault(None, []).append(term_id)
+
+        if is_full:
+            other = self._exact.get(term)
+            if other is None or (len(self.keys[sid]), self.keys[sid]) < (len(self.keys[other]), self.keys[other]):
+                self._exact[term] = sid
+            for gram in _bigrams(term):
+                self._bigrams[gram].append(term_id)
+
+    def _prefix_terms(self, prefix: str) -> Iterable[int]:
+        node = self._trie
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for ch, child in node.items():
+                if ch is None:
+                    yield from child
+                else:
+                    stack.append(child)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """Return up to limit (station_key, score) pairs, best first."""
+        folded = fold_name(query)
+        if not folded:
+            return []
+
+        best: Dict[int, float] = {}
+
+        def consider(sid: int, score: float):
+            if score > best.get(sid, 0):
+                best[sid] = score
+
+        for term_id in self._prefix_terms(folded):
+            term, sid, is_full = self._terms[term_id]
+            if not is_full:
+                consider(sid, TOKEN_PREFIX_SCORE)
+            elif term == folded:
+                consider(sid, EXACT_SCORE)
+            else:
+                # Prefer names that need fewer extra characters
+                consider(sid, PREFIX_SCORE - min(len(term) - len(folded), 10))
+
+        query_grams = _bigrams(folded)
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in query_grams:
+            for term_id in self._bigrams.get(gram, ()):
+                shared[term_id] += 1
+        for term_id, count in shared.items():
+            term, sid, _is_full = self._terms[term_id]
+            dice = 2 * count / (len(query_grams) + len(term) + 1)
+            if dice >= FUZZY_THRESHOLD:
+                consider(sid, FUZZY_SCORE * dice)
+
+        ranked = sorted(best.items(), key=lambda item: (-item[1], len(self.keys[item[0]]), self.keys[item[0]]))
+        return [(self.keys[sid], score) for sid, score in ranked[:limit]]
+
+    def best(self, query: str) -> Optional[str]:
+        """Return the best-matching station key, or None if nothing matches."""
+        # An exact name outranks everything, so it needs no scoring
+        sid = self._exact.get(fold_name(query))
+        if sid is not None:
+            return self.keys[sid]
+        results = self.search(query, limit=1)
+        return results[0][0] if results else None
@@ -0,0 +1,157 @@
+"""
+Server-sent events for line status changes.
+
+One StatusBroadcaster is fed by the train information poller. Each new
+snapshot is diffed against the previous one and only lines whose status
+changed are kept, in a short history of versioned diffs. Subscribers do not
+get their own queues: every connection only remembers the last version it
+sent and, when woken, merges the history since then, filtered to the lines
+it asked for. A slow client therefore gets one combined diff instead of a
+backlog, and a client that fell out of the history (or reconnects with a
+too-old Last-Event-ID) gets a fresh snapshot of its lines. Memory per
+connection stays constant however many there are.
+"""
+
+import asyncio
+import json
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, FrozenSet, Optional, Tuple
+
+from line_status import LineStatus
+
+# Versioned diffs kept for subscribers that are behind
+HISTORY_SIZE = 64
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_SECONDS = 15
+# Reconnect delay suggested to EventSource clients, in milliseconds
+RETRY_MILLISECONDS = 5000
+# Upper bound on concurrent streams
+MAX_SUBSCRIBERS = 10000
+
+SNAPSHOT = "snapshot"
+DIFF = "diff"
+HEARTBEAT = "heartbeat"
+
+# line ID -> new status, or None if the line is no longer reported
+StatusDiff = Dict[str, Optional[LineStatus]]
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+def _filter(statuses: Dict, lines: Optional[FrozenSet[str]]) -> Dict:
+    if lines is None:
+        return dict(statuses)
+    return {line: status for line, status in statuses.items() if line in lines}
+
+
+def _status_json(status: Optional[LineStatus]) -> Optional[Dict]:
+    return status._asdict() if status is not None else None
+
+
+class StatusBroadcaster:
+    """Fans line status changes out to any number of subscribers."""
+
+    def __init__(self, history_size: int = HISTORY_SIZE, max_subscribers: int = MAX_SUBSCRIBERS):
+        self.version = 0
+        self.statuses: Dict[str, LineStatus] = {}
+        self.subscribers = 0
+        self.max_subscribers = max_subscribers
+        self._history: Deque[Tuple[int, StatusDiff]] = deque(maxlen=history_size)
+        # Diffs up to this version have been dropped from the history
+        self._dropped_through = 0
+        self._changed = asyncio.Event()
+
+    def publish(self, version: int, statuses: Dict[str, LineStatus]):
+        """Record a new snapshot and wake subscribers. Call on the event loop."""
+        diff: StatusDiff = {line: status for line, status in statuses.items() if self.statuses.get(line) != status}
+        diff.update({line: None for line in self.statuses if line not in statuses})
+        if diff:
+            if len(self._history) == self._history.maxlen:
+                self._dropped_through = self._history[0][0]
+            self._history.append((version, diff))
+        self.version = version
+        self.statuses = dict(statuses)
+        # Replace the event so waiters wake once and later waits block again
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def changes_since(self, version: int, lines: Optional[FrozenSet[str]] = None) -> Optional[StatusDiff]:
+        """
+        Merged changes after version for the given lines (all lines if None),
+        or None if the history no longer reaches back that far.
+        """
+        if version < self._dropped_through:
+            return None
+        merged: StatusDiff = {}
+        for diff_version, diff in self._history:
+            if diff_version > version:
+                merged.update(diff)
+        return _filter(merged, lines)
+
+    async def subscribe(self, lines: Optional[FrozenSet[str]] = None,
+                        last_version: Optional[int] = None) -> AsyncIterator[Tuple[str, int, StatusDiff]]:
+        """
+        Yield (kind, version, statuses) events: a snapshot of the subscribed
+        lines first (or the changes since last_version when resuming), then a
+        diff whenever one of them changes, and heartbeats while idle.
+        """
+        if self.subscribers >= self.max_subscribers:
+            raise TooManySubscribers(f"{self.subscribers} streams already open")
+        self.subscribers += 1
+        try:
+            # Taken before yielding: publishes may happen while the caller holds an event
+            sent = self.version
+            changes = self.changes_since(last_version, lines) if last_version is not None else None
+            if changes is None or last_version > sent:
+                yield SNAPSHOT, sent, _filter(self.statuses, lines)
+            elif changes:
+                yield DIFF, sent, changes
+
+            while True:
+                if self.version == sent:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield HEARTBEAT, sent, {}
+                    continue
+                changes = self.changes_since(sent, lines)
+                sent = self.version
+                if changes is None:
+                    yield SNAPSHOT, sent, _filter(self.statuses, lines)
+                elif changes:
+                    yield DIFF, sent, changes
+        finally:
+            self.subscribers -= 1
+
+
+def format_event(kind: str, version: int, statuses: StatusDiff) -> str:
+    """One server-sent event; the version doubles as the event ID for resuming."""
+    if kind == HEARTBEAT:
+        return ": keep-alive\n\n"
+    data = {"version": version, "lines": {line: _status_json(status) for line, status in statuses.items()}}
+    return f"id: {version}\nevent: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def event_stream(broadcaster: StatusBroadcaster, lines: Optional[FrozenSet[str]] = None,
+                       last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+    """The text/event-stream body for one subscriber."""
+    last_version = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    yield f"retry: {RETRY_MILLISECONDS}\n\n"
+    async for kind, version, statuses in broadcaster.subscribe(lines, last_version):
+        yield format_event(kind, version, statuses)
+
+
+def parse_lines(lines: Optional[str]) -> Optional[FrozenSet[str]]:
+    """Comma-separated line IDs from a query parameter; None means every line."""
+    if not lines:
+        return None
+    return frozenset(line.strip() for line in lines.split(",") if line.strip())
+
+
+_broadcaster = StatusBroadcaster()
+
+
+def broadcaster() -> StatusBroadcaster:
+    return _broadcaster
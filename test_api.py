@@ -1,8 +1,14 @@
 """
 Tests for API endpoints
 """
+import io
+import json
+
+import numpy as np
 from fastapi.testclient import TestClient
+from line_status import SUSPENDED, LineStatus
 from main import app
+from route_finder import set_line_statuses
 
 client = TestClient(app)
 
@@ -49,6 +55,48 @@ def test_network_stations_normalized_ids():
         assert ' ' not in station['id']
 
 
+def test_stations_autocomplete_ranks_exact_match_first():
+    """Test that autocomplete puts the exact station before longer names."""
+    response = client.get('/api/stations/autocomplete?q=ueno')
+    assert response.status_code == 200
+
+    stations = response.json()['stations']
+    assert stations[0]['id'] == 'ueno'
+    assert all('name_ja' in s for s in stations)
+
+
+def test_stations_autocomplete_japanese_and_variants():
+    """Test that Japanese names and long-vowel spellings resolve to the same station."""
+    for query in ['渋谷', 'Shibuya']:
+        response = client.get('/api/stations/autocomplete', params={'q': query})
+        assert response.json()['stations'][0]['id'] == 'shibuya'
+
+    for query in ['Ōtsuka', 'Ootsuka', 'Otsuka']:
+        response = client.get('/api/stations/autocomplete', params={'q': query})
+        assert response.json()['stations'][0]['id'] == 'otsuka'
+
+
+def test_departures_from_sample_timetable():
+    """Test next departures from the bundled Marunouchi Tokyo timetable."""
+    response = client.get('/api/departures?station=Tokyo&date=2025-01-06&time=08:00&limit=3')
+    assert response.status_code == 200
+
+    departures = response.json()['departures']
+    assert len(departures) == 3
+    times = [d['departure_time'] for d in departures]
+    assert times == sorted(times)
+    assert all(t >= '08:00' for t in times)
+    assert all(d['calendar'] == 'Weekday' for d in departures)
+
+
+def test_departures_reject_malformed_time_and_date():
+    """Test that unparseable times and dates are a 400 with a readable message."""
+    for query in ['time=8', 'time=ab:cd', 'time=08:75', 'date=2025-13-01']:
+        response = client.get(f'/api/departures?station=Tokyo&{query}')
+        assert response.status_code == 400
+        assert 'expected' in response.json()['detail']
+
+
 def test_route_compare_missing_origin():
     """Test that missing origin returns error message."""
     response = client.get('/route-compare?destination=Tokorozawa')
@@ -77,9 +125,183 @@ def test_route_compare_same_station():
     assert b'must be different' in response.content
 
 
+def test_route_compare_malformed_time_and_date():
+    """Test that an unparseable time or date is an error on the page, not a 500."""
+    response = client.get('/route-compare?origin=Shibuya&destination=Ueno&time=8am')
+    assert response.status_code == 200
+    assert b'is not valid' in response.content and b'HH:MM' in response.content
+
+    response = client.get('/route-compare?origin=Shibuya&destination=Ueno&time=08:00&date=bad')
+    assert response.status_code == 200
+    assert b'YYYY-MM-DD' in response.content
+
+
 def test_route_compare_valid_stations():
     """Test that valid station pair returns routes."""
     response = client.get('/route-compare?origin=Shibuya&destination=Tokorozawa')
     assert response.status_code == 200
     # Should not have error message
     assert b'Please enter' not in response.content or b'not found' not in response.content
+
+
+def test_route_cache_stats():
+    """Test that the route cache counters are exposed."""
+    client.get('/route-compare?origin=Shibuya&destination=Ikebukuro')
+    client.get('/route-compare?origin=Shibuya&destination=Ikebukuro')
+    data = client.get('/api/route-cache/stats').json()
+    assert data['hits'] >= 1
+    assert data['misses'] >= 1
+
+
+def test_admin_network_status():
+    """Test that the live network snapshot version is reported."""
+    data = client.get('/api/admin/network').json()
+    assert data['version'] >= 1
+    assert data['stations'] > 0
+    assert 'network.json' in data['sources']
+
+
+def test_routes_batch_streams_ndjson():
+    """Test that a batch streams one result per pair, with per-pair errors."""
+    response = client.post('/api/routes/batch', json={'pairs': [
+        {'id': 'a', 'origin': 'Shibuya', 'destination': 'Ikebukuro'},
+        {'id': 'b', 'origin': 'Nowhere-ville', 'destination': 'Ueno'},
+        {'id': 'c', 'origin': 'Tokyo', 'destination': 'Shinjuku', 'via': ['Kanda']},
+    ]})
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+
+    results = {r['id']: r for r in map(json.loads, response.text.splitlines())}
+    assert set(results) == {'a', 'b', 'c'}
+    assert results['a']['routes'] and 'score' in results['a']['routes'][0]
+    assert 'error' in results['b']
+    assert results['c']['routes']
+
+
+def test_routes_batch_applies_line_statuses():
+    """Test that batch workers avoid lines suspended in the server process."""
+    # Start the workers before the statuses change
+    client.post('/api/routes/batch', json={'pairs': [{'origin': 'Shibuya', 'destination': 'Ueno'}]})
+    try:
+        set_line_statuses(1, {'JR-East.Yamanote': LineStatus(SUSPENDED, 0, '運転を見合わせています。')})
+        response = client.post('/api/routes/batch', json={'pairs': [{'origin': 'Shibuya', 'destination': 'Ueno'}]})
+        routes = json.loads(response.text.splitlines()[0])['routes']
+        assert routes
+        assert all('JR-East.Yamanote' not in s.get('line_ids', []) for r in routes for s in r['segments'])
+    finally:
+        set_line_statuses(0, {})
+
+
+def test_routes_batch_recovers_from_a_dead_worker():
+    """Test that a killed worker fails its batch's pairs and the next batch gets a fresh pool."""
+    import batch_routing
+
+    pair = {'pairs': [{'origin': 'Shibuya', 'destination': 'Ueno'}]}
+    client.post('/api/routes/batch', json=pair)
+    for process in list(batch_routing._get_executor()._processes.values()):
+        process.kill()
+
+    response = client.post('/api/routes/batch', json=pair)
+    assert response.status_code == 200
+    assert 'BrokenProcessPool' in json.loads(response.text.splitlines()[0])['error']
+
+    response = client.post('/api/routes/batch', json=pair)
+    assert json.loads(response.text.splitlines()[0])['routes']
+
+
+def test_matrix_formats():
+    """Test the travel-time matrix as JSON, CSV and a NumPy archive."""
+    body = {'origins': ['Shibuya', 'Tokyo'], 'destinations': ['Ueno', 'Shibuya']}
+    data = client.post('/api/matrix', json=body).json()
+    assert data['origins'] == ['shibuya', 'tokyo']
+    assert data['seconds'][0][1] == 0
+    assert data['seconds'][1][0] > 0
+
+    csv_lines = client.post('/api/matrix', json={**body, 'format': 'csv'}).text.splitlines()
+    assert csv_lines[0] == 'origin,ueno,shibuya'
+    assert csv_lines[1].startswith('shibuya,') and csv_lines[1].endswith(',0')
+
+    archive = np.load(io.BytesIO(client.post('/api/matrix', json={**body, 'format': 'npz'}).content))
+    assert archive['seconds'].shape == (2, 2)
+    assert archive['seconds'].dtype == np.float32
+
+    assert client.post('/api/matrix', json={'origins': ['Nowhere-ville'], 'destinations': ['Ueno']}).status_code == 400
+    response = client.post('/api/matrix', json={**body, 'time': '8'})
+    assert response.status_code == 400 and response.json()['detail'] == "Invalid time '8': expected HH:MM"
+
+
+def test_isochrone():
+    """Test the reachability endpoint."""
+    data = client.get('/api/isochrone?station=Shibuya&minutes=15&max_transfers=1').json()
+    assert data['origin'] == 'shibuya'
+    assert all(s['seconds'] <= 15 * 60 and s['transfers'] <= 1 for s in data['stations'])
+    assert 'ebisu' in [s['id'] for s in data['stations']]
+    assert client.get('/api/isochrone?station=Nowhere-ville').status_code == 404
+
+
+def test_isochrone_with_every_line_suspended():
+    """Test that a known station whose only line is suspended is not reported as unknown."""
+    try:
+        set_line_statuses(1, {'JR-East.Yamanote': LineStatus(SUSPENDED, 0, '運転を見合わせています。')})
+        response = client.get('/api/isochrone?station=Harajuku&minutes=15')
+        assert response.status_code == 200
+        assert response.json()['origin'] == 'harajuku' and response.json()['stations'] == []
+    finally:
+        set_line_statuses(0, {})
+
+
+def test_coordinate_endpoints():
+    """Test nearest-station lookup and routing between GPS coordinates."""
+    data = client.get('/api/stations/nearest?lat=35.6905&lon=139.7005&k=3').json()
+    assert [s['id'] for s in data['stations']][0] == 'shinjuku'
+    assert data['stations'][0]['walk_seconds'] > 0
+
+    data = client.get('/api/routes/coordinates?from_lat=35.7325&from_lon=139.46&to_lat=35.464&to_lon=139.62').json()
+    assert data['routes'] and data['routes'][0]['score']['total_seconds'] > 0
+    response = client.get('/api/routes/coordinates?from_lat=0&from_lon=0&to_lat=35.73&to_lon=139.71')
+    assert response.status_code == 404 and 'origin' in response.json()['detail']
+    assert client.get('/api/stations/nearest?lat=91&lon=0').status_code == 400
+
+
+def test_data_endpoints_are_cached_with_etags():
+    """Test ETag revalidation, gzip and field projection on the data endpoints."""
+    for path in ('/stations', '/lines', '/api/network-stations'):
+        response = client.get(path, headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers['content-encoding'] == 'gzip'
+        assert 'max-age' in response.headers['cache-control']
+        etag = response.headers['etag']
+        assert etag.startswith('"') and not etag.startswith('W/')
+
+        again = client.get(path, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        assert again.status_code == 304
+        assert again.content == b''
+        assert again.headers['etag'] == etag
+
+        # The same content in another encoding is still current for the client
+        plain = client.get(path, headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+        assert plain.status_code == 304
+        assert client.get(path, headers={'If-None-Match': '"stale"'}).status_code == 200
+
+    full = client.get('/stations').json()
+    projected = client.get('/stations?fields=owl:sameAs, odpt:stationTitle').json()
+    assert len(projected) == len(full)
+    assert set(projected[0]) == {'owl:sameAs', 'odpt:stationTitle'}
+    assert projected[0]['owl:sameAs'] == full[0]['owl:sameAs']
+
+    names = client.get('/api/network-stations?fields=name_ja,id').json()['stations']
+    assert set(names[0]) == {'id', 'name_ja'}
+    assert client.get('/api/network-stations?fields=id').headers['etag'] != \
+        client.get('/api/network-stations').headers['etag']
+
+
+def test_network_stations_carry_odpt_join():
+    """Test that network stations include their ODPT IDs, station codes and positions."""
+    stations = {s['id']: s for s in client.get('/api/network-stations').json()['stations']}
+    shibuya = stations['shibuya']
+    assert shibuya['name_ja'] == '渋谷'
+    assert 'odpt.Station:TokyoMetro.Ginza.Shibuya' in shibuya['odpt_ids']
+    assert 'G01' in shibuya['codes']
+    assert shibuya['lat'] and shibuya['lon']
+    # Matched by folded name although the ODPT title is spelled differently
+    assert stations['omotesando']['name_ja'] == '表参道'
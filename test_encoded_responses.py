@@ -0,0 +1,47 @@
+"""
+Tests for the pre-encoded response cache
+"""
+import gzip
+import json
+
+from encoded_responses import ResponseCache, _choose_encoding, encode_json, parse_fields, project
+
+
+def test_cache_builds_once_per_version():
+    """Test that a response is rebuilt only when its version changes, within a bounded LRU."""
+    builds = []
+
+    def build(value):
+        def run():
+            builds.append(value)
+            return {'value': value, 'padding': 'x' * 2000}
+        return run
+
+    cache = ResponseCache(max_entries=2)
+    first = cache.get('a', 1, build(1))
+    assert cache.get('a', 1, build(2)) is first
+    assert builds == [1]
+    assert json.loads(gzip.decompress(first.encoded['gzip']))['value'] == 1
+
+    second = cache.get('a', 2, build(2))
+    assert second.digest != first.digest
+    cache.get('b', 1, build(3))
+    cache.get('c', 1, build(4))
+    assert len(cache) == 2
+    cache.get('a', 2, build(5))
+    assert builds == [1, 2, 3, 4, 5]
+
+
+def test_encoding_negotiation_and_projection():
+    """Test Accept-Encoding handling, small bodies staying uncompressed, and field projection."""
+    large = encode_json(['station'] * 500)
+    assert _choose_encoding(large, 'gzip, deflate') == 'gzip'
+    assert _choose_encoding(large, 'gzip;q=0') is None
+    assert _choose_encoding(large, '*') == 'gzip'
+    assert _choose_encoding(large, None) is None
+    assert large.etag('gzip') != large.etag()
+
+    assert encode_json({'a': 1}).encoded == {}
+    assert parse_fields(' b,a,,b ') == ('a', 'b')
+    assert parse_fields(',') is None
+    assert project([{'a': 1, 'b': 2, 'c': 3}, {'c': 4}], ('a', 'b')) == [{'a': 1, 'b': 2}, {}]
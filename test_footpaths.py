@@ -0,0 +1,49 @@
+"""
+Tests for walking footpaths between stations
+"""
+from footpaths import FOOTPATH_RADIUS_KM, Footpaths
+from geo import haversine_km
+from route_finder import find_routes, _snapshot
+from scoring import calculate_transfer_time
+
+
+def test_footpaths_cover_connections_and_nearby_stations():
+    """Test that listed connections and close stations get footpaths both ways."""
+    snap = _snapshot()
+    net, foot = snap.net, snap.footpaths
+    tokyo, otemachi = net.station_index['tokyo'], net.station_index['otemachi']
+    assert foot.find(tokyo, otemachi) is not None
+    assert foot.find(otemachi, tokyo) is not None
+
+    for a in snap.surveyed:
+        for _km, b in snap.spatial_index.within(snap.coordinates[a], FOOTPATH_RADIUS_KM):
+            if b != a and b in snap.surveyed:
+                assert foot.find(a, b) is not None
+
+
+def test_footpath_seconds_match_transfer_scoring():
+    """Test that walking times come from calculate_transfer_time."""
+    foot = Footpaths(3, {(0, 1): 300, (1, 2): 10})
+    assert len(foot) == 2
+    assert foot.seconds[foot.find(1, 0)] == calculate_transfer_time({'distance_m': 300})
+    # Short walks still take the minimum transfer time
+    assert foot.seconds[foot.find(2, 1)] == 30
+
+
+def test_distance_bound_holds_on_footpaths():
+    """Test that A* stays admissible when footpaths are walked."""
+    snap = _snapshot()
+    coords, foot = snap.coordinates, snap.footpaths
+    for a in range(snap.net.num_stations):
+        for f in foot.walks(a):
+            b = foot.neighbors[f]
+            if coords[a] is not None and coords[b] is not None:
+                assert haversine_km(coords[a], coords[b]) * snap.seconds_per_km <= foot.seconds[f] + 1e-6
+
+
+def test_routes_walk_between_differently_named_stations():
+    """Test that a route can change between stations via a footpath."""
+    routes = find_routes('Hibiya', 'Kanda')
+    walks = [s for r in routes for s in r['segments'] if s.get('distance_m')]
+    assert any({w['from_station'], w['to_station']} == {'Hibiya', 'Yurakucho'} for w in walks)
+    assert find_routes('Ogawamachi', 'Awajicho')[0]['name'] == 'Walk'
@@ -0,0 +1,30 @@
+"""
+Tests for station coordinates and the spatial index
+"""
+import random
+
+from geo import GridIndex, haversine_km
+from route_finder import _snapshot
+
+
+def test_grid_index_matches_brute_force():
+    """Test that nearest-station lookups agree with checking every station."""
+    snap = _snapshot()
+    coords = snap.coordinates
+    index = snap.spatial_index
+    located = [sid for sid, c in enumerate(coords) if c is not None]
+    assert len(index) == len(located)
+
+    rng = random.Random(3)
+    for _ in range(200):
+        point = (rng.uniform(35.2, 36.1), rng.uniform(139.2, 140.1))
+        expected = sorted((haversine_km(point, coords[sid]), sid) for sid in located)
+        assert index.nearest(point, 5) == expected[:5]
+        assert index.nearest(point, 5, max_km=2.0) == [p for p in expected[:5] if p[0] <= 2.0]
+
+
+def test_grid_index_handles_far_and_empty_queries():
+    """Test queries far outside the grid and on an empty index."""
+    index = GridIndex([(35.0, 139.0), None, (35.01, 139.01)])
+    assert [sid for _km, sid in index.nearest((10.0, 100.0), 3)] == [0, 2]
+    assert GridIndex([None]).nearest((35.0, 139.0), 3) == []
@@ -0,0 +1,41 @@
+"""
+Tests for parsing train information into line statuses
+"""
+from line_status import DELAYED, NORMAL, SUSPENDED, line_statuses, parse_status
+
+
+def test_parse_status_texts():
+    """Test the common ODPT train information phrasings."""
+    assert parse_status('現在、平常どおり運転しています。').state == NORMAL
+    assert parse_status('平常運行').state == NORMAL
+    # Mentions a delay only to say there is none
+    assert parse_status('現在、１５分以上の遅延はありません。').state == NORMAL
+    assert parse_status('人身事故の影響で、運転を見合わせています。').state == SUSPENDED
+
+    delayed = parse_status('信号確認の影響で、上下線に２０分程度の遅れが出ています。')
+    assert delayed.state == DELAYED and delayed.delay_minutes == 20
+    assert parse_status('ダイヤが乱れています。').state == DELAYED
+
+    # Running again after a suspension: delayed, not suspended
+    resumed = parse_status('人身事故の影響で運転を見合わせていましたが、10時05分頃運転を再開しました。現在、ダイヤが乱れています。')
+    assert resumed.state == DELAYED
+    assert parse_status('', '運転再開').state == DELAYED
+    assert parse_status('運転を再開し、現在は平常どおり運転しています。').state == NORMAL
+    # Only an expected resumption: still suspended
+    assert parse_status('運転を見合わせています。運転再開見込みは12時00分頃です。').state == SUSPENDED
+
+    # Part of the line stopped: a long delay rather than a suspension
+    partial = parse_status('車両点検の影響で、渋谷駅〜池袋駅間で運転を見合わせています。')
+    assert partial.state == DELAYED and partial.delay_minutes >= 30
+
+
+def test_line_statuses_use_line_ids():
+    """Test that statuses are keyed by railway ID without the odpt prefix."""
+    statuses = line_statuses([
+        {'owl:sameAs': 'odpt.TrainInformation:TokyoMetro.Ginza', 'odpt:railway': 'odpt.Railway:TokyoMetro.Ginza',
+         'odpt:trainInformationText': {'ja': '運転を見合わせています。'}},
+        {'owl:sameAs': 'odpt.TrainInformation:Toei.Oedo',
+         'odpt:trainInformationText': {'ja': '現在、平常どおり運転しています。'}},
+    ])
+    assert statuses['TokyoMetro.Ginza'].state == SUSPENDED
+    assert not statuses['Toei.Oedo'].disrupted
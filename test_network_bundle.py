@@ -0,0 +1,78 @@
+"""
+Tests for the memory-mapped network bundle
+"""
+import os
+import random
+import shutil
+from pathlib import Path
+
+import pytest
+
+from network_bundle import BUNDLE_NAME, compile_bundle, load_snapshot, load_timetables
+from network_snapshot import build_snapshot
+from route_finder import MAX_TRANSFERS_PER_LEG, _bidirectional_path
+from timetable import load_timetable_store
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for path in Path('data').glob('*.json'):
+        shutil.copy(path, tmp_path / path.name)
+    compile_bundle(tmp_path)
+    return tmp_path
+
+
+def test_bundle_matches_json_snapshot(data_dir):
+    """Test that a snapshot read from the bundle equals one built from the JSON files."""
+    built = build_snapshot(data_dir, 1)
+    mapped = load_snapshot(data_dir, 1)
+    assert isinstance(mapped.net.line_cumulative[0], memoryview)
+
+    for name in ('station_keys', 'station_names', 'line_keys', 'line_positions', 'line_cycle_seconds',
+                 'station_lines', 'through_services'):
+        assert getattr(mapped.net, name) == getattr(built.net, name), name
+    for name in ('offsets', 'neighbors', 'edge_lines', 'weights', 'reverse_edges'):
+        assert list(getattr(mapped.net, name)) == list(getattr(built.net, name)), name
+    assert [list(c) for c in mapped.net.line_cumulative] == [list(c) for c in built.net.line_cumulative]
+    for name in ('odpt_keys', 'odpt_ids', 'codes', 'names_ja', 'surveyed_coordinates', 'connections',
+                 'railway_ids', 'line_names_ja', 'station_by_odpt', 'line_by_odpt'):
+        assert getattr(mapped.join, name) == getattr(built.join, name), name
+    for name in ('offsets', 'neighbors', 'distance_m', 'seconds'):
+        assert list(getattr(mapped.footpaths, name)) == list(getattr(built.footpaths, name)), name
+    assert mapped.coordinates == built.coordinates
+    assert mapped.surveyed == built.surveyed
+    assert mapped.seconds_per_km == built.seconds_per_km
+    assert mapped.transfer_index == built.transfer_index
+    assert mapped.sources == built.sources
+    assert mapped.search_index.best('omotesando') == built.search_index.best('omotesando')
+
+    rng = random.Random(3)
+    for _ in range(30):
+        origin, destination = rng.sample(range(built.net.num_stations), 2)
+        assert (_bidirectional_path(mapped, origin, destination, MAX_TRANSFERS_PER_LEG).cost ==
+                _bidirectional_path(built, origin, destination, MAX_TRANSFERS_PER_LEG).cost)
+
+
+def test_bundle_timetables(data_dir):
+    """Test that departures read from the bundle equal those parsed from JSON."""
+    parsed = load_timetable_store(data_dir)
+    mapped = load_timetables(data_dir)
+    assert isinstance(next(iter(mapped.tables.values())).minutes, memoryview)
+    assert set(mapped.tables) == set(parsed.tables)
+    for station in parsed.stations():
+        for calendar in ('Weekday', 'SaturdayHoliday'):
+            assert (mapped.next_departures(station, calendar, 8 * 3600, 10) ==
+                    parsed.next_departures(station, calendar, 8 * 3600, 10))
+
+
+def test_stale_or_broken_bundle_falls_back_to_json(data_dir):
+    """Test that a bundle is ignored once its sources change or it cannot be read."""
+    stations = data_dir / 'stations.json'
+    os.utime(stations, (stations.stat().st_atime, stations.stat().st_mtime + 10))
+    assert not isinstance(load_snapshot(data_dir, 1).net.line_cumulative[0], memoryview)
+
+    compile_bundle(data_dir)
+    assert isinstance(load_snapshot(data_dir, 1).net.line_cumulative[0], memoryview)
+
+    (data_dir / BUNDLE_NAME).write_bytes(b'not a bundle')
+    assert load_snapshot(data_dir, 1).net.num_stations == build_snapshot(data_dir, 1).net.num_stations
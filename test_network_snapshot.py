@@ -0,0 +1,113 @@
+"""
+Tests for immutable, hot-reloadable network snapshots
+"""
+import json
+import os
+import threading
+import time
+
+from network_snapshot import NetworkSnapshotManager
+
+
+def _write_network(data_dir, stations, mtime):
+    path = data_dir / 'network.json'
+    path.write_text(json.dumps({'lines': {'A': {'name': 'A Line', 'stations': stations}}}), encoding='utf-8')
+    os.utime(path, (mtime, mtime))
+
+
+def test_first_use_builds_one_snapshot(tmp_path):
+    """Test that concurrent first requests all get the same snapshot."""
+    _write_network(tmp_path, ['X', 'Y'], 1000)
+    manager = NetworkSnapshotManager(tmp_path)
+
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(manager.current())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(snapshot) for snapshot in seen}) == 1
+    assert seen[0].version == 1
+
+
+def test_reload_publishes_new_snapshot_only_on_change(tmp_path):
+    """Test that a changed data file produces a new version while old snapshots stay intact."""
+    _write_network(tmp_path, ['X', 'Y'], 1000)
+    manager = NetworkSnapshotManager(tmp_path)
+    old = manager.current()
+    assert not manager.reload()
+
+    _write_network(tmp_path, ['X', 'Y', 'Z'], 2000)
+    assert manager.reload()
+    new = manager.current()
+    assert new.version == 2
+    assert 'z' in new.net.station_index
+    # A query holding the old snapshot still sees the old network
+    assert 'z' not in old.net.station_index
+    assert old.search_index.best('Z') is None
+
+
+def test_failed_reload_keeps_current_snapshot(tmp_path):
+    """Test that a broken data file does not replace the live snapshot."""
+    _write_network(tmp_path, ['X', 'Y'], 1000)
+    manager = NetworkSnapshotManager(tmp_path)
+    manager.current()
+
+    (tmp_path / 'network.json').write_text('{"lines": ', encoding='utf-8')
+    assert not manager.reload(force=True)
+    assert manager.current().version == 1
+    assert manager.status()['last_error']
+
+
+def test_transfer_scoring_follows_reloaded_snapshot(tmp_path, monkeypatch):
+    """Test that scoring looks transfers up in the current snapshot, not a copy read at startup."""
+    import route_finder
+    from scoring import score_route
+
+    def transfer_seconds():
+        segment = {'type': 'transfer', 'is_transfer': True, 'from_station': 'X', 'from_line_id': 'B', 'to_line_id': 'A'}
+        return score_route({'segments': [segment]}, transfer_index=route_finder.transfer_index())['total_seconds']
+
+    _write_network(tmp_path, ['X', 'Y'], 1000)
+    transfers = tmp_path / 'transfers.json'
+    transfers.write_text(json.dumps([{'station': 'X', 'from_line': 'A', 'to_line': 'B', 'distance_m': 100}]),
+                         encoding='utf-8')
+    os.utime(transfers, (1000, 1000))
+    manager = NetworkSnapshotManager(tmp_path)
+    monkeypatch.setattr(route_finder, '_snapshots', manager)
+    before = transfer_seconds()
+
+    transfers.write_text(json.dumps([{'station': 'X', 'from_line': 'A', 'to_line': 'B', 'distance_m': 300}]),
+                         encoding='utf-8')
+    os.utime(transfers, (2000, 2000))
+    assert manager.reload()
+    assert transfer_seconds() > before
+
+
+def test_watcher_survives_unexpected_build_errors(tmp_path):
+    """Test that a build error of any type is recorded and the watcher keeps reloading."""
+    _write_network(tmp_path, ['X', 'Y'], 1000)
+    manager = NetworkSnapshotManager(tmp_path)
+    manager.current()
+
+    # A list where the lines object belongs fails with a TypeError or AttributeError
+    path = tmp_path / 'network.json'
+    path.write_text('{"lines": [1, 2]}', encoding='utf-8')
+    os.utime(path, (2000, 2000))
+    manager.start_watcher(poll_seconds=0.01)
+    try:
+        for _ in range(200):
+            if manager.last_error:
+                break
+            time.sleep(0.01)
+        assert manager.last_error and manager.current().version == 1
+        assert manager.watching
+
+        _write_network(tmp_path, ['X', 'Y', 'Z'], 3000)
+        for _ in range(200):
+            if manager.current().version == 2:
+                break
+            time.sleep(0.01)
+        assert manager.current().version == 2 and manager.last_error is None
+    finally:
+        manager.stop_watcher()
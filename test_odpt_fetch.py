@@ -0,0 +1,159 @@
+"""
+Tests for the concurrent ODPT fetcher, against a local mock ODPT server
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from odpt_fetch import OdptFetcher, fetch_datasets, iter_json_array, read_ndjson
+from timetable import load_timetable_store
+
+
+class MockOdpt:
+    """ODPT records served over HTTP, with injectable failures."""
+
+    def __init__(self, stations=6):
+        self.railways = [{'owl:sameAs': 'odpt.Railway:Mock.Red', 'dc:date': '2024-01-01', 'dc:title': '赤線'}]
+        self.stations = [{'owl:sameAs': f'odpt.Station:Mock.Red.S{i}', 'dc:date': '2024-01-01',
+                          'odpt:stationTitle': {'en': f'S{i}', 'ja': f'駅{i}'}} for i in range(stations)]
+        self.timetables = {station['owl:sameAs']: self._timetable(station['owl:sameAs'], '2024-01-01')
+                           for station in self.stations}
+        # Status codes to answer for a station's timetable before serving it
+        self.failures = {}
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _timetable(station, date, clock='06:00'):
+        return {'owl:sameAs': station.replace('Station', 'StationTimetable') + '.Weekday', 'dc:date': date,
+                'odpt:station': station, 'odpt:railway': 'odpt.Railway:Mock.Red',
+                'odpt:railDirection': 'odpt.RailDirection:Mock.Outbound', 'odpt:calendar': 'odpt.Calendar:Weekday',
+                'odpt:stationTimetableObject': [{'odpt:departureTime': clock, 'odpt:train': f'{station}.T1'}]}
+
+    def respond(self, path, query):
+        if query.get('acl:consumerKey') != ['test']:
+            return 401, []
+        if path == '/odpt:Railway':
+            return 200, self.railways
+        if path == '/odpt:Station':
+            return 200, self.stations
+        station = query.get('odpt:station', [''])[0]
+        with self.lock:
+            pending = self.failures.get(station)
+            if pending:
+                return pending.pop(0), {'title': 'error'}
+        return 200, [self.timetables[station]] if station in self.timetables else []
+
+
+def _serve(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            with mock.lock:
+                mock.requests += 1
+                mock.in_flight += 1
+                mock.max_in_flight = max(mock.max_in_flight, mock.in_flight)
+            try:
+                time.sleep(0.02)
+                status, data = mock.respond(url.path, parse_qs(url.query))
+                body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if status == 429:
+                    self.send_header('Retry-After', '0')
+                self.end_headers()
+                # Trickle the body out so the client sees it in pieces
+                for i in range(0, len(body), 50):
+                    self.wfile.write(body[i:i + 50])
+                    self.wfile.flush()
+            finally:
+                with mock.lock:
+                    mock.in_flight -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def mock_odpt():
+    mock = MockOdpt()
+    server = _serve(mock)
+    mock.base = f'http://127.0.0.1:{server.server_address[1]}'
+    yield mock
+    server.shutdown()
+    server.server_close()
+
+
+def _run(mock, data_dir, **kwargs):
+    fetcher = OdptFetcher(mock.base, 'test', concurrency=3, rate_per_second=1000, retries=2, **kwargs)
+    try:
+        return asyncio.run(fetch_datasets(fetcher, data_dir)), fetcher
+    finally:
+        fetcher.close()
+
+
+def test_json_array_is_decoded_incrementally():
+    """Test that records come out of arbitrarily split chunks, and broken arrays are errors."""
+    records = [{'name': '東京', 'n': i, 'nested': [1, {'a': '[]'}]} for i in range(20)]
+    data = json.dumps(records, ensure_ascii=False).encode('utf-8')
+    assert list(iter_json_array(data[i:i + 7] for i in range(0, len(data), 7))) == records
+    assert list(iter_json_array([b' [ ', b']'])) == []
+    with pytest.raises(ValueError):
+        list(iter_json_array([data[:-30]]))
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"title": "Unauthorized"}']))
+
+
+def test_fetch_is_concurrent_retried_and_incremental(mock_odpt, tmp_path):
+    """Test a full fetch, then refetches that skip unchanged records and keep failed ones."""
+    first = mock_odpt.stations[0]['owl:sameAs']
+    mock_odpt.failures = {first: [503, 429]}
+    ok, fetcher = _run(mock_odpt, tmp_path)
+    assert ok and not fetcher.failures
+    assert fetcher.retried == 2
+    assert 1 < mock_odpt.max_in_flight <= 3
+
+    assert json.loads((tmp_path / 'stations.json').read_text(encoding='utf-8')) == mock_odpt.stations
+    assert len(list(read_ndjson(tmp_path / 'station_timetables.ndjson'))) == 6
+    store = load_timetable_store(tmp_path)
+    assert len(store.tables) == 6
+
+    # Nothing changed: nothing is rewritten
+    files = ['stations.ndjson', 'stations.json', 'train_lines.json', 'station_timetables.ndjson']
+    mtimes = {name: (tmp_path / name).stat().st_mtime_ns for name in files}
+    ok, _ = _run(mock_odpt, tmp_path)
+    assert ok and {name: (tmp_path / name).stat().st_mtime_ns for name in files} == mtimes
+
+    # One timetable changed, another cannot be fetched: the file has the new
+    # record and keeps the old one
+    second = mock_odpt.stations[1]['owl:sameAs']
+    mock_odpt.timetables[first] = mock_odpt._timetable(first, '2024-02-01', '07:00')
+    mock_odpt.failures = {second: [404]}
+    ok, fetcher = _run(mock_odpt, tmp_path)
+    assert not ok and len(fetcher.failures) == 1 and second in fetcher.failures[0]
+    timetables = {record['odpt:station']: record for record in read_ndjson(tmp_path / 'station_timetables.ndjson')}
+    assert len(timetables) == 6
+    assert timetables[first]['dc:date'] == '2024-02-01'
+    assert (tmp_path / 'stations.json').stat().st_mtime_ns == mtimes['stations.json']
+    assert not list(tmp_path.glob('*.tmp'))
+
+    # A complete fetch drops records the server no longer has
+    mock_odpt.failures = {}
+    del mock_odpt.timetables[second]
+    ok, _ = _run(mock_odpt, tmp_path)
+    assert ok and len(list(read_ndjson(tmp_path / 'station_timetables.ndjson'))) == 5
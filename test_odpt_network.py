@@ -0,0 +1,121 @@
+"""
+Tests for generating the routing network from ODPT station orders
+"""
+import json
+from pathlib import Path
+
+from network_graph import compile_network
+from odpt_network import build_network
+
+
+def _railway(odpt_id, stations, en=None):
+    order = [{'odpt:index': i + 1, 'odpt:station': station} for i, station in enumerate(stations)]
+    return {'owl:sameAs': odpt_id, 'odpt:operator': 'odpt.Operator:' + odpt_id.split(':')[1].split('.')[0],
+            'odpt:railwayTitle': {'en': en or odpt_id.rsplit('.', 1)[1] + ' Line', 'ja': ''},
+            'odpt:stationOrder': order}
+
+
+def _station(odpt_id, en, lat, lon, connecting=()):
+    return {'owl:sameAs': odpt_id, 'odpt:stationTitle': {'en': en, 'ja': ''}, 'geo:lat': lat, 'geo:long': lon,
+            'odpt:connectingStation': list(connecting)}
+
+
+def test_station_orders_become_lines():
+    """Test lines, shared stations, the loop-and-branch split, homonyms and the report."""
+    stations = [
+        _station('odpt.Station:A.Red.One', 'One', 35.60, 139.60),
+        _station('odpt.Station:A.Red.Omotesando', 'Omote-sando<Ginza>', 35.61, 139.60),
+        _station('odpt.Station:A.Red.Three', 'Three', 35.62, 139.60, connecting=['odpt.Station:B.Blue.Four']),
+        _station('odpt.Station:B.Blue.Omotesando', 'Omotesando', 35.611, 139.601),
+        _station('odpt.Station:B.Blue.Four', 'Four', 35.62, 139.61),
+        _station('odpt.Station:B.Blue.One', 'One', 35.90, 139.90),
+        _station('odpt.Station:B.Green.One', 'One', 36.20, 140.20),
+        _station('odpt.Station:B.Green.Nine', 'Nine', 36.21, 140.20),
+        _station('odpt.Station:C.Loop.Four', 'Four', 35.62, 139.61),
+        _station('odpt.Station:C.Loop.Five', 'Five', 35.63, 139.62),
+        _station('odpt.Station:C.Loop.Six', 'Six', 35.64, 139.61),
+        _station('odpt.Station:C.Loop.Seven', 'Seven', 35.65, 139.60),
+    ]
+    railways = [
+        _railway('odpt.Railway:A.Red', ['odpt.Station:A.Red.One', 'odpt.Station:A.Red.Omotesando',
+                                        'odpt.Station:A.Red.Three']),
+        _railway('odpt.Railway:B.Blue', ['odpt.Station:B.Blue.Omotesando', 'odpt.Station:B.Blue.Four',
+                                         'odpt.Station:B.Blue.One']),
+        # A third "One" of the same operator, far from both others
+        _railway('odpt.Railway:B.Green', ['odpt.Station:B.Green.Nine', 'odpt.Station:B.Green.One']),
+        # Round the loop and on to Seven, like the Oedo line
+        _railway('odpt.Railway:C.Loop', ['odpt.Station:C.Loop.Four', 'odpt.Station:C.Loop.Five',
+                                         'odpt.Station:C.Loop.Six', 'odpt.Station:C.Loop.Four',
+                                         'odpt.Station:C.Loop.Seven']),
+        {'owl:sameAs': 'odpt.Railway:D.Unknown', 'odpt:stationOrder': []},
+    ]
+    base = {
+        'lines': {
+            'A.Red': {'name': 'Red Line', 'avg_speed_kmh': 40, 'stations': ['One', 'Omotesando', 'Two']},
+            'E.Hand': {'name': 'Hand Line', 'stations': ['Three', 'Eight']},
+        },
+        'through_services': [
+            {'name': 'Red-Blue', 'lines': ['A.Red', 'B.Blue'], 'connection_station': 'Omotesando'},
+            {'name': 'Gone', 'lines': ['A.Red', 'B.Blue'], 'connection_station': 'Two'},
+        ],
+        'transfer_times': {'default': {'same_company': 120}},
+    }
+    network, report = build_network(railways, stations, base)
+    lines = network['lines']
+
+    assert lines['A.Red']['stations'] == ['One', 'Omotesando', 'Three']
+    assert lines['A.Red']['name'] == 'Red Line' and lines['A.Red']['avg_speed_kmh'] == 40
+    # The base name wins, and the far-away "One" is a different station
+    assert lines['B.Blue']['stations'] == ['Omotesando', 'Four', 'One (B)']
+    assert lines['B.Green']['stations'] == ['Nine', 'One (B 2)']
+    assert report.homonyms == ['One (B)', 'One (B 2)']
+    assert lines['C.Loop'] == {**lines['C.Loop'], 'type': 'loop', 'stations': ['Four', 'Five', 'Six']}
+    assert lines['C.LoopBranch']['stations'] == ['Four', 'Seven']
+    assert lines['E.Hand']['stations'] == ['Three', 'Eight']
+    assert network['transfer_times'] == base['transfer_times']
+    assert [s['name'] for s in network['through_services']] == ['Loop Line through service', 'Red-Blue']
+
+    assert report.generated_lines == ['A.Red', 'B.Blue', 'B.Green', 'C.Loop', 'C.LoopBranch']
+    assert report.kept_lines == ['E.Hand']
+    assert report.skipped_railways == ['D.Unknown']
+    assert report.split_lines == ['C.Loop']
+    assert report.dropped_through_services == ['Gone']
+    assert report.changed_lines == {'A.Red': {'added': ['Three'], 'removed': ['Two']}}
+    assert 'B.Blue' in report.default_speed_lines and 'A.Red' not in report.default_speed_lines
+    # B.Green's Nine and its "One" are not connected to the rest
+    assert report.stations == 11 and report.components == [9, 2]
+    # Three - Four is the only connection between differently named stations
+    assert report.footpath_connections == 1
+
+    net = compile_network(network)
+    assert len({net.station_index['one'], net.station_index['one-(b)'], net.station_index['one-(b-2)']}) == 3
+    assert net.has_through_service(net.station_index['four'], net.line_index['C.Loop'],
+                                   net.line_index['C.LoopBranch'])
+
+
+def test_generated_network_from_the_data_files():
+    """Test that the real station orders give one connected network the route search can use."""
+    data = Path('data')
+    railways = json.loads((data / 'train_lines.json').read_text(encoding='utf-8'))
+    stations = json.loads((data / 'stations.json').read_text(encoding='utf-8'))
+    # Once scripts/build_network.py has run, network.json is its output and
+    # the hand-maintained network is network_base.json
+    base_path = data / 'network_base.json'
+    if not base_path.exists():
+        base_path = data / 'network.json'
+    base = json.loads(base_path.read_text(encoding='utf-8'))
+    network, report = build_network(railways, stations, base)
+
+    assert len(report.components) == 1
+    assert not report.dropped_through_services and not report.unknown_stations
+    assert set(base['lines']) <= set(network['lines'])
+    # Hand-written station names are kept; only a stop the Oedo line does not make goes
+    base_stations = {name for line in base['lines'].values() for name in line['stations']}
+    generated = {name for line in network['lines'].values() for name in line['stations']}
+    assert base_stations - generated == {'Akasaka-Tameike'}
+    assert network['lines']['Toei.Oedo']['type'] == 'loop'
+    assert network['lines']['Toei.OedoBranch']['stations'][-1] == 'Hikarigaoka'
+    assert json.loads(json.dumps(report.to_dict()))['warnings'] == report.warnings()
+
+    net = compile_network(network)
+    assert net.num_stations == report.stations
@@ -0,0 +1,118 @@
+"""
+Tests for the background train information poller, against a local
+stand-in for the ODPT API
+"""
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from realtime_data import BACKOFF_BASE_SECONDS, BACKOFF_MAX_SECONDS, TrainInformationPoller
+
+
+def _record(line, text):
+    return {'owl:sameAs': f'odpt.TrainInformation:{line}', 'odpt:railway': f'odpt.Railway:{line}',
+            'odpt:trainInformationText': {'ja': text}}
+
+
+class StandInODPT:
+    """Serves odpt:TrainInformation with ETags; can be told to fail."""
+
+    def __init__(self):
+        self.records = [_record('JR-East.Yamanote', '平常どおり運転しています。')]
+        self.fail = False
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                if server.fail:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                body = json.dumps(server.records, ensure_ascii=False).encode('utf-8')
+                etag = f'"{hash(body) & 0xffffffff:x}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base = f'http://127.0.0.1:{self.httpd.server_address[1]}/api/v4'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def odpt():
+    server = StandInODPT()
+    yield server
+    server.close()
+
+
+def test_refresh_uses_conditional_requests(odpt):
+    """Test that unchanged data is revalidated with If-None-Match and keeps its version."""
+    poller = TrainInformationPoller(base=odpt.base, token='x')
+    published = []
+    poller.add_listener(published.append)
+    assert poller.current().info == {}
+
+    assert asyncio.run(poller.refresh())
+    first = poller.current()
+    assert first.version == 1
+    assert first.info == {'odpt.TrainInformation:JR-East.Yamanote': '平常どおり運転しています。'}
+    assert not first.statuses['JR-East.Yamanote'].disrupted
+
+    assert not asyncio.run(poller.refresh())
+    assert 'If-None-Match' in odpt.requests[-1][1]
+    assert poller.current().version == 1
+    assert poller.current().fetched_at >= first.fetched_at
+
+    odpt.records = [_record('JR-East.Yamanote', '遅延しています。')]
+    assert asyncio.run(poller.refresh())
+    assert poller.current().version == 2
+    assert poller.current().statuses['JR-East.Yamanote'].disrupted
+    assert [snapshot.version for snapshot in published] == [1, 2]
+    assert 'odpt:TrainInformation' in odpt.requests[-1][0] and 'acl%3AconsumerKey=x' in odpt.requests[-1][0]
+
+
+def test_failures_keep_stale_data_and_back_off(odpt):
+    """Test that a failing feed keeps serving the last snapshot with growing retry delays."""
+    poller = TrainInformationPoller(base=odpt.base, token='x', refresh_seconds=30)
+    asyncio.run(poller.refresh())
+    assert poller.next_delay() == 30
+
+    odpt.fail = True
+
+    async def run_briefly():
+        task = asyncio.get_running_loop().create_task(poller.run())
+        while poller.failures == 0:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(run_briefly())
+    assert poller.failures == 1
+    assert 'HTTPError' in poller.status()['last_error']
+    assert poller.current().version == 1
+    assert poller.current().info
+
+    assert poller.next_delay() == BACKOFF_BASE_SECONDS
+    poller.failures = 3
+    assert poller.next_delay() == BACKOFF_BASE_SECONDS * 4
+    poller.failures = 30
+    assert poller.next_delay() == BACKOFF_MAX_SECONDS
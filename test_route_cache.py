@@ -0,0 +1,61 @@
+"""
+Tests for the route result cache
+"""
+from route_cache import RouteCache, thaw
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    """Test that the least recently used entry is evicted first."""
+    cache = RouteCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.stats()['evictions'] == 1
+
+
+def test_ttl_expiry():
+    """Test that entries expire after the TTL."""
+    clock = FakeClock()
+    cache = RouteCache(ttl_seconds=60, clock=clock)
+    cache.put('a', 1)
+    clock.now = 59
+    assert cache.get('a') == 1
+    clock.now = 61
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_generation_change_invalidates():
+    """Test that a new network generation drops every entry."""
+    cache = RouteCache()
+    cache.put('a', 1, generation=1)
+    assert cache.get('a', generation=1) == 1
+    assert cache.get('a', generation=2) is None
+    assert len(cache) == 0
+
+
+def test_cached_values_are_frozen():
+    """Test that cached routes cannot be modified, and thawed copies are independent."""
+    cache = RouteCache()
+    cache.put('r', [{'segments': [{'type': 'ride'}]}])
+    frozen = cache.get('r')
+    try:
+        frozen[0]['segments'][0]['delay_info'] = 'late'
+        assert False, 'cached segment was mutable'
+    except TypeError:
+        pass
+
+    copy = thaw(frozen)
+    copy[0]['segments'][0]['delay_info'] = 'late'
+    assert 'delay_info' not in cache.get('r')[0]['segments'][0]
@@ -0,0 +1,264 @@
+"""
+Tests for the route finder search engine
+"""
+import json
+import os
+
+import pytest
+
+import route_finder
+from line_status import DELAYED, SUSPENDED, LineStatus
+from network_snapshot import NetworkSnapshotManager
+from route_finder import (find_routes, find_routes_between_coordinates, nearest_stations, reachable_stations,
+                          set_line_statuses, travel_time_matrix, _find_alternative_routes, _line_overlay, _load_network,
+                          _bidirectional_path, _potentials, _shortest_path, _snapshot, WALK_LINE)
+
+
+def test_search_reports_expansions():
+    """Test that the search exposes how many labels it expanded."""
+    stats = {}
+    routes = find_routes('Shibuya', 'Tokorozawa', stats=stats)
+    assert len(routes) > 0
+    assert stats['expanded'] > 0
+
+
+def test_search_respects_max_transfers():
+    """Test that no route uses more transfers than allowed."""
+    result = _find_alternative_routes('Hanno', 'Shinagawa', max_routes=5, max_transfers=1)
+    assert len(result.routes) > 0
+    for route in result.routes:
+        line_changes = sum(1 for i in range(1, len(route)) if route[i][2] != route[i - 1][2])
+        assert line_changes <= 1
+
+
+def test_search_routes_are_connected():
+    """Test that every raw route is a connected hop sequence from origin to destination."""
+    net = _load_network()
+    result = _find_alternative_routes('Shibuya', 'Tokorozawa')
+    for route in result.routes:
+        assert net.station_keys[route[0][0]] == 'shibuya'
+        assert net.station_keys[route[-1][1]] == 'tokorozawa'
+        for prev, hop in zip(route, route[1:]):
+            assert prev[1] == hop[0]
+
+
+def test_compiled_graph_is_symmetric():
+    """Test that every CSR edge has a matching reverse edge on the same line."""
+    net = _load_network()
+    for station in range(net.num_stations):
+        for e in net.edges(station):
+            assert net.ride_seconds(net.neighbors[e], station, net.edge_lines[e]) == net.weights[e]
+
+
+def test_loop_ride_time_takes_shorter_direction():
+    """Test that ride times on loop lines wrap around instead of going the long way."""
+    net = _load_network()
+    yamanote = net.line_index['JR-East.Yamanote']
+    tokyo = net.station_index['tokyo']
+    kanda = net.station_index['kanda']
+    yurakucho = net.station_index['yurakucho']
+    # Kanda is last in the station list but adjacent to Tokyo on the loop
+    assert net.ride_seconds(tokyo, kanda, yamanote) == net.ride_seconds(tokyo, yurakucho, yamanote)
+
+
+def test_alternatives_are_diverse():
+    """Test that alternatives differ in enough of their ride time."""
+    net = _load_network()
+    result = _find_alternative_routes('Shibuya', 'Ueno', max_routes=4, diversity_threshold=0.3)
+    assert len(result.routes) > 1
+
+    tracks = []
+    for route in result.routes:
+        track = {(min(a, b), max(a, b), line): net.ride_seconds(a, b, line) for a, b, line in route if line != WALK_LINE}
+        for other in tracks:
+            shared = sum(sec for key, sec in track.items() if key in other)
+            shortest = min(sum(track.values()), sum(other.values()))
+            assert shared <= 0.7 * shortest
+        tracks.append(track)
+
+
+def test_max_routes_limits_results():
+    """Test that find_routes honors max_routes."""
+    assert len(find_routes('Shibuya', 'Ueno', max_routes=2)) <= 2
+
+
+def test_via_routes_pass_through_waypoints():
+    """Test that via routes visit every waypoint in order."""
+    net = _load_network()
+    result = _find_alternative_routes('Hanno', 'Shinagawa', via=['Ikebukuro', 'Shibuya'])
+    assert len(result.routes) > 0
+    for route in result.routes:
+        stops = [net.station_keys[route[0][0]]] + [net.station_keys[hop[1]] for hop in route]
+        assert stops.index('ikebukuro') < len(stops) - 1 - stops[::-1].index('shibuya')
+
+
+def test_via_query_costs_about_one_search():
+    """Test that a via query does not expand far more than a direct query."""
+    direct, via = {}, {}
+    find_routes('Shibuya', 'Tokorozawa', stats=direct)
+    routes = find_routes('Shibuya', 'Tokorozawa', stats=via, via=['Shinjuku'])
+    assert len(routes) > 0
+    assert via['expanded'] < 4 * direct['expanded']
+
+
+def test_find_routes_cache_returns_private_copies():
+    """Test that repeated queries hit the cache and callers cannot corrupt it."""
+    first = find_routes('Ikebukuro', 'Shinagawa')
+    first[0]['segments'][0]['delay_info'] = 'late'
+
+    stats = {}
+    second = find_routes('ikebukuro', 'Shinagawa', stats=stats)
+    assert stats['cached']
+    assert 'delay_info' not in second[0]['segments'][0]
+
+
+def test_find_routes_rejects_malformed_time_and_date():
+    """Test that bad times and dates fail fast with ValueError, before the cache or a search."""
+    with pytest.raises(ValueError, match='HH:MM'):
+        find_routes('Shibuya', 'Ueno', time='8am')
+    with pytest.raises(ValueError, match='YYYY-MM-DD'):
+        find_routes('Shibuya', 'Ueno', date='bad', time='08:00')
+
+
+def test_timetables_reload_when_their_files_change(tmp_path, monkeypatch):
+    """Test that changed timetable files replace the loaded store and its RAPTOR networks."""
+    def write(clock, mtime):
+        path = tmp_path / 'station_timetables.json'
+        path.write_text(json.dumps([{
+            'odpt:station': 'odpt.Station:A.X', 'odpt:railway': 'odpt.Railway:A',
+            'odpt:railDirection': 'odpt.RailDirection:A.Outbound', 'odpt:calendar': 'odpt.Calendar:Weekday',
+            'odpt:stationTimetableObject': [{'odpt:train': 'odpt.Train:A.1', 'odpt:departureTime': clock}],
+        }]), encoding='utf-8')
+        os.utime(path, (mtime, mtime))
+
+    (tmp_path / 'network.json').write_text(json.dumps({'lines': {'A': {'name': 'A', 'stations': ['X', 'Y']}}}),
+                                           encoding='utf-8')
+    monkeypatch.setattr(route_finder, '_snapshots', NetworkSnapshotManager(tmp_path))
+    monkeypatch.setattr(route_finder, '_timetables', (None, None))
+    monkeypatch.setattr(route_finder, '_timetable_networks', (None, {}))
+
+    write('08:00', 1000)
+    departures = route_finder.next_departures('odpt.Station:A.X', '2025-01-06', '07:00')
+    assert [d['departure_time'] for d in departures] == ['08:00']
+    network = route_finder._load_timetable_network('Weekday', route_finder._snapshot())
+    assert route_finder._load_timetable_network('Weekday', route_finder._snapshot()) is network
+
+    write('09:30', 2000)
+    departures = route_finder.next_departures('odpt.Station:A.X', '2025-01-06', '07:00')
+    assert [d['departure_time'] for d in departures] == ['09:30']
+    assert route_finder._load_timetable_network('Weekday', route_finder._snapshot()) is not network
+
+
+def test_travel_time_matrix_matches_single_searches():
+    """Test that matrix cells equal the cost of the best single-pair route."""
+    matrix = travel_time_matrix(['Shibuya', 'Hanno'], ['Shibuya', 'Tokorozawa', 'Ueno'])
+    assert matrix.seconds.shape == (2, 3)
+    assert matrix.seconds[0, 0] == 0 and matrix.transfers[0, 0] == 0
+
+    snap = _snapshot()
+    net = snap.net
+    path = _shortest_path(snap, net.station_index['hanno'], net.station_index['ueno'], 3)
+    assert matrix.seconds[1, 2] == path.cost
+    line_changes = sum(1 for a, b in zip(path.hops, path.hops[1:]) if a[2] != b[2])
+    assert matrix.transfers[1, 2] == line_changes
+
+
+def test_reachable_stations_fronts_answer_smaller_thresholds():
+    """Test that one isochrone search answers any smaller time or transfer limit."""
+    origin, wide = reachable_stations('Shibuya', 60, max_transfers=2)
+    assert origin == 'shibuya' and wide[0].key == 'shibuya'
+    for station in wide:
+        times = [seconds for seconds, _ in station.front]
+        transfers = [t for _, t in station.front]
+        assert times == sorted(times) and transfers == sorted(transfers, reverse=True)
+        assert times[-1] <= 3600 and transfers[0] <= 2
+
+    _, narrow = reachable_stations('Shibuya', 20, max_transfers=0)
+    filtered = {s.key for s in wide if s.seconds_within(0) is not None and s.seconds_within(0) <= 1200}
+    assert {s.key for s in narrow} == filtered
+
+
+def test_search_modes_find_the_same_cost():
+    """Test that A* and bidirectional search are exact and expand fewer labels on a long query."""
+    snap = _snapshot()
+    net = snap.net
+    for origin, destination in [('tokorozawa', 'yokohama'), ('takadanobaba', 'kinshicho'), ('ogawamachi', 'iriso')]:
+        o, d = net.station_index[origin], net.station_index[destination]
+        plain = _shortest_path(snap, o, d, 3)
+        astar = _shortest_path(snap, o, d, 3, potentials=_potentials(snap, d))
+        bidirectional = _bidirectional_path(snap, o, d, 3)
+        assert plain.cost == astar.cost == bidirectional.cost
+        if origin == 'tokorozawa':
+            assert astar.expanded < plain.expanded
+            assert bidirectional.expanded < plain.expanded
+
+
+def test_geo_potentials_are_consistent():
+    """Test that the straight-line bound never drops by more than an edge costs."""
+    snap = _snapshot()
+    net = snap.net
+    potential = _potentials(snap, net.station_index['yokohama'])[0]
+    for station in range(net.num_stations):
+        for e in net.edges(station):
+            assert potential[station] <= net.weights[e] + potential[net.neighbors[e]] + 1e-6
+
+
+def test_routes_between_coordinates_walk_to_nearby_stations():
+    """Test that coordinate routing seeds several stations and adds walking legs."""
+    snap = _snapshot()
+    net = snap.net
+    # A little west of Tokorozawa to a little south of Yokohama
+    stats = {}
+    routes = find_routes_between_coordinates((35.7325, 139.4600), (35.4640, 139.6200), stats=stats)
+    assert routes and stats['expanded'] > 0
+    for route in routes:
+        first, last = route['segments'][0], route['segments'][-1]
+        assert first['type'] == 'walk' and first['from_station'] == 'Origin'
+        assert last['type'] == 'walk' and last['to_station'] == 'Destination'
+        assert any(s['type'] == 'ride' for s in route['segments'])
+
+    # One seeded search is no worse than the best fixed station pair
+    best = sum(s['duration_seconds'] for s in routes[0]['segments'])
+    station = net.station_index['tokorozawa']
+    path = _bidirectional_path(snap, station, net.station_index['yokohama'], 3)
+    assert best <= path.cost + first['duration_seconds'] + last['duration_seconds'] + 60
+
+
+def test_coordinates_far_from_every_station_get_no_route():
+    """Test that a point beyond walking range of the network is an error, not a days-long walk."""
+    with pytest.raises(ValueError, match='origin'):
+        find_routes_between_coordinates((0.0, 0.0), (35.73, 139.71))
+    with pytest.raises(ValueError, match='destination'):
+        find_routes_between_coordinates((35.73, 139.71), (0.0, 0.0))
+
+
+def test_nearby_coordinates_offer_walking():
+    """Test that coordinates within walking range also get a walk-only route."""
+    routes = find_routes_between_coordinates((35.6905, 139.7005), (35.6930, 139.7030))
+    assert any(r['name'] == 'Walk' for r in routes)
+    stations = nearest_stations(35.688462, 139.699019, 3)
+    assert stations[0]['id'] == 'shinjuku' and stations[0]['distance_m'] == 0
+
+
+def test_line_statuses_route_around_suspensions_and_delays():
+    """Test that realtime statuses change routing without rebuilding the network."""
+    snap = _snapshot()
+    net = snap.net
+    try:
+        set_line_statuses(1, {'JR-East.Yamanote': LineStatus(SUSPENDED, 0, '運転を見合わせています。')})
+        routes = find_routes('Shibuya', 'Ueno')
+        assert routes
+        assert all('JR-East.Yamanote' not in s.get('line_ids', []) for r in routes for s in r['segments'])
+        assert _snapshot() is snap
+
+        # A delay is charged once per boarding, the same in every search mode
+        set_line_statuses(2, {'JR-East.Yamanote': LineStatus(DELAYED, 20, '遅れが出ています。')})
+        overlay = _line_overlay(snap)
+        o, d = net.station_index['tokyo'], net.station_index['shinagawa']
+        plain = _shortest_path(snap, o, d, 3)
+        delayed = _shortest_path(snap, o, d, 3, overlay=overlay)
+        assert delayed.cost > plain.cost
+        assert _bidirectional_path(snap, o, d, 3, overlay=overlay).cost == delayed.cost
+        assert _shortest_path(snap, o, d, 3, potentials=_potentials(snap, d), overlay=overlay).cost == delayed.cost
+    finally:
+        set_line_statuses(0, {})
@@ -3,7 +3,7 @@
 Quick test to verify the transfer-aware scoring system works correctly.
 """
 
-from route_finder import find_routes
+from route_finder import find_routes, transfer_index
 from scoring import score_route
 
 def test_shibuya_to_tokorozawa():
@@ -22,7 +22,7 @@ def test_shibuya_to_tokorozawa():
     
     scored_routes = []
     for route in routes:
-        score = score_route(route)
+        score = score_route(route, transfer_index=transfer_index())
         scored_routes.append({
             'name': route.get('name'),
             'score': score,
@@ -69,7 +69,7 @@ def test_transfer_database_lookup():
     from scoring import find_transfer_data, calculate_transfer_time
     
     # Test Ikebukuro transfer (should be complex)
-    ikebukuro = find_transfer_data("Ikebukuro", "TokyoMetro.Fukutoshin", "Seibu.Ikebukuro")
+    ikebukuro = find_transfer_data("Ikebukuro", "TokyoMetro.Fukutoshin", "Seibu.Ikebukuro", transfer_index())
     if ikebukuro:
         time = calculate_transfer_time(ikebukuro)
         print(f"✅ Ikebukuro transfer (Fukutoshin → Seibu): {time/60:.1f} min")
@@ -79,7 +79,7 @@ def test_transfer_database_lookup():
         return False
     
     # Test Nerima transfer (should be easy)
-    nerima = find_transfer_data("Nerima", "TokyoMetro.Fukutoshin", "Seibu.Ikebukuro")
+    nerima = find_transfer_data("Nerima", "TokyoMetro.Fukutoshin", "Seibu.Ikebukuro", transfer_index())
     if nerima:
         time = calculate_transfer_time(nerima)
         print(f"✅ Nerima transfer (Fukutoshin → Seibu): {time/60:.1f} min")
@@ -0,0 +1,70 @@
+"""
+Tests for the station and line join index
+"""
+from network_graph import compile_network
+from station_join import JoinIndex
+from route_finder import _snapshot, next_departures
+
+
+def _station(odpt_id, en, ja, code=None, lat=None, lon=None, connecting=()):
+    record = {'owl:sameAs': odpt_id, 'odpt:railway': odpt_id.rsplit('.', 1)[0].replace('Station', 'Railway'),
+              'odpt:stationTitle': {'en': en, 'ja': ja}, 'odpt:connectingStation': list(connecting)}
+    if code:
+        record['odpt:stationCode'] = code
+    if lat is not None:
+        record['geo:lat'], record['geo:long'] = lat, lon
+    return record
+
+
+def test_join_by_key_and_folded_name():
+    """Test that ODPT stations join network stations by key or folded name, line IDs by railway."""
+    net = compile_network({'lines': {
+        'TokyoMetro.Ginza': {'name': 'Ginza Line', 'stations': ['Shibuya', 'Omotesando', 'Gaiemmae']},
+        'Tokyu.Toyoko': {'name': 'Toyoko Line', 'name_ja': '東横線', 'stations': ['Shibuya', 'Daikan-yama']},
+    }})
+    stations = [
+        _station('odpt.Station:TokyoMetro.Ginza.Shibuya', 'Shibuya', '渋谷', 'G01', 35.659, 139.702,
+                 connecting=['odpt.Station:Tokyu.Toyoko.Shibuya', 'odpt.Station:TokyoMetro.Ginza.OmoteSando']),
+        _station('odpt.Station:Tokyu.Toyoko.Shibuya', 'Shibuya', '渋谷', 'TY01'),
+        _station('odpt.Station:TokyoMetro.Ginza.OmoteSando', 'Omote-sando', '表参道', 'G02'),
+        _station('odpt.Station:TokyoMetro.Ginza.Ueno', 'Ueno', '上野', 'G16'),
+    ]
+    railways = [{'owl:sameAs': 'odpt.Railway:TokyoMetro.Ginza', 'odpt:railwayTitle': {'ja': '銀座線'}}]
+    join = JoinIndex(net, stations, railways)
+
+    shibuya = net.station_index['shibuya']
+    omotesando = net.station_index['omotesando']
+    assert join.odpt_ids[shibuya] == ('odpt.Station:TokyoMetro.Ginza.Shibuya', 'odpt.Station:Tokyu.Toyoko.Shibuya')
+    assert join.codes[shibuya] == ('G01', 'TY01')
+    assert join.names_ja[omotesando] == '表参道'
+    assert join.station_key('odpt.Station:TokyoMetro.Ginza.OmoteSando') == 'omotesando'
+    assert join.surveyed_coordinates[shibuya] == (35.659, 139.702)
+    assert join.surveyed_coordinates[omotesando] is None
+    assert join.names_ja[net.station_index['gaiemmae']] == ''
+
+    # Stations outside the network still have a key, but no station ID
+    assert join.station_key('odpt.Station:TokyoMetro.Ginza.Ueno') == 'ueno'
+    assert 'odpt.Station:TokyoMetro.Ginza.Ueno' not in join.station_by_odpt
+    # Connections between platforms of one station are not footpaths
+    assert join.connections == ((shibuya, omotesando),)
+
+    ginza = net.line_index['TokyoMetro.Ginza']
+    toyoko = net.line_index['Tokyu.Toyoko']
+    assert join.railway_ids[ginza] == 'odpt.Railway:TokyoMetro.Ginza'
+    assert join.railway_ids[toyoko] == 'odpt.Railway:Tokyu.Toyoko'
+    assert join.line_names_ja == tuple('銀座線' if i == ginza else '東横線' for i in range(2))
+    assert join.line('odpt.TrainInformation:Tokyu.Toyoko') == toyoko
+    assert join.line('odpt.Railway:JR-East.Yamanote') is None
+
+
+def test_snapshot_join_feeds_lookups():
+    """Test that the loaded snapshot's join index backs station names and departures."""
+    snap = _snapshot()
+    sid = snap.net.station_index['shibuya']
+    assert 'odpt.Station:TokyoMetro.Ginza.Shibuya' in snap.join.odpt_ids[sid]
+    assert snap.join.names_ja[sid] == '渋谷'
+    assert snap.join.station_key('odpt.Station:TokyoMetro.Ginza.Shibuya') == 'shibuya'
+
+    departures = next_departures('Tokyo', time='08:00', limit=3)
+    assert departures
+    assert all(d['station'] in snap.join.odpt_ids[snap.net.station_index['tokyo']] for d in departures)
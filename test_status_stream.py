@@ -0,0 +1,81 @@
+"""
+Tests for the line status event stream
+"""
+import asyncio
+import json
+
+from line_status import DELAYED, NORMAL, SUSPENDED, LineStatus
+from status_stream import DIFF, SNAPSHOT, StatusBroadcaster, event_stream, parse_lines
+
+OK = LineStatus(NORMAL, 0, '平常どおり運転しています。')
+LATE = LineStatus(DELAYED, 15, '15分程度の遅れが発生しています。')
+STOPPED = LineStatus(SUSPENDED, 0, '運転を見合わせています。')
+
+
+def test_subscribers_get_filtered_diffs():
+    """Test that a subscriber gets a snapshot of its lines, then only their changes."""
+    async def scenario():
+        stream = StatusBroadcaster()
+        stream.publish(1, {'TokyoMetro.Ginza': OK, 'JR-East.Yamanote': OK})
+        events = stream.subscribe(frozenset({'TokyoMetro.Ginza'}))
+        assert await events.__anext__() == (SNAPSHOT, 1, {'TokyoMetro.Ginza': OK})
+        assert stream.subscribers == 1
+
+        # Yamanote is not subscribed: this change is skipped entirely
+        stream.publish(2, {'TokyoMetro.Ginza': OK, 'JR-East.Yamanote': LATE})
+        stream.publish(3, {'TokyoMetro.Ginza': LATE, 'JR-East.Yamanote': LATE})
+        assert await events.__anext__() == (DIFF, 3, {'TokyoMetro.Ginza': LATE})
+
+        stream.publish(4, {'JR-East.Yamanote': OK})
+        assert await events.__anext__() == (DIFF, 4, {'TokyoMetro.Ginza': None})
+        await events.aclose()
+        assert stream.subscribers == 0
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscribers_get_merged_changes_or_a_snapshot():
+    """Test that a lagging subscriber gets one merged diff, or a snapshot once history is gone."""
+    async def scenario():
+        stream = StatusBroadcaster(history_size=2)
+        stream.publish(1, {'TokyoMetro.Ginza': OK, 'JR-East.Yamanote': OK})
+        stream.publish(2, {'TokyoMetro.Ginza': LATE, 'JR-East.Yamanote': OK})
+        stream.publish(3, {'TokyoMetro.Ginza': STOPPED, 'JR-East.Yamanote': LATE})
+        assert stream.changes_since(1) == {'TokyoMetro.Ginza': STOPPED, 'JR-East.Yamanote': LATE}
+
+        stream.publish(4, {'TokyoMetro.Ginza': STOPPED, 'JR-East.Yamanote': OK})
+        assert stream.changes_since(2) == {'TokyoMetro.Ginza': STOPPED, 'JR-East.Yamanote': OK}
+        assert stream.changes_since(1) is None
+
+        # Resuming from a version still in the history sends only what changed since
+        resumed = stream.subscribe(None, last_version=3)
+        assert await resumed.__anext__() == (DIFF, 4, {'JR-East.Yamanote': OK})
+        await resumed.aclose()
+
+        too_old = stream.subscribe(None, last_version=1)
+        assert await too_old.__anext__() == (SNAPSHOT, 4, stream.statuses)
+        await too_old.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_event_stream_format():
+    """Test the text/event-stream encoding and the lines parameter."""
+    assert parse_lines(None) is None
+    assert parse_lines('TokyoMetro.Ginza, JR-East.Yamanote,') == frozenset({'TokyoMetro.Ginza', 'JR-East.Yamanote'})
+
+    async def scenario():
+        stream = StatusBroadcaster()
+        stream.publish(7, {'TokyoMetro.Ginza': LATE})
+        body = event_stream(stream, parse_lines('TokyoMetro.Ginza'), last_event_id='garbage')
+        assert (await body.__anext__()).startswith('retry: ')
+        event = await body.__anext__()
+        await body.aclose()
+        return event
+
+    event = asyncio.run(scenario())
+    lines = event.rstrip('\n').split('\n')
+    assert lines[:2] == ['id: 7', 'event: snapshot']
+    data = json.loads(lines[2][len('data: '):])
+    assert data == {'version': 7, 'lines': {'TokyoMetro.Ginza': {'state': DELAYED, 'delay_minutes': 15,
+                                                                 'text': LATE.text}}}
@@ -0,0 +1,133 @@
+"""
+Tests for timetable parsing and the RAPTOR timetable engine
+"""
+import pytest
+
+from raptor import build_timetable_network, earliest_arrival, earliest_arrivals, latest_departure
+from timetable import build_timetable_store, calendar_for_date, format_clock, parse_clock
+
+
+def _timetable(station, railway, calendar, departures):
+    return {
+        'odpt:station': f'odpt.Station:{station}',
+        'odpt:railway': f'odpt.Railway:{railway}',
+        'odpt:railDirection': f'odpt.RailDirection:{railway}.Outbound',
+        'odpt:calendar': f'odpt.Calendar:{calendar}',
+        'odpt:stationTimetableObject': [
+            {'odpt:train': f'odpt.Train:{train}', 'odpt:departureTime': clock,
+             'odpt:trainType': 'odpt.TrainType:Local', 'odpt:destinationStation': [f'odpt.Station:{railway}.End']}
+            for train, clock in departures
+        ],
+    }
+
+
+# Line A runs X -> Y -> Z, line B runs Y -> W. Weekday only, plus one
+# SaturdayHoliday train on line A.
+TIMETABLES = [
+    _timetable('A.X', 'A', 'Weekday', [('a1', '08:00'), ('a2', '08:10')]),
+    _timetable('A.Y', 'A', 'Weekday', [('a1', '08:05'), ('a2', '08:15')]),
+    _timetable('A.Z', 'A', 'Weekday', [('a1', '08:09'), ('a2', '08:19')]),
+    _timetable('B.Y', 'B', 'Weekday', [('b1', '08:06'), ('b2', '08:12'), ('b3', '08:30')]),
+    _timetable('B.W', 'B', 'Weekday', [('b1', '08:16'), ('b2', '08:22'), ('b3', '08:40')]),
+    _timetable('A.X', 'A', 'SaturdayHoliday', [('s1', '09:00')]),
+    _timetable('A.Y', 'A', 'SaturdayHoliday', [('s1', '09:05')]),
+]
+STORE = build_timetable_store(TIMETABLES)
+
+
+def _stop(odpt_id):
+    return odpt_id.split('.')[-1].lower()
+
+
+def test_parse_clock_keeps_after_midnight_trains_in_service_day():
+    """Test that 00:13 sorts after 23:50 on the same service day."""
+    assert parse_clock('00:13') > parse_clock('23:50')
+    assert format_clock(parse_clock('00:13')) == '00:13'
+    assert parse_clock('08:00:30') == parse_clock('08:00')
+    for bad in ['8', '8am', 'ab:cd', '08:60', '', '1:2:3:4']:
+        with pytest.raises(ValueError, match='expected HH:MM'):
+            parse_clock(bad)
+
+
+def test_calendar_for_date():
+    """Test weekday and weekend calendar selection."""
+    assert calendar_for_date('2025-01-06') == 'Weekday'
+    assert calendar_for_date('2025-01-11') == 'SaturdayHoliday'
+    with pytest.raises(ValueError, match='expected YYYY-MM-DD'):
+        calendar_for_date('2025-13-01')
+
+
+def test_earliest_arrival_waits_for_connection():
+    """Test a departure-after query with a transfer that respects change time."""
+    network = build_timetable_network(STORE, 'Weekday', _stop)
+    journeys = earliest_arrival(network, 'x', 'w', parse_clock('07:55'))
+
+    best = journeys[-1]
+    assert [leg.line for leg in best.legs] == ['A', 'B']
+    # a1 reaches Y at 08:05; b1 (08:06) is inside the change time, so b2 at 08:12
+    assert best.legs[1].train == 'odpt.Train:b2'
+    assert format_clock(best.arrival) == '08:22'
+
+
+def test_latest_departure_for_arrive_by():
+    """Test an arrive-by query leaves as late as possible."""
+    network = build_timetable_network(STORE, 'Weekday', _stop)
+    journeys = latest_departure(network, 'x', 'w', parse_clock('08:45'))
+
+    best = max(journeys, key=lambda j: j.departure)
+    assert format_clock(best.departure) == '08:10'
+    assert format_clock(best.arrival) == '08:40'
+
+
+def test_calendar_selects_timetable():
+    """Test that the SaturdayHoliday network only contains weekend trains."""
+    network = build_timetable_network(STORE, 'SaturdayHoliday', _stop)
+    journeys = earliest_arrival(network, 'x', 'y', parse_clock('08:00'))
+    assert format_clock(journeys[-1].departure) == '09:00'
+    assert earliest_arrival(network, 'x', 'w', parse_clock('08:00')) == []
+
+
+def test_string_codes_beyond_16_bits():
+    """Test that a store with more than 65536 distinct strings still loads."""
+    many = 70000
+    store = build_timetable_store([{
+        'odpt:station': 'odpt.Station:A.X', 'odpt:railway': 'odpt.Railway:A',
+        'odpt:railDirection': 'odpt.RailDirection:A.Outbound', 'odpt:calendar': 'odpt.Calendar:Weekday',
+        'odpt:stationTimetableObject': [
+            {'odpt:train': f'odpt.Train:A.{i}', 'odpt:departureTime': '08:00',
+             'odpt:destinationStation': [f'odpt.Station:A.D{i}']}
+            for i in range(many)
+        ],
+    }])
+    departures = store.next_departures('odpt.Station:A.X', 'Weekday', parse_clock('08:00'), limit=many)
+    assert {d.destination for d in departures} == {f'odpt.Station:A.D{i}' for i in range(many)}
+
+
+def test_next_departures_binary_search():
+    """Test next-N departure queries, including after-midnight service."""
+    store = build_timetable_store([
+        _timetable('B.Y', 'B', 'Weekday', [('late', '00:13'), ('b2', '08:12'), ('b1', '08:06'), ('b3', '08:30')]),
+    ])
+    departures = store.next_departures('odpt.Station:B.Y', 'Weekday', parse_clock('08:07'), limit=2)
+    assert [d.departure_time for d in departures] == ['08:12', '08:30']
+    assert departures[0].train_type == 'Local'
+    assert departures[0].destination == 'odpt.Station:B.End'
+
+    departures = store.next_departures('odpt.Station:B.Y', 'Weekday', parse_clock('23:00'))
+    assert [d.train for d in departures] == ['odpt.Train:late']
+
+
+def test_departure_columns_are_compact():
+    """Test that departures are stored in typed arrays rather than dicts."""
+    table = STORE.tables[('odpt.Station:B.Y', 'B.Outbound', 'Weekday')]
+    assert table.minutes.itemsize == 2
+    assert list(table.minutes) == sorted(table.minutes)
+
+
+def test_earliest_arrivals_one_to_all():
+    """Test that the one-to-all search reaches every stop with its trip count."""
+    network = build_timetable_network(STORE, 'Weekday', _stop)
+    reached = earliest_arrivals(network, 'x', parse_clock('07:55'))
+    assert {stop: (format_clock(t), trips) for stop, (t, trips) in reached.items()} == {
+        'y': ('08:05', 1), 'z': ('08:09', 1), 'w': ('08:22', 2),
+    }
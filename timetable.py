@@ -0,0 +1,276 @@
+"""
+ODPT station timetable helpers: loading, service-day times and calendars.
+
+Times are counted in seconds from midnight at the start of the service day.
+Trains that leave after midnight (00:13, 01:05) still belong to the previous
+service day, so any clock time before SERVICE_DAY_START is pushed past 24:00.
+
+Loaded timetables are kept in a columnar TimetableStore: one set of sorted
+parallel integer arrays per (station, direction, calendar) instead of a dict
+per departure.
+"""
+
+import datetime as dt
+import json
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+SERVICE_DAY_START = 3 * 3600  # 03:00
+
+CALENDAR_WEEKDAY = "Weekday"
+CALENDAR_SATURDAY_HOLIDAY = "SaturdayHoliday"
+
+# Timetable files: JSON arrays, and newline-delimited JSON from scripts/fetch_odpt.py
+TIMETABLE_GLOBS = ("station_timetables*.json", "station_timetables*.ndjson")
+
+
+def parse_clock(hhmm: str) -> int:
+    """
+    Convert an 'HH:MM' (or 'HH:MM:SS') clock time into seconds since the
+    service-day start. Raises ValueError for anything else.
+    """
+    parts = hhmm.split(":")
+    if (len(parts) not in (2, 3) or not all(part.isascii() and part.isdigit() for part in parts)
+            or int(parts[1]) >= 60):
+        raise ValueError(f"Invalid time {hhmm!r}: expected HH:MM")
+    seconds = int(parts[0]) * 3600 + int(parts[1]) * 60
+    if seconds < SERVICE_DAY_START:
+        seconds += 24 * 3600
+    return seconds
+
+
+def format_clock(seconds: int) -> str:
+    """Convert service-day seconds back to an 'HH:MM' clock time."""
+    minutes = (seconds // 60) % (24 * 60)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def calendar_for_date(date: Optional[str] = None) -> str:
+    """
+    Pick the ODPT calendar for an ISO date (today if not given).
+
+    Saturdays and Sundays use the SaturdayHoliday timetable; national
+    holidays are not modelled yet and fall back to Weekday. Raises
+    ValueError for a malformed date.
+    """
+    try:
+        day = dt.date.fromisoformat(date) if date else dt.date.today()
+    except ValueError:
+        raise ValueError(f"Invalid date {date!r}: expected YYYY-MM-DD") from None
+    return CALENDAR_SATURDAY_HOLIDAY if day.weekday() >= 5 else CALENDAR_WEEKDAY
+
+
+def odpt_suffix(odpt_id: str) -> str:
+    """Strip the 'odpt.Type:' prefix from an ODPT identifier."""
+    return odpt_id.split(":", 1)[-1]
+
+
+class StringTable:
+    """Interns strings to small integer codes."""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.strings)
+            self._codes[value] = code
+            self.strings.append(value)
+        return code
+
+    def __getitem__(self, code: int) -> str:
+        return self.strings[code]
+
+
+class DepartureTable:
+    """
+    Departures of one (station, direction, calendar), sorted by time.
+
+    minutes[i] is minutes since the service-day midnight; trains holds a
+    train ID code and train_types/destinations hold string-table codes for
+    departure i.
+    """
+
+    def __init__(self, railway: str):
+        self.railway = railway
+        self.minutes = array("H")
+        self.trains = array("I")
+        # Codes into the store's shared string table, which outgrows 16 bits
+        # on the full ODPT feed
+        self.train_types = array("I")
+        self.destinations = array("I")
+
+    @classmethod
+    def from_arrays(cls, railway: str, minutes: Sequence[int], trains: Sequence[int], train_types: Sequence[int],
+                    destinations: Sequence[int]) -> "DepartureTable":
+        """A table over already sorted columns (e.g. views of a memory-mapped bundle)."""
+        table = cls(railway)
+        table.minutes = minutes
+        table.trains = trains
+        table.train_types = train_types
+        table.destinations = destinations
+        return table
+
+    def __len__(self) -> int:
+        return len(self.minutes)
+
+    def _sort(self):
+        order = sorted(range(len(self.minutes)), key=self.minutes.__getitem__)
+        for name in ("minutes", "trains", "train_types", "destinations"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, (column[i] for i in order)))
+
+    def after(self, minute: int) -> int:
+        """Index of the first departure at or after minute."""
+        return bisect_left(self.minutes, minute)
+
+
+class Departure(NamedTuple):
+    station: str
+    railway: str
+    direction: str
+    calendar: str
+    departure_time: str
+    train: str
+    train_type: str
+    destination: str
+
+
+class TimetableStore:
+    """Columnar station timetables keyed by (station, direction, calendar)."""
+
+    def __init__(self):
+        self.train_ids = StringTable()
+        self.strings = StringTable()
+        self.tables: Dict[Tuple[str, str, str], DepartureTable] = {}
+
+    def add(self, timetable: Dict):
+        """Add one odpt:StationTimetable record."""
+        key = (
+            timetable.get("odpt:station", ""),
+            odpt_suffix(timetable.get("odpt:railDirection", "")),
+            odpt_suffix(timetable.get("odpt:calendar", "")),
+        )
+        table = self.tables.get(key)
+        if table is None:
+            table = self.tables[key] = DepartureTable(odpt_suffix(timetable.get("odpt:railway", "")))
+
+        for departure in timetable.get("odpt:stationTimetableObject", []):
+            clock = departure.get("odpt:departureTime")
+            train = departure.get("odpt:train")
+            if not clock or not train:
+                continue
+            destinations = departure.get("odpt:destinationStation") or [""]
+            table.minutes.append(parse_clock(clock) // 60)
+            table.trains.append(self.train_ids.code(train))
+            table.train_types.append(self.strings.code(odpt_suffix(departure.get("odpt:trainType", ""))))
+            table.destinations.append(self.strings.code(destinations[0]))
+
+    def finalize(self) -> "TimetableStore":
+        """Sort every table by departure time; call once after all add()s."""
+        for table in self.tables.values():
+            table._sort()
+        return self
+
+    def __bool__(self) -> bool:
+        return bool(self.tables)
+
+    def stations(self) -> Iterable[str]:
+        return {station for station, _direction, _calendar in self.tables}
+
+    def tables_for(self, calendar: str, station: Optional[str] = None,
+                   direction: Optional[str] = None) -> Iterator[Tuple[Tuple[str, str, str], DepartureTable]]:
+        """Tables of a calendar, optionally limited to a station and direction."""
+        for key, table in self.tables.items():
+            if key[2] != calendar or (station and key[0] != station):
+                continue
+            if direction and not _direction_matches(key[1], direction):
+                continue
+            yield key, table
+
+    def next_departures(self, station: str, calendar: str, after: int, limit: int = 5,
+                        direction: Optional[str] = None) -> List[Departure]:
+        """
+        The next departures from station at or after `after` (service-day
+        seconds), merged across directions unless one is given.
+        """
+        minute = (after + 59) // 60
+        candidates = []
+        for key, table in self.tables_for(calendar, station, direction):
+            start = table.after(minute)
+            for i in range(start, min(start + limit, len(table))):
+                candidates.append((table.minutes[i], key, table, i))
+
+        candidates.sort(key=lambda c: c[0])
+        return [self._departure(key, table, i) for _m, key, table, i in candidates[:limit]]
+
+    def _departure(self, key: Tuple[str, str, str], table: DepartureTable, i: int) -> Departure:
+        station, direction, calendar = key
+        return Departure(
+            station=station,
+            railway=table.railway,
+            direction=direction,
+            calendar=calendar,
+            departure_time=format_clock(table.minutes[i] * 60),
+            train=self.train_ids[table.trains[i]],
+            train_type=self.strings[table.train_types[i]],
+            destination=self.strings[table.destinations[i]],
+        )
+
+
+def _direction_matches(direction: str, query: str) -> bool:
+    """Match 'TokyoMetro.Ikebukuro' by its full suffix or its last part."""
+    query = odpt_suffix(query).lower()
+    return direction.lower() == query or direction.split(".")[-1].lower() == query
+
+
+def build_timetable_store(timetables: Iterable[Dict]) -> TimetableStore:
+    """Build a TimetableStore from odpt:StationTimetable records."""
+    store = TimetableStore()
+    for timetable in timetables:
+        store.add(timetable)
+    return store.finalize()
+
+
+def timetable_files(data_dir: Path) -> List[Path]:
+    """The odpt:StationTimetable files in the data directory, in load order."""
+    return sorted(path for pattern in TIMETABLE_GLOBS for path in data_dir.glob(pattern))
+
+
+def timetable_sources(data_dir: Path) -> List[Tuple[str, float]]:
+    """(file name, mtime) of every timetable file, to tell when they change."""
+    return [(path.name, path.stat().st_mtime) for path in timetable_files(data_dir)]
+
+
+def _read_timetables(path: Path) -> Iterator[Dict]:
+    if path.suffix == ".ndjson":
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        yield from json.loads(path.read_text(encoding="utf-8"))
+
+
+def load_timetable_store(data_dir: Path = Path("data")) -> TimetableStore:
+    """
+    Load every odpt:StationTimetable file in the data directory. Files are
+    parsed one at a time (NDJSON files one record at a time), so only the
+    compact store outlives each file. A timetable found in several files is
+    loaded from the first.
+    """
+    store = TimetableStore()
+    loaded = set()
+    for path in timetable_files(data_dir):
+        for timetable in _read_timetables(path):
+            timetable_id = timetable.get("owl:sameAs")
+            if timetable_id:
+                if timetable_id in loaded:
+                    continue
+                loaded.add(timetable_id)
+            store.add(timetable)
+    return store.finalize()